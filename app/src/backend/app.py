@@ -1,8 +1,20 @@
-from flask import Flask, request, jsonify
+import time
+# Reference point for the startup-time budget
+STARTED_AT = time.perf_counter()
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context, url_for
 from flask_cors import CORS
+from duplicates import DUPLICATE_RADIUS
 from indexer import FileIndexer
-from PIL import Image
-import atexit, base64, fitz, io, logging, mimetypes, os, signal, sys
+import embedding
+from jobs import FINISHED_STATES, PAUSED, QUEUED, RUNNING, JobScheduler
+import metrics
+from metrics import timed
+from search_filters import ResultPages, parse_filters
+from thumbnails import ThumbnailCache, file_icon, has_thumbnail
+from watcher import FileWatcher
+import atexit, json, logging, mimetypes, os, signal, sys, threading
 
 app = Flask(__name__)
 CORS(app)
@@ -13,15 +25,96 @@ logger = logging.getLogger(__name__)
 
 # Initialize ChromaDB client and collection
 current_dir = os.path.dirname(os.path.abspath(__file__))
-chroma_db_path = os.path.join(current_dir, '..', '..', '..', 'chroma_db')
+chroma_db_path = os.environ.get('FILESEEKR_DB_PATH') or os.path.join(current_dir, '..', '..', '..', 'chroma_db')
 os.makedirs(chroma_db_path, exist_ok=True)
 
-# Initialize the indexer
-indexer = FileIndexer(chroma_db_path)
+# Initialize the indexer. The index keeps the model it was built with (FILESEEKR_MODEL
+# picks it for a new index); FILESEEKR_RERANK_MODEL adds a larger model re-ranking results.
+# FILESEEKR_SKIP_DUPLICATES=1 reuses embeddings for visually identical images.
+# FILESEEKR_VECTOR_ENGINE=mmap stores a new index's vectors in a memory-mapped float16
+# matrix instead of Chroma, and FILESEEKR_IVF_LISTS=N gives that matrix an IVF index.
+# FILESEEKR_SHARDS=root|hash:N shards a new index; FILESEEKR_SHARD_WORKERS=1 serves
+# every shard from its own process. FILESEEKR_IO_WORKERS sets the threads hashing files and
+# checking the embedding cache, FILESEEKR_DECODE_WORKERS the processes decoding them (0
+# decodes in the hashing threads); both default to one per core but one.
+def optional_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+indexer = FileIndexer(chroma_db_path, rerank_model=os.environ.get('FILESEEKR_RERANK_MODEL'),
+                      io_workers=optional_int('FILESEEKR_IO_WORKERS'),
+                      decode_workers=optional_int('FILESEEKR_DECODE_WORKERS'),
+                      skip_duplicates=os.environ.get('FILESEEKR_SKIP_DUPLICATES') == '1',
+                      vector_engine=os.environ.get('FILESEEKR_VECTOR_ENGINE') or None,
+                      ivf_lists=int(os.environ.get('FILESEEKR_IVF_LISTS', '0')),
+                      shards=os.environ.get('FILESEEKR_SHARDS') or None,
+                      shard_workers=os.environ.get('FILESEEKR_SHARD_WORKERS') == '1')
+
+# Keep the index current as files change on disk. Set FILESEEKR_POLL_WATCHER=1
+# to use the polling fallback instead of native filesystem events. The configured
+# roots are saved, so they are watched again from startup after a restart.
+watcher = FileWatcher(indexer, use_polling=os.environ.get('FILESEEKR_POLL_WATCHER') == '1',
+                      state_path=os.path.join(chroma_db_path, 'watched_roots.json'))
+watcher.restore()
+
+# Long-running indexing runs as background jobs so requests return immediately
+jobs = JobScheduler(indexer)
+
+# Pick up files left pending by an interrupted run
+if indexer.work_queue.counts()['pending']:
+    jobs.submit('resume', [])
+
+# Seconds from process start to the first answered search before a warning is logged
+STARTUP_BUDGET_SECONDS = float(os.environ.get('FILESEEKR_STARTUP_BUDGET', '30'))
+startup_timings = {'serverReadySeconds': None, 'firstSearchSeconds': None}
+
+def record_first_search():
+    if startup_timings['firstSearchSeconds'] is not None:
+        return
+    elapsed = round(time.perf_counter() - STARTED_AT, 2)
+    startup_timings['firstSearchSeconds'] = elapsed
+    if elapsed > STARTUP_BUDGET_SECONDS:
+        logger.warning(f"Time to first search {elapsed}s exceeds the {STARTUP_BUDGET_SECONDS}s startup budget")
+    else:
+        logger.info(f"Time to first search: {elapsed}s")
+
+# Request latency per endpoint, and gauges read from live state on every scrape
+REQUEST_SECONDS = metrics.histogram('fileseekr_http_request_seconds', 'HTTP request latency',
+                                    labels=('endpoint', 'method', 'status'))
+metrics.gauge('fileseekr_indexed_files', 'Files in the index', lambda: len(indexer.indexed_paths))
+metrics.gauge('fileseekr_work_queue_files', 'Files in the durable work queue by state',
+              lambda: {(state,): count for state, count in indexer.work_queue.counts().items()}, labels=('state',))
+metrics.gauge('fileseekr_jobs', 'Indexing jobs by state', lambda: {
+    (state,): sum(1 for job in jobs.list() if job.status == state) for state in (QUEUED, RUNNING, PAUSED)
+}, labels=('state',))
+metrics.gauge('fileseekr_watcher_backlog_events', 'Filesystem events waiting to be applied', lambda: watcher.backlog)
+metrics.gauge('fileseekr_cache_hit_ratio', 'Hit rate of each cache since startup', lambda: {
+    ('embedding',): indexer.embedding_cache.stats()['hitRate'],
+    ('query',): indexer.query_cache.stats()['hitRate'],
+    ('thumbnail',): indexer.thumbnail_cache.stats()['hitRate']
+}, labels=('cache',))
+metrics.gauge('fileseekr_query_batch_size_mean', 'Mean number of queries per text model call',
+              lambda: indexer.query_batcher.stats()['meanBatchSize'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started_at = g.pop('request_started_at', None)
+    if started_at is not None:
+        # The route pattern, not the URL, so label values stay bounded
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started_at, endpoint=endpoint,
+                                method=request.method, status=str(response.status_code))
+    return response
 
 def cleanup():
     try:
         logger.info("Cleaning up Flask server...")
+        watcher.stop()
+        jobs.shutdown()
         sys.exit(0)
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
@@ -30,55 +123,40 @@ def cleanup():
 atexit.register(cleanup)
 signal.signal(signal.SIGINT, lambda s, f: cleanup())
 
-def get_thumbnail(file_path, max_size=(100, 100)):
-    try:
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-            with Image.open(file_path) as img:
-                img.thumbnail(max_size)
-                buffer = io.BytesIO()
-                img.save(buffer, format='PNG')
-                encoded = base64.b64encode(buffer.getvalue()).decode()
-                return f"data:image/png;base64,{encoded}"
-        elif ext == '.pdf':
-            try:
-                doc = fitz.open(file_path)
-                if doc.page_count > 0:
-                    page = doc[0]
-                    pix = page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5))
-                    img_data = pix.tobytes()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], img_data)
-                    img.thumbnail(max_size)
-                    buffer = io.BytesIO()
-                    img.save(buffer, format='PNG')
-                    encoded = base64.b64encode(buffer.getvalue()).decode()
-                    return f"data:image/png;base64,{encoded}"
-            except Exception as e:
-                print(f"PDF thumbnail generation error: {e}")
-                return "pdf-file-icon"
-        else:
-            # Return file type icon based on extension
-            if ext in ['.txt', '.md']:
-                return "text-file-icon"
-            elif ext in ['.py', '.js', '.html', '.css']:
-                return "code-file-icon"
-            elif ext == '.pdf':
-                return "pdf-file-icon"
-            else:
-                return "generic-file-icon"
+def get_thumbnail(file_path, stat):
+    """
+    Thumbnail reference for a search result: a versioned URL of the cached
+    thumbnail endpoint for images and PDFs, or a file type icon otherwise.
+    """
+    if not has_thumbnail(file_path):
+        return file_icon(file_path)
+    return url_for('thumbnail', path=file_path, v=ThumbnailCache.key(file_path, stat), _external=True)
+
+@app.route('/thumbnail', methods=['GET'])
+def thumbnail():
+    file_path = request.args.get('path', '')
+    # Only serve thumbnails of indexed files
+    if file_path not in indexer.indexed_paths:
+        return jsonify({'error': 'File not indexed'}), 404
+
+    try:
+        cache_path = indexer.thumbnail_cache.get_or_create(file_path)
     except Exception as e:
         print(f"Error generating thumbnail: {e}")
-        return None
+        cache_path = None
+    if cache_path is None:
+        return jsonify({'error': 'No thumbnail available', 'icon': file_icon(file_path)}), 404
 
-@app.route('/api/settings/paths', methods=['POST'])
-def update_paths():
-    data = request.json
-    paths = data.get('paths', [])
-    file_types = data.get('fileTypes', {})
-    
+    # URLs carry the file version, so the thumbnail behind one never changes
+    response = send_file(cache_path, mimetype='image/png', max_age=365 * 24 * 3600)
+    response.cache_control.immutable = True
+    return response
+
+def expand_paths(paths):
     # Expand user paths and ensure trailing slash
-    expanded_paths = [os.path.join(os.path.expanduser(path), '') for path in paths]
-    
+    return [os.path.join(os.path.expanduser(path), '') for path in paths]
+
+def extensions_for_file_types(file_types):
     # Convert file types to extensions
     extensions = []
     if file_types.get('documents'):
@@ -87,14 +165,155 @@ def update_paths():
         extensions.extend(['.jpg', '.jpeg', '.png'])
     if file_types.get('pdfs'):
         extensions.extend(['.pdf'])
+    return extensions
+
+@app.route('/api/settings/paths', methods=['POST'])
+def update_paths():
+    data = request.json
+    expanded_paths = expand_paths(data.get('paths', []))
+    extensions = extensions_for_file_types(data.get('fileTypes', {}))
 
     try:
-        # Index new paths (existing files will be skipped)
-        indexer.index_directories(expanded_paths, extensions)
-        return jsonify({'success': True, 'message': 'Paths indexed successfully'})
+        # Index new paths in the background (existing files will be skipped)
+        job = jobs.submit('index', expanded_paths, extensions)
+        # Pick up later changes under these paths without a rescan
+        watcher.watch(expanded_paths, extensions)
+        return jsonify({'success': True, 'message': 'Indexing started', 'job': job.to_dict()}), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    data = request.json or {}
+    expanded_paths = expand_paths(data.get('paths', []))
+    if 'fileTypes' in data:
+        extensions = extensions_for_file_types(data['fileTypes'])
+    else:
+        extensions = data.get('extensions')
+
+    try:
+        job = jobs.submit(data.get('type', 'index'), expanded_paths, extensions)
+        return jsonify({'success': True, 'job': job.to_dict()}), 202
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': [job.to_dict() for job in jobs.list()]})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    def generate():
+        # Server-sent events: one snapshot per change, at most once a second while idle
+        while True:
+            snapshot = job.to_dict()
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot['status'] in FINISHED_STATES:
+                return
+            job.wait_for_change(timeout=1.0)
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/jobs/<job_id>/<action>', methods=['POST'])
+def control_job(job_id, action):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if action not in ('pause', 'resume', 'cancel'):
+        return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 400
+
+    success = getattr(job, action)()
+    return jsonify({'success': success, 'job': job.to_dict()})
+
+@app.route('/api/index/status', methods=['GET'])
+def index_status():
+    return jsonify({
+        'indexed': len(indexer.indexed_paths),
+        'queue': indexer.work_queue.counts(),
+        'failures': indexer.work_queue.failures(),
+        'embeddingCache': indexer.embedding_cache.stats(),
+        'queryCache': indexer.query_cache.stats(),
+        'queryBatcher': indexer.query_batcher.stats()
+    })
+
+@app.route('/api/shards', methods=['GET'])
+def list_shards():
+    try:
+        return jsonify({'shards': indexer.list_shards()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/shards', methods=['POST'])
+def add_shard():
+    """Give a root directory its own shard: {"root": "..."}"""
+    root = (request.json or {}).get('root')
+    if not root:
+        return jsonify({'success': False, 'error': 'root is required'}), 400
+    try:
+        return jsonify({'success': True, 'name': indexer.add_shard(root)}), 201
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/shards/<name>', methods=['DELETE'])
+def drop_shard(name):
+    try:
+        return jsonify({'success': True, 'removed': indexer.drop_shard(name)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/shards/<name>/reindex', methods=['POST'])
+def reindex_shard(name):
+    """Rebuild one shard in the background; the others keep serving searches"""
+    try:
+        if not any(shard['name'] == name for shard in indexer.list_shards()):
+            return jsonify({'success': False, 'error': f'Unknown shard: {name}'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    job = jobs.submit('reindex_shard', [name])
+    return jsonify({'success': True, 'job': job.to_dict()}), 202
+
+@app.route('/api/settings/reconcile', methods=['POST'])
+def reconcile_paths():
+    data = request.json or {}
+    paths = data.get('paths', [])
+    extensions = data.get('extensions')
+
+    expanded_paths = expand_paths(paths)
+
+    try:
+        # Re-embed modified files, re-key moved ones and drop deleted ones, in the background;
+        # the job's result holds the counts
+        job = jobs.submit('reconcile', expanded_paths, extensions)
+        return jsonify({'success': True, 'message': 'Reconcile started', 'job': job.to_dict()}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    status = indexer.model.load_status()
+    is_ready = indexer.model.is_ready()
+    return jsonify({
+        'ready': is_ready,
+        'model': status,
+        'rerankModel': indexer.rerank_model.load_status() if indexer.rerank_model else None,
+        'startup': {**startup_timings, 'budgetSeconds': STARTUP_BUDGET_SECONDS}
+    }), 200 if is_ready else 503
+
 @app.route('/')
 def home():
     return "FileSeekr API is running!"
@@ -114,6 +333,165 @@ def open_file_endpoint():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Result files are stat'ed here, concurrently, so one slow file (say on a network
+# mount) holds up neither the other results nor the response past RESULT_TIMEOUT
+RESULT_IO_WORKERS = 16
+RESULT_IO = ThreadPoolExecutor(max_workers=RESULT_IO_WORKERS, thread_name_prefix='result-io')
+RESULT_TIMEOUT = float(os.environ.get('FILESEEKR_RESULT_TIMEOUT', '2'))
+RESULT_TIMEOUTS = metrics.counter('fileseekr_result_timeouts_total',
+                                  'Search results sent without file details because their stat timed out')
+
+# A stat that timed out keeps its thread until the filesystem answers, so a hung
+# mount must not be able to fill RESULT_IO. A request stats each directory's files
+# in one task, so a hung directory holds one thread; until that stat returns, the
+# directory's results are sent without file details and no thread is spent on it.
+# Tasks never queue on RESULT_IO behind hung ones: once all its threads are busy,
+# further tasks go to the small SLOW_RESULT_IO pool.
+SLOW_RESULT_IO = ThreadPoolExecutor(max_workers=2, thread_name_prefix='result-io-slow')
+hung_dirs = set()
+result_io_tasks = 0
+result_io_lock = threading.Lock()
+
+def stat_files(items):
+    """Stat files one after another, resolving each file's future"""
+    for file_path, future in items:
+        # Cancelled once the request stopped waiting for it
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(stat_result(file_path))
+        except BaseException as e:
+            future.set_exception(e)
+
+def result_io_task_done(task):
+    global result_io_tasks
+    with result_io_lock:
+        result_io_tasks -= 1
+
+def submit_stats(paths):
+    """
+    Futures of the stats of `paths` by path, leaving out files in hung
+    directories, and the (directory, task, file futures) of the tasks running them.
+    """
+    global result_io_tasks
+    by_dir = {}
+    for file_path in paths:
+        by_dir.setdefault(os.path.dirname(file_path), []).append(file_path)
+    futures, tasks = {}, []
+    for directory, dir_paths in by_dir.items():
+        items = [(file_path, Future()) for file_path in dir_paths]
+        with result_io_lock:
+            if directory in hung_dirs:
+                continue
+            on_result_io = result_io_tasks < RESULT_IO_WORKERS
+            if on_result_io:
+                result_io_tasks += 1
+        if on_result_io:
+            task = RESULT_IO.submit(stat_files, items)
+            task.add_done_callback(result_io_task_done)
+        else:
+            task = SLOW_RESULT_IO.submit(stat_files, items)
+        futures.update(items)
+        tasks.append((directory, task, items))
+    return futures, tasks
+
+def abandon_stats(tasks):
+    """Stop waiting on stat tasks; ones stuck on the filesystem mark their directory hung"""
+    for directory, task, items in tasks:
+        for _, future in items:
+            future.cancel()
+        # Queued tasks are dropped; a running task with no file left running is about to finish
+        if task.cancel() or all(future.done() for _, future in items):
+            continue
+        with result_io_lock:
+            hung_dirs.add(directory)
+        task.add_done_callback(lambda task, directory=directory: release_hung_dir(directory))
+
+def release_hung_dir(directory):
+    with result_io_lock:
+        hung_dirs.discard(directory)
+
+# Streamed searches rank here, so model inference never runs on the streaming thread
+SEARCH_WORKERS = ThreadPoolExecutor(max_workers=4, thread_name_prefix='search')
+
+def stat_result(file_path):
+    with timed('result_stat'):
+        return os.stat(file_path)
+
+def format_result(result, file_stats, thumbnails=True):
+    """
+    A search result as returned to clients. Without `file_stats` (the stat
+    timed out) size is unknown and the thumbnail is the file type icon.
+    """
+    file_path = result['path']
+    # Update filetype detection to properly handle PDFs
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
+        filetype = 'image'
+    elif ext == '.pdf':
+        filetype = 'pdf'
+    else:
+        filetype = 'document'
+
+    formatted = {
+        'filename': os.path.basename(file_path),
+        'filetype': filetype,
+        'similarity': result['similarity'],
+        'size': file_stats.st_size if file_stats else None,
+        'path': file_path,
+        # Where in the file the best matching chunk starts
+        'page': result.get('page'),
+        'offset': result.get('offset')
+    }
+    if 'duplicates' in result:
+        formatted['duplicates'] = result['duplicates']
+    if file_stats is None:
+        formatted['timedOut'] = True
+    if thumbnails:
+        with timed('result_thumbnail'):
+            formatted['thumbnail'] = get_thumbnail(file_path, file_stats) if file_stats else file_icon(file_path)
+    return formatted
+
+def iter_formatted_results(results, thumbnails=True, timeout=None):
+    """
+    (rank, formatted result) pairs in the order the files' stats complete.
+    Files that vanished since indexing are skipped; stats still running
+    after `timeout` seconds are given up on and their results sent without
+    file details.
+    """
+    stats, tasks = submit_stats([result['path'] for result in results])
+    futures, hung = {}, []
+    for rank, result in enumerate(results):
+        if result['path'] in stats:
+            futures[stats[result['path']]] = rank
+        else:
+            hung.append(rank)
+    deadline = time.monotonic() + (RESULT_TIMEOUT if timeout is None else timeout)
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in sorted(done, key=futures.get):
+            rank = futures[future]
+            try:
+                file_stats = future.result()
+            except OSError as e:
+                print(f"Error processing result {results[rank]}: {e}")
+                continue
+            yield rank, format_result(results[rank], file_stats, thumbnails)
+    abandon_stats(tasks)
+    for rank in sorted(hung + [futures[future] for future in pending]):
+        RESULT_TIMEOUTS.inc()
+        yield rank, format_result(results[rank], None, thumbnails)
+
+def format_results(results, thumbnails=True):
+    """Search results as returned to clients, in rank order, skipping files that vanished since indexing"""
+    return [formatted for _, formatted in sorted(iter_formatted_results(results, thumbnails), key=lambda item: item[0])]
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/search', methods=['GET'])
 def search():
     try:
@@ -123,48 +501,243 @@ def search():
         
         # Get number of results to return (default 5)
         limit = request.args.get('limit', 5, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        cursor = request.args.get('cursor')
+        try:
+            filters = parse_filters(request.args)
+            if cursor:
+                ResultPages.parse_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if limit <= 0 or offset < 0:
+            return jsonify({'error': 'limit must be positive and offset non-negative'}), 400
         
-        # Perform search using indexer
-        results = indexer.search(query, limit)
+        # Perform search using indexer; only this page is stat'ed and thumbnailed below
+        with timed('search'):
+            page = indexer.search_page(query, limit, filters, offset, cursor,
+                                       collapse_duplicates=request.args.get('collapse') in ('1', 'true'))
+        results = page['results']
+        record_first_search()
         
-        # Format results
-        formatted_results = []
-        for result in results:
-            try:
-                file_path = result['path']
-                file_stats = os.stat(file_path)
-                
-                # Update filetype detection to properly handle PDFs
-                ext = os.path.splitext(file_path)[1].lower()
-                if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-                    filetype = 'image'
-                elif ext == '.pdf':
-                    filetype = 'pdf'
-                else:
-                    filetype = 'document'
-                
-                formatted_results.append({
-                    'filename': os.path.basename(file_path),
-                    'filetype': filetype,
-                    'similarity': result['similarity'],
-                    'size': file_stats.st_size,
-                    'path': file_path,
-                    'thumbnail': get_thumbnail(file_path)
-                })
-            except (OSError, KeyError) as e:
-                print(f"Error processing result {result}: {e}")
-                continue
-                
-        return jsonify({'results': formatted_results})
+        return jsonify({
+            'results': format_results(results),
+            'offset': page['offset'],
+            'nextCursor': page['nextCursor']
+        })
         
     except Exception as e:
         print(f"Search error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/search/stream', methods=['GET'])
+def search_stream():
+    """
+    /search as server-sent events, so results arrive as soon as each is
+    ready instead of after the slowest. Events: 'ranked' ({count, offset,
+    nextCursor}) once the ranking is known, one 'result' per file with its
+    'rank' as its details come in, then 'done'; 'error' if the search fails.
+    Comments keep the connection alive while the model runs.
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 5, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    try:
+        filters = parse_filters(request.args)
+        if cursor:
+            ResultPages.parse_cursor(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit <= 0 or offset < 0:
+        return jsonify({'error': 'limit must be positive and offset non-negative'}), 400
+    collapse = request.args.get('collapse') in ('1', 'true')
+
+    def rank():
+        with timed('search'):
+            return indexer.search_page(query, limit, filters, offset, cursor, collapse_duplicates=collapse)
+
+    ranking = SEARCH_WORKERS.submit(rank) if query else None
+
+    def generate():
+        page = {'results': [], 'offset': offset, 'nextCursor': None}
+        while ranking is not None:
+            try:
+                page = ranking.result(timeout=1.0)
+                break
+            except FutureTimeout:
+                yield ": ranking\n\n"
+            except Exception as e:
+                print(f"Search error: {str(e)}")
+                yield sse_event('error', {'error': str(e)})
+                return
+        if query:
+            record_first_search()
+        yield sse_event('ranked', {
+            'count': len(page['results']), 'offset': page['offset'], 'nextCursor': page['nextCursor']
+        })
+        for result_rank, formatted in iter_formatted_results(page['results']):
+            yield sse_event('result', {'rank': result_rank, **formatted})
+        yield sse_event('done', {})
+
+    # stream_with_context keeps url_for working for thumbnail links while streaming
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Upper bound on queries per batch request
+MAX_BATCH_QUERIES = 1000
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Run many queries in one request: {"queries": [...], "limit": 5,
+    "filters": {...}, "thumbnails": false, "collapse": false}. Queries are encoded in one model
+    call and answered by one collection query; thumbnails are only
+    resolved when asked for.
+    """
+    data = request.json or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(query, str) and query for query in queries):
+        return jsonify({'error': 'queries must be a list of non-empty strings'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per request'}), 400
+    limit = data.get('limit', 5)
+    if not isinstance(limit, int) or limit <= 0:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    try:
+        filters = parse_filters(data.get('filters') or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with timed('search_batch'):
+            results = indexer.search_many(queries, limit, filters, bool(data.get('collapse', False)))
+        record_first_search()
+        thumbnails = bool(data.get('thumbnails', False))
+        return jsonify({'results': [
+            {'query': query, 'results': format_results(query_results, thumbnails)}
+            for query, query_results in zip(queries, results)
+        ]})
+    except Exception as e:
+        print(f"Batch search error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search/similar', methods=['GET'])
+def search_similar():
+    """
+    Files like an indexed one ("more like this"): ?path= for a file or ?id=
+    for one chunk ('path#n'), plus the usual limit, collapse and filters.
+    Queries with the stored vector, so no model runs.
+    """
+    target = request.args.get('id') or request.args.get('path', '')
+    if not target:
+        return jsonify({'error': 'path or id is required'}), 400
+    if 'id' not in request.args:
+        target = os.path.expanduser(target)
+    limit = request.args.get('limit', 5, type=int)
+    if limit <= 0:
+        return jsonify({'error': 'limit must be positive'}), 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with timed('search_similar'):
+            results = indexer.search_similar(target, limit, filters,
+                                             collapse_duplicates=request.args.get('collapse') in ('1', 'true'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        print(f"Similar search error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'results': format_results(results)})
+
+@app.route('/search/image', methods=['POST'])
+def search_image():
+    """
+    Files like an uploaded image (multipart field 'image'), with limit,
+    collapse and filters as form fields. Concurrent uploads are embedded
+    together in one image model batch.
+    """
+    upload = request.files.get('image')
+    if upload is None:
+        return jsonify({'error': 'image file is required'}), 400
+    limit = request.form.get('limit', 5, type=int)
+    if limit <= 0:
+        return jsonify({'error': 'limit must be positive'}), 400
+    try:
+        filters = parse_filters(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        with timed('search_image'):
+            results = indexer.search_by_image(upload.read(), limit, filters,
+                                              collapse_duplicates=request.form.get('collapse') in ('1', 'true'))
+        record_first_search()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Image search error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'results': format_results(results)})
+
+@app.route('/duplicates', methods=['GET'])
+def duplicates():
+    """Clusters of duplicate files, optionally under ?dir=, with ?radius= bits of perceptual hash tolerance"""
+    radius = request.args.get('radius', DUPLICATE_RADIUS, type=int)
+    if not 0 <= radius <= 32:
+        return jsonify({'error': 'radius must be between 0 and 32'}), 400
+    directory = request.args.get('dir', '')
+    prefix = expand_paths([directory])[0] if directory else ''
+    try:
+        clusters = indexer.find_duplicates(prefix, radius)
+        limit = request.args.get('limit', type=int)
+        return jsonify({
+            'clusters': clusters[:limit] if limit else clusters,
+            'count': len(clusters),
+            'duplicateFiles': sum(len(cluster['paths']) - 1 for cluster in clusters)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profiler', methods=['GET'])
+def profiler_report():
+    """Folded stacks collected by the sampling profiler (?limit=N keeps the N most frequent)"""
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.PROFILER.status())
+    return Response(metrics.PROFILER.folded(request.args.get('limit', type=int)), mimetype='text/plain')
+
+@app.route('/metrics/profiler', methods=['POST'])
+def control_profiler():
+    data = request.json or {}
+    if data.get('enabled'):
+        interval = data.get('interval')
+        if interval is not None:
+            try:
+                interval = float(interval)
+            except (TypeError, ValueError):
+                interval = None
+            if interval is None or not (0 < interval <= 1):
+                return jsonify({'success': False, 'error': 'interval must be between 0 and 1 seconds'}), 400
+        metrics.PROFILER.start(interval, reset=data.get('reset', True))
+    else:
+        metrics.PROFILER.stop()
+    return jsonify({'success': True, 'profiler': metrics.PROFILER.status()})
+
 # Update the main block
 if __name__ == '__main__':
     try:
         logger.info("Starting Flask server...")
+        # Load the models in the background; searches wait for them, everything else is served now
+        embedding.start_background_load(
+            [indexer.model.name] + ([indexer.rerank_model.name] if indexer.rerank_model else [])
+        )
+        startup_timings['serverReadySeconds'] = round(time.perf_counter() - STARTED_AT, 2)
         # Print ready message that Electron can detect
         print("FLASK_SERVER_READY")
         sys.stdout.flush()
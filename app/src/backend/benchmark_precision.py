@@ -0,0 +1,204 @@
+"""
+Compare the OpenVINO model precisions on a local corpus.
+
+Every precision embeds the same files and queries. The report shows image and
+text throughput, query latency and model size, plus how closely each variant
+reproduces FP32: recall@k of its top-k files against the FP32 top-k, and the
+mean cosine similarity between its embeddings and the FP32 ones.
+
+Usage:
+    python benchmark_precision.py CORPUS_DIR [--model vit-h-14] [--precisions fp32 fp16 int8]
+        [--queries queries.txt] [--k 10] [--calibration-dir DIR] [--json report.json]
+
+Missing variants are exported first (INT8 calibrated on --calibration-dir).
+"""
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse, json, os, sys, time
+import numpy as np
+import openvino as ov
+
+from embedding import (DEFAULT_BATCH_SIZE, IMAGE_EXTENSIONS, MAX_TEXT_TOKENS, PDF_EXTENSIONS, PRECISIONS,
+                       TEXT_EXTENSIONS, EmbeddingModel, model_name)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+
+def embed_images(compiled, pixel_values: np.ndarray, batch_size: int) -> np.ndarray:
+    outputs = [
+        compiled(np.ascontiguousarray(pixel_values[i:i + batch_size], dtype=np.float32))[0]
+        for i in range(0, len(pixel_values), batch_size)
+    ]
+    return _normalize(np.concatenate(outputs))
+
+
+def embed_texts(model: EmbeddingModel, compiled, texts: List[str], batch_size: int) -> np.ndarray:
+    outputs = []
+    for i in range(0, len(texts), batch_size):
+        inputs = model.processor(text=texts[i:i + batch_size], return_tensors="np",
+                                 padding=True, truncation=True, max_length=MAX_TEXT_TOKENS)
+        outputs.append(compiled({'input_ids': inputs['input_ids'], 'attention_mask': inputs['attention_mask']})[0])
+    return _normalize(np.concatenate(outputs))
+
+
+def load_corpus(model: EmbeddingModel, corpus_dir: str, max_files: int) -> Tuple[List[str], np.ndarray, List[int], List[str], List[int]]:
+    """
+    Prepare every supported file once, shared by all precisions.
+
+    Returns:
+        Tuple: file paths, stacked image pixels with the file index of each,
+        chunk texts with the file index of each
+    """
+    extensions = IMAGE_EXTENSIONS | TEXT_EXTENSIONS | PDF_EXTENSIONS
+    paths, pixels, pixel_files, texts, text_files = [], [], [], [], []
+    for file_path in sorted(Path(corpus_dir).rglob('*')):
+        if len(paths) >= max_files:
+            break
+        if not file_path.is_file() or file_path.suffix.lower() not in extensions:
+            continue
+        try:
+            kind, payload = model.prepare_file(str(file_path))
+        except Exception as e:
+            print(f"Skipping {file_path}: {e}", file=sys.stderr)
+            continue
+        index = len(paths)
+        paths.append(str(file_path))
+        if kind == 'image':
+            pixels.append(payload)
+            pixel_files.append(index)
+        else:
+            for chunk in payload:
+                texts.append(chunk.text)
+                text_files.append(index)
+    pixel_values = np.stack(pixels) if pixels else np.zeros((0, *model.pixel_shape()), dtype=np.float32)
+    return paths, pixel_values, pixel_files, texts, text_files
+
+
+def default_queries(paths: List[str]) -> List[str]:
+    # File names are the closest thing to a label an unlabelled corpus has
+    return sorted({Path(path).stem.replace('_', ' ').replace('-', ' ') for path in paths})
+
+
+def compile_variant(model: EmbeddingModel, core: ov.Core, precision: str, calibration_dir: str, clip_model: list):
+    image_path, text_path = model.model_paths(precision)
+    if not (os.path.exists(image_path) and os.path.exists(text_path)):
+        if not clip_model:
+            from transformers import CLIPModel
+            clip_model.append(CLIPModel.from_pretrained(model.name))
+        print(f"Exporting {precision} models...")
+        return model.export(clip_model[0], precision, calibration_dir)
+    return core.compile_model(image_path), core.compile_model(text_path)
+
+
+def model_size_mb(model: EmbeddingModel, precision: str) -> float:
+    total = 0
+    for xml_path in model.model_paths(precision):
+        for path in (xml_path, os.path.splitext(xml_path)[0] + '.bin'):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+    return round(total / 2 ** 20, 1)
+
+
+def top_k(query_embeddings: np.ndarray, file_embeddings: np.ndarray, file_of_row: np.ndarray,
+          num_files: int, k: int) -> List[List[int]]:
+    """Top-k file indices per query, scoring each file by its best matching chunk"""
+    similarities = query_embeddings @ file_embeddings.T
+    rankings = []
+    for row in similarities:
+        best = np.full(num_files, -np.inf)
+        np.maximum.at(best, file_of_row, row)
+        rankings.append(list(np.argsort(-best)[:k]))
+    return rankings
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    model = EmbeddingModel(args.model)
+    model.load_processor()
+    paths, pixel_values, pixel_files, texts, text_files = load_corpus(model, args.corpus, args.max_files)
+    if not paths:
+        raise SystemExit(f"No supported files in {args.corpus}")
+    if args.queries:
+        with open(args.queries, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = default_queries(paths)
+    file_of_row = np.array(pixel_files + text_files)
+    print(f"{len(paths)} files ({len(pixel_values)} images, {len(texts)} text chunks), {len(queries)} queries")
+
+    core = ov.Core()
+    clip_model: list = []
+    results, reference = {}, None
+    precisions = ['fp32'] + [p for p in args.precisions if p != 'fp32']
+    for precision in precisions:
+        image_model, text_model = compile_variant(model, core, precision, args.calibration_dir, clip_model)
+
+        # Warm up so compilation and first-call allocation aren't timed
+        if len(pixel_values):
+            embed_images(image_model, pixel_values[:1], 1)
+        embed_texts(model, text_model, queries[:1], 1)
+
+        start = time.perf_counter()
+        image_embeddings = embed_images(image_model, pixel_values, args.batch_size) if len(pixel_values) else None
+        image_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        text_embeddings = embed_texts(model, text_model, texts, args.batch_size) if texts else None
+        text_seconds = time.perf_counter() - start
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            embed_texts(model, text_model, [query], 1)
+            latencies.append(time.perf_counter() - start)
+        query_embeddings = embed_texts(model, text_model, queries, args.batch_size)
+
+        file_embeddings = np.concatenate([e for e in (image_embeddings, text_embeddings) if e is not None])
+        rankings = top_k(query_embeddings, file_embeddings, file_of_row, len(paths), args.k)
+
+        report = {
+            'modelSizeMB': model_size_mb(model, precision),
+            'imagesPerSec': round(len(pixel_values) / image_seconds, 2) if image_seconds and len(pixel_values) else None,
+            'textChunksPerSec': round(len(texts) / text_seconds, 2) if text_seconds and texts else None,
+            'queryLatencyP50Ms': round(float(np.percentile(latencies, 50)) * 1000, 2),
+            'queryLatencyP95Ms': round(float(np.percentile(latencies, 95)) * 1000, 2),
+        }
+        if reference is None:
+            reference = (file_embeddings, query_embeddings, rankings)
+        else:
+            ref_files, ref_queries, ref_rankings = reference
+            overlap = [len(set(a) & set(b)) / len(b) for a, b in zip(rankings, ref_rankings) if b]
+            report[f'recallAt{args.k}'] = round(float(np.mean(overlap)), 4)
+            report['meanCosineVsFp32'] = round(float(np.mean(np.sum(
+                np.concatenate([file_embeddings, query_embeddings]) * np.concatenate([ref_files, ref_queries]),
+                axis=1
+            ))), 4)
+        results[precision] = report
+        print(f"{precision}: {report}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help='Directory of images, text files and PDFs to embed')
+    parser.add_argument('--model', default=model_name, help='Registry short name or checkpoint name')
+    parser.add_argument('--precisions', nargs='+', choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument('--queries', help='File with one query per line (default: file names)')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-files', type=int, default=2000)
+    parser.add_argument('--calibration-dir', help='Files to calibrate INT8 quantization on (default: corpus)')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+    args.calibration_dir = args.calibration_dir or args.corpus
+
+    results = run(args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
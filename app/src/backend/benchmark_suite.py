@@ -0,0 +1,341 @@
+"""
+Reproducible indexing and search benchmark.
+
+Generates a synthetic corpus of images, text files and PDFs, indexes it with
+FileIndexer.index_directories, then times FileIndexer.search and the /search
+endpoint (through the Flask test client). Reports files/sec, p50/p95/p99
+search latency, peak RSS and index size on disk, and compares them with a
+stored baseline.
+
+A deterministic stub embedder stands in for CLIP, so the benchmark runs
+offline and measures the pipeline (discovery, hashing, decoding, caching,
+Chroma, result formatting) rather than the model. --model-latency-ms adds a
+simulated per-input inference cost.
+
+Usage:
+    python benchmark_suite.py [--images 500] [--texts 500] [--pdfs 100] [--queries 200]
+        [--corpus-dir DIR] [--baseline benchmark_baseline.json] [--update-baseline]
+"""
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+import argparse, hashlib, json, os, random, re, resource, shutil, sys, tempfile, time
+
+# Indexes created by this process use the stub; this must be set before embedding is imported
+STUB_MODEL_NAME = 'stub-embedder'
+os.environ['FILESEEKR_MODEL'] = STUB_MODEL_NAME
+
+import fitz
+import numpy as np
+from PIL import Image, ImageDraw
+
+from embedding import DEFAULT_BATCH_SIZE, EmbeddingModel, register_model
+
+# Where the baseline lives unless --baseline says otherwise
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Metrics compared with the baseline, and whether higher is better
+METRICS = {
+    'filesPerSec': True,
+    'searchP50Ms': False,
+    'searchP95Ms': False,
+    'searchP99Ms': False,
+    'endpointP50Ms': False,
+    'endpointP95Ms': False,
+    'endpointP99Ms': False,
+    'peakRssMB': False,
+    'indexSizeMB': False,
+}
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+class StubEmbeddingModel(EmbeddingModel):
+    """
+    Deterministic stand-in for CLIP. Text embeds as a signed hashed bag of
+    words and images as a fixed random projection of their 32x32 pixels, so
+    related inputs still land close together and searches rank sensibly.
+    """
+
+    def __init__(self, dim: int = 64, latency_ms: float = 0.0):
+        """
+        Args:
+            dim (int): Embedding dimension
+            latency_ms (float): Simulated inference time per input
+        """
+        super().__init__(STUB_MODEL_NAME)
+        self.dim = dim
+        self.latency_ms = latency_ms
+        # Chunking falls back to whitespace words without a tokenizer
+        self.processor = SimpleNamespace(tokenizer=None)
+        self._projection = np.random.default_rng(0).standard_normal((3 * 32 * 32, dim)).astype(np.float32)
+
+    def load_processor(self):
+        pass
+
+    def pixel_shape(self) -> Tuple[int, int, int]:
+        return 3, 32, 32
+
+    def load(self):
+        self._load_state.update(status='ready', backend='stub', precision='fp32', seconds=0.0)
+
+    def preprocess_image(self, image: Image.Image) -> np.ndarray:
+        pixels = np.asarray(image.convert('RGB').resize((32, 32)), dtype=np.float32) / 255.0
+        return pixels.transpose(2, 0, 1)
+
+    def _simulate(self, count: int):
+        if self.latency_ms:
+            time.sleep(count * self.latency_ms / 1000)
+
+    def embed_pixel_values(self, pixel_values: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE,
+                           interactive: bool = False) -> np.ndarray:
+        self._simulate(len(pixel_values))
+        flat = pixel_values.reshape(len(pixel_values), -1).astype(np.float32) - 0.5
+        return _unit(flat @ self._projection)
+
+    def embed_texts(self, texts: List[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                    interactive: bool = False) -> np.ndarray:
+        self._simulate(len(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD_PATTERN.findall(text.lower()):
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+                vectors[row, h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        # Texts without words get a fixed direction instead of a zero vector
+        vectors[~vectors.any(axis=1), 0] = 1.0
+        return _unit(vectors)
+
+
+def _make_vocabulary(rng: random.Random, size: int = 600) -> List[str]:
+    syllables = ['ka', 'lo', 'mi', 'ne', 'su', 'ta', 'vo', 'ri', 'pe', 'do', 'zu', 'an', 'el', 'or', 'is', 'ul']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def generate_corpus(root: str, images: int, texts: int, pdfs: int, queries: int,
+                    seed: int = 0, files_per_dir: int = 50) -> List[str]:
+    """
+    Write a synthetic corpus under root and return search queries for it.
+    Files are spread over nested directories; text and PDFs draw their words
+    from a handful of topics so queries have clear matches.
+    """
+    rng = random.Random(seed)
+    vocabulary = _make_vocabulary(rng)
+    topics = [rng.sample(vocabulary, 12) for _ in range(40)]
+
+    def directory_for(index: int) -> str:
+        group = index // files_per_dir
+        path = os.path.join(root, f'group{group // 10:03d}', f'batch{group:04d}')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def words_for(topic: List[str], count: int) -> str:
+        return ' '.join(rng.choice(topic) if rng.random() < 0.4 else rng.choice(vocabulary) for _ in range(count))
+
+    index = 0
+    for i in range(images):
+        width, height = rng.randint(64, 320), rng.randint(64, 320)
+        image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(1, 6)):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            box = [x0, y0, min(width, x0 + rng.randint(8, width)), min(height, y0 + rng.randint(8, height))]
+            fill = tuple(rng.randrange(256) for _ in range(3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=fill)
+        ext = '.jpg' if i % 2 == 0 else '.png'
+        image.save(os.path.join(directory_for(index), f'image_{i:06d}{ext}'))
+        index += 1
+
+    for i in range(texts):
+        ext = '.txt' if i % 3 else '.md'
+        with open(os.path.join(directory_for(index), f'note_{i:06d}{ext}'), 'w', encoding='utf-8') as f:
+            f.write(words_for(rng.choice(topics), rng.randint(40, 1500)))
+        index += 1
+
+    for i in range(pdfs):
+        doc = fitz.open()
+        topic = rng.choice(topics)
+        for _ in range(rng.randint(1, 4)):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), words_for(topic, rng.randint(50, 300)), fontsize=10)
+        doc.save(os.path.join(directory_for(index), f'report_{i:06d}.pdf'))
+        doc.close()
+        index += 1
+
+    return [' '.join(rng.sample(rng.choice(topics), rng.randint(1, 3))) for _ in range(queries)]
+
+
+def _percentiles(samples: List[float], prefix: str) -> Dict[str, float]:
+    return {
+        f'{prefix}P{p}Ms': round(float(np.percentile(samples, p)) * 1000, 3) if samples else None
+        for p in (50, 95, 99)
+    }
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and bytes on macOS; children count once they have exited
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * scale / 2 ** 20, 1)
+
+
+def prepare_corpus(args) -> Tuple[str, List[str]]:
+    """Generate the corpus, or reuse one generated earlier with the same settings"""
+    config = {key: getattr(args, key) for key in ('images', 'texts', 'pdfs', 'queries', 'seed')}
+    manifest_path = os.path.join(args.corpus_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['config'] == config:
+            return os.path.join(args.corpus_dir, 'files'), manifest['queries']
+        shutil.rmtree(args.corpus_dir)
+
+    files_dir = os.path.join(args.corpus_dir, 'files')
+    start = time.perf_counter()
+    queries = generate_corpus(files_dir, args.images, args.texts, args.pdfs, args.queries, args.seed)
+    print(f"Generated corpus in {time.perf_counter() - start:.1f}s")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'config': config, 'queries': queries}, f)
+    return files_dir, queries
+
+
+def run(args) -> Dict[str, Any]:
+    corpus, queries = prepare_corpus(args)
+    register_model(StubEmbeddingModel(dim=args.dim, latency_ms=args.model_latency_ms))
+
+    index_dir = tempfile.mkdtemp(prefix='fileseekr-bench-')
+    os.environ['FILESEEKR_DB_PATH'] = index_dir
+    # Imported only now: the app builds its indexer for FILESEEKR_DB_PATH at import
+    import app as server
+
+    try:
+        indexer = server.indexer
+        start = time.perf_counter()
+        indexer.index_directories([corpus])
+        index_seconds = time.perf_counter() - start
+        indexed = len(indexer.indexed_paths)
+
+        # Warm up the query path before timing it
+        for query in queries[:5]:
+            indexer.search(query, args.limit)
+
+        search_latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            indexer.search(query, args.limit)
+            search_latencies.append(time.perf_counter() - start)
+
+        client = server.app.test_client()
+        endpoint_latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            response = client.get('/search', query_string={'q': query, 'limit': args.limit})
+            endpoint_latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"/search returned {response.status_code}: {response.get_data(as_text=True)}")
+
+        return {
+            'config': {
+                key: getattr(args, key)
+                for key in ('images', 'texts', 'pdfs', 'queries', 'seed', 'dim', 'limit', 'model_latency_ms')
+            },
+            'metrics': {
+                'filesIndexed': indexed,
+                'indexSeconds': round(index_seconds, 3),
+                'filesPerSec': round(indexed / index_seconds, 2) if index_seconds else None,
+                **_percentiles(search_latencies, 'search'),
+                **_percentiles(endpoint_latencies, 'endpoint'),
+                'peakRssMB': _peak_rss_mb(),
+                'indexSizeMB': round(_directory_size(index_dir) / 2 ** 20, 2),
+            }
+        }
+    finally:
+        server.watcher.stop()
+        server.jobs.shutdown()
+        if not args.keep_index:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Metrics that are worse than the baseline by more than tolerance (a fraction)"""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        current, previous = results['metrics'].get(metric), baseline['metrics'].get(metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        print(f"  {metric:15} {previous:>12} -> {current:>12} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(f"{metric} {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=500)
+    parser.add_argument('--texts', type=int, default=500)
+    parser.add_argument('--pdfs', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dim', type=int, default=64, help='Stub embedding dimension')
+    parser.add_argument('--limit', type=int, default=10, help='Results per search')
+    parser.add_argument('--model-latency-ms', type=float, default=0.0, help='Simulated inference time per input')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'fileseekr-bench-corpus'),
+                        help='Where the corpus is generated; reused while the settings are unchanged')
+    parser.add_argument('--keep-index', action='store_true', help="Don't delete the index afterwards")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression before failing')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline['config'] != results['config']:
+        print("Baseline was recorded with different settings; not comparing")
+        return
+
+    print("Compared with baseline:")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Compare the vector store engines at scale.
+
+Fills each engine with the same synthetic vectors (clustered unit vectors, so
+an IVF index has structure to find), then opens it again in a fresh process
+and times queries against it. Reports build time and size on disk, cold-open
+time, RSS after opening and at the end, p50/p95/p99 query latency, and
+recall@k against exact search.
+
+Engines: 'chroma' (HNSW), 'mmap' (exhaustive float16 matmul) and 'mmap-ivf'
+(float16 with an IVF index of --ivf-lists lists, --nprobe probed per query).
+Each build and each query run is its own process, so RSS and open time
+aren't skewed by what ran before.
+
+Usage:
+    python benchmark_vector_store.py [--files 1000000] [--dim 1024] [--queries 200] [--limit 10]
+        [--engines chroma mmap mmap-ivf] [--ivf-lists 1024] [--nprobe 16] [--dir DIR] [--json report.json]
+"""
+from typing import Any, Dict, List
+import argparse, json, os, resource, shutil, subprocess, sys, tempfile, time
+import numpy as np
+
+from vector_store import open_vector_store
+
+ENGINES = ('chroma', 'mmap', 'mmap-ivf')
+
+# Vectors generated and written per step; under Chroma's maximum batch size
+BLOCK_SIZE = 5000
+CLUSTERS = 256
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _centers(dim: int, seed: int) -> np.ndarray:
+    return _unit(np.random.default_rng(seed).standard_normal((CLUSTERS, dim)).astype(np.float32))
+
+
+def vector_block(start: int, count: int, dim: int, seed: int) -> np.ndarray:
+    """Rows start..start+count of the synthetic corpus; the same on every call"""
+    rng = np.random.default_rng((seed, start))
+    centers = _centers(dim, seed)
+    noise = rng.standard_normal((count, dim)).astype(np.float32) * (0.8 / np.sqrt(dim))
+    return _unit(centers[rng.integers(0, CLUSTERS, count)] + noise)
+
+
+def query_vectors(args) -> np.ndarray:
+    # Perturbed corpus vectors: realistic neighbourhoods without exact matches
+    # Seeded past the last block start, so independent of every corpus block
+    rng = np.random.default_rng((args.seed, args.files))
+    rows = rng.integers(0, args.files, args.queries)
+    blocks = {}
+    for start in {int(row) // BLOCK_SIZE * BLOCK_SIZE for row in rows}:
+        blocks[start] = vector_block(start, min(BLOCK_SIZE, args.files - start), args.dim, args.seed)
+    base = np.stack([blocks[int(row) // BLOCK_SIZE * BLOCK_SIZE][int(row) % BLOCK_SIZE] for row in rows])
+    return _unit(base + rng.standard_normal(base.shape).astype(np.float32) * 0.02)
+
+
+def exact_neighbours(args, queries: np.ndarray) -> List[set]:
+    """Ground truth top-k of every query by brute force over the generated corpus"""
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, args.files, BLOCK_SIZE):
+        block = vector_block(start, min(BLOCK_SIZE, args.files - start), args.dim, args.seed)
+        # Unit vectors: the smallest L2 distance is the largest dot product
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        keep = np.argpartition(-scores, args.limit - 1, axis=1)[:, :args.limit]
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+    return [{f'/bench/{row}' for row in rows} for rows in best_rows]
+
+
+def _percentiles(samples: List[float], prefix: str) -> Dict[str, float]:
+    return {f'{prefix}P{p}Ms': round(float(np.percentile(samples, p)) * 1000, 3) for p in (50, 95, 99)}
+
+
+def _directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _rss_mb() -> float:
+    """Peak RSS of this process so far"""
+    # Linux carries ru_maxrss over exec from the parent; the kernel's high-water mark doesn't
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+
+
+def _open(engine: str, directory: str, args):
+    if engine == 'chroma':
+        return open_vector_store(directory, 'chroma')
+    return open_vector_store(directory, 'mmap', args.ivf_lists if engine == 'mmap-ivf' else 0, args.nprobe)
+
+
+def build(engine: str, directory: str, args) -> Dict[str, Any]:
+    store = _open(engine, directory, args)
+    start = time.perf_counter()
+    for offset in range(0, args.files, BLOCK_SIZE):
+        vectors = vector_block(offset, min(BLOCK_SIZE, args.files - offset), args.dim, args.seed)
+        ids = [f'/bench/{row}' for row in range(offset, offset + len(vectors))]
+        store.upsert(ids=ids, embeddings=vectors, documents=ids, metadatas=[
+            {'path': path, 'name': os.path.basename(path), 'type': 'image', 'chunk': 0} for path in ids
+        ])
+    if engine == 'mmap-ivf' and store._centroids is None:
+        store.build_ivf()
+    build_seconds = time.perf_counter() - start
+    store.close()
+    return {
+        'buildSeconds': round(build_seconds, 2),
+        'buildRssMB': _rss_mb(),
+        'sizeMB': round(_directory_size(directory) / 2 ** 20, 1),
+    }
+
+
+def query(engine: str, directory: str, args) -> Dict[str, Any]:
+    queries = np.load(os.path.join(args.dir, 'queries.npy'))
+    with open(os.path.join(args.dir, 'truth.json'), encoding='utf-8') as f:
+        truth = [set(ids) for ids in json.load(f)]
+
+    start = time.perf_counter()
+    store = _open(engine, directory, args)
+    count = store.count()
+    open_seconds = time.perf_counter() - start
+    open_rss = _rss_mb()
+
+    # The first queries page the index in; time the rest
+    for embedding in queries[:5]:
+        store.query(embedding, args.limit)
+    latencies, recall = [], 0.0
+    for embedding, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids = store.query(embedding, args.limit)['ids'][0]
+        latencies.append(time.perf_counter() - start)
+        recall += len(expected & set(ids)) / args.limit
+    store.close()
+    return {
+        'count': count,
+        'coldOpenSeconds': round(open_seconds, 3),
+        'openRssMB': open_rss,
+        'peakRssMB': _rss_mb(),
+        **_percentiles(latencies, 'query'),
+        f'recallAt{args.limit}': round(recall / len(queries), 4),
+    }
+
+
+def _run_phase(phase: str, engine: str, args) -> Dict[str, Any]:
+    """Run one phase in a fresh interpreter and return the JSON it prints last"""
+    command = [sys.executable, os.path.abspath(__file__), '--phase', phase, '--engine', engine,
+               '--files', str(args.files), '--dim', str(args.dim), '--queries', str(args.queries),
+               '--limit', str(args.limit), '--ivf-lists', str(args.ivf_lists), '--nprobe', str(args.nprobe),
+               '--seed', str(args.seed), '--dir', args.dir]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(args) -> Dict[str, Any]:
+    os.makedirs(args.dir, exist_ok=True)
+    print(f"Computing exact neighbours of {args.queries} queries over {args.files} vectors")
+    queries = query_vectors(args)
+    np.save(os.path.join(args.dir, 'queries.npy'), queries)
+    with open(os.path.join(args.dir, 'truth.json'), 'w', encoding='utf-8') as f:
+        json.dump([sorted(ids) for ids in exact_neighbours(args, queries)], f)
+
+    report = {}
+    for engine in args.engines:
+        directory = os.path.join(args.dir, engine)
+        shutil.rmtree(directory, ignore_errors=True)
+        print(f"Building {engine}")
+        results = _run_phase('build', engine, args)
+        print(f"Querying {engine}")
+        results.update(_run_phase('query', engine, args))
+        report[engine] = results
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'config': {key: getattr(args, key) for key in ('files', 'dim', 'queries', 'limit', 'ivf_lists', 'nprobe', 'seed')},
+        'engines': report
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=1_000_000)
+    parser.add_argument('--dim', type=int, default=1024, help='Embedding dimension (ViT-H-14 is 1024)')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10, help='Results per query')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--ivf-lists', type=int, default=1024, help='IVF lists of mmap-ivf')
+    parser.add_argument('--nprobe', type=int, default=16, help='Lists mmap-ivf scores per query')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'fileseekr-vector-bench'),
+                        help='Where the stores are built')
+    parser.add_argument('--keep', action='store_true', help="Don't delete the stores afterwards")
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--phase', choices=('build', 'query'), help=argparse.SUPPRESS)
+    parser.add_argument('--engine', choices=ENGINES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        directory = os.path.join(args.dir, args.engine)
+        results = build(args.engine, directory, args) if args.phase == 'build' else query(args.engine, directory, args)
+        print(json.dumps(results))
+        return
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
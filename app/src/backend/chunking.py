@@ -0,0 +1,85 @@
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import fitz, re
+
+# Tokens per window; CLIP adds start/end tokens around these to reach its 77-token limit
+CHUNK_TOKENS = 75
+# Tokens shared by consecutive windows so phrases on a boundary stay searchable
+CHUNK_OVERLAP = 16
+# Upper bound on chunks (and so on parsing work) per file
+MAX_CHUNKS_PER_FILE = 64
+
+_WORD_PATTERN = re.compile(r'\S+')
+
+
+class Chunk(NamedTuple):
+    text: str
+    page: Optional[int]  # 1-based PDF page, None for plain text files
+    offset: int          # Character offset of the chunk within its page or file
+
+
+def _token_spans(text: str, tokenizer) -> List[Tuple[int, int]]:
+    """Character spans of the tokens in text"""
+    if tokenizer is not None and getattr(tokenizer, 'is_fast', False):
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return [tuple(span) for span in encoded['offset_mapping']]
+    # Slow tokenizers have no offsets; whitespace words are a close enough stand-in
+    return [match.span() for match in _WORD_PATTERN.finditer(text)]
+
+
+def chunk_text(text: str, tokenizer, page: Optional[int] = None, window: int = CHUNK_TOKENS,
+               overlap: int = CHUNK_OVERLAP, max_chunks: Optional[int] = None) -> List[Chunk]:
+    """
+    Split text into overlapping windows of at most `window` tokens.
+
+    Args:
+        text (str): Text to split
+        tokenizer: Tokenizer of the text model, used for token-accurate windows
+        page (Optional[int]): Page number recorded on every chunk
+        window (int): Tokens per chunk
+        overlap (int): Tokens shared by consecutive chunks
+        max_chunks (Optional[int]): Stop after this many chunks
+    Returns:
+        List[Chunk]: Chunks in document order
+    """
+    spans = _token_spans(text, tokenizer)
+    step = max(1, window - overlap)
+
+    chunks = []
+    for start in range(0, len(spans), step):
+        if max_chunks is not None and len(chunks) >= max_chunks:
+            break
+        end = min(start + window, len(spans))
+        char_start, char_end = spans[start][0], spans[end - 1][1]
+        chunk = text[char_start:char_end].strip()
+        if chunk:
+            chunks.append(Chunk(chunk, page, char_start))
+        if end == len(spans):
+            break
+    return chunks
+
+
+def chunk_pages(pages: Iterable[Tuple[Optional[int], str]], tokenizer,
+                max_chunks: int = MAX_CHUNKS_PER_FILE) -> List[Chunk]:
+    """
+    Chunk a lazily produced sequence of (page number, text) pairs, stopping as
+    soon as `max_chunks` is reached so later pages are never parsed.
+    """
+    chunks: List[Chunk] = []
+    for page, text in pages:
+        chunks.extend(chunk_text(text, tokenizer, page=page, max_chunks=max_chunks - len(chunks)))
+        if len(chunks) >= max_chunks:
+            break
+    return chunks
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield (1-based page number, text) for each page, extracting one page at a time"""
+    with fitz.open(file_path) as doc:
+        for page_index in range(doc.page_count):
+            yield page_index + 1, doc[page_index].get_text()
+
+
+def read_text_pages(file_path: str, max_chars: int) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield the start of a text file as a single page, reading at most `max_chars` characters"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield None, f.read(max_chars)
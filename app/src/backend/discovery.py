@@ -0,0 +1,174 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import fnmatch
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import json, logging, os, sqlite3, threading, time
+
+logger = logging.getLogger(__name__)
+
+# Directory and file names never descended into or indexed
+DEFAULT_IGNORE_PATTERNS = (
+    '.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', 'venv',
+    '.cache', '.Trash*', '.DS_Store'
+)
+
+# Directories modified this recently are rescanned next time, since an entry
+# added within the same mtime tick would not change their recorded mtime
+_MTIME_SETTLE_SECONDS = 2.0
+
+
+class DirectoryState:
+    """
+    Last seen mtime and subdirectories of every scanned directory. A directory
+    whose mtime hasn't changed has gained or lost no entries, so discovery of
+    new files can skip listing it and descend straight into its known
+    subdirectories.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                subdirs TEXT NOT NULL,
+                extensions TEXT NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, path: str, extensions: str) -> Optional[Tuple[int, List[str]]]:
+        """Stored (mtime_ns, subdirectories) of a directory scanned for the same extensions"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT mtime_ns, subdirs FROM directories WHERE path = ? AND extensions = ?',
+                (path, extensions)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put_many(self, rows: Iterable[Tuple[str, int, List[str], str]]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO directories (path, mtime_ns, subdirs, extensions) VALUES (?, ?, ?, ?)',
+                ((path, mtime_ns, json.dumps(subdirs), extensions) for path, mtime_ns, subdirs, extensions in rows)
+            )
+
+    def invalidate(self, paths: Iterable[str]):
+        """Forget specific directories so they are listed again"""
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM directories WHERE path = ?', ((path,) for path in paths))
+
+    def invalidate_prefix(self, prefix: str):
+        """Forget a directory tree so it is listed again"""
+        prefix = prefix.rstrip(os.sep)
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM directories WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                (prefix, escaped + os.sep + '%')
+            )
+
+
+def is_ignored(name: str, ignore_patterns: Iterable[str]) -> bool:
+    return any(fnmatch(name, pattern) for pattern in ignore_patterns)
+
+
+class FileDiscovery:
+    """
+    Streaming file discovery over one or more roots. Directories are listed
+    with os.scandir on a thread pool and files are yielded as soon as their
+    directory has been listed, so indexing can start immediately instead of
+    after the whole tree has been walked.
+
+    With a DirectoryState, directories whose mtime is unchanged are not listed
+    again (only new files are wanted). Their state is persisted by `commit()`,
+    which the caller invokes once every file yielded so far is durably queued.
+    """
+
+    def __init__(self, roots: List[str], extensions: Set[str],
+                 ignore_patterns: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+                 workers: int = 8, directory_state: Optional[DirectoryState] = None):
+        """
+        Args:
+            roots (List[str]): Directories to walk
+            extensions (Set[str]): Lower-case extensions of the files to yield
+            ignore_patterns (Iterable[str]): fnmatch patterns of names to skip
+            workers (int): Threads listing directories in parallel
+            directory_state (Optional[DirectoryState]): Enables pruning of unchanged directories
+        """
+        self.roots = roots
+        self.extensions = {ext.lower() for ext in extensions}
+        self.ignore_patterns = tuple(ignore_patterns)
+        self.workers = workers
+        self.directory_state = directory_state
+        self._extensions_key = ','.join(sorted(self.extensions))
+        self._completed: List[Tuple[str, int, List[str], str]] = []
+        self.directories_listed = 0
+        self.directories_pruned = 0
+
+    def _list_directory(self, path: str) -> Tuple[List[Tuple[str, os.stat_result]], List[str], Optional[tuple]]:
+        """
+        List one directory, reusing the stored subdirectories if it is unchanged.
+
+        Returns:
+            Tuple: (matching files with their stat, subdirectories, state row to persist or None)
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Error scanning {path}: {e}")
+            return [], [], None
+
+        if self.directory_state is not None:
+            stored = self.directory_state.get(path, self._extensions_key)
+            if stored is not None and stored[0] == mtime_ns:
+                self.directories_pruned += 1
+                return [], stored[1], None
+
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if is_ignored(entry.name, self.ignore_patterns):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif (entry.is_file() and
+                              os.path.splitext(entry.name)[1].lower() in self.extensions):
+                            files.append((entry.path, entry.stat()))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.error(f"Error scanning {path}: {e}")
+            return [], [], None
+
+        self.directories_listed += 1
+        state = None
+        if self.directory_state is not None and time.time() - mtime_ns / 1e9 > _MTIME_SETTLE_SECONDS:
+            state = (path, mtime_ns, subdirs, self._extensions_key)
+        return files, subdirs, state
+
+    def __iter__(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """Yield (path, stat) for every matching file as directories are listed"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='discovery') as executor:
+            pending = {executor.submit(self._list_directory, root) for root in self.roots if os.path.isdir(root)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirs, state = future.result()
+                    pending.update(executor.submit(self._list_directory, subdir) for subdir in subdirs)
+                    yield from files
+                    # Only now has every file of this directory reached the caller
+                    if state is not None:
+                        self._completed.append(state)
+
+    def commit(self):
+        """Persist the state of the directories whose files have all been yielded"""
+        if self.directory_state is None or not self._completed:
+            return
+        completed, self._completed = self._completed, []
+        self.directory_state.put_many(completed)
@@ -0,0 +1,204 @@
+from PIL import Image
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import imagehash, os, sqlite3, threading
+
+# Hamming distance (of 64 bits) up to which two images count as near-duplicates.
+# Resized and re-encoded copies land within a few bits; different photos rarely under 10.
+DUPLICATE_RADIUS = 6
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def image_phash(file_path: str) -> int:
+    """64-bit DCT perceptual hash of an image, stable under resizing and re-encoding"""
+    with Image.open(file_path) as img:
+        # phash works on a 32x32 grayscale image; JPEGs can decode straight to a small size
+        img.draft('L', (64, 64))
+        return int(str(imagehash.phash(img)), 16)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes under Hamming distance. A radius
+    query only descends into children whose edge distance is within the
+    radius of the query's distance to the node, so it touches a small part
+    of the tree. Paths sharing a hash share a node; removing the last path
+    leaves an empty node behind.
+    """
+
+    def __init__(self):
+        # Node: [hash, set of paths, {distance: child node}]
+        self._root: Optional[list] = None
+
+    def add(self, value: int, path: str):
+        if self._root is None:
+            self._root = [value, {path}, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].add(path)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {path}, {}]
+                return
+            node = child
+
+    def discard(self, value: int, path: str):
+        node = self._root
+        while node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].discard(path)
+                return
+            node = node[2].get(distance)
+
+    def search(self, value: int, radius: int) -> Iterator[Tuple[int, Set[str], int]]:
+        """(hash, paths, distance) of every non-empty node within `radius` of value"""
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius and node[1]:
+                yield node[0], node[1], distance
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+
+
+class DuplicateIndex:
+    """
+    Perceptual hashes of indexed images, stored in SQLite next to the Chroma
+    data and held in a BK-tree for radius queries. Backs near-duplicate
+    clustering, search result collapsing and embedding reuse for visually
+    identical images.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # Hashes are stored as hex: SQLite integers are signed 64-bit
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS phashes (
+                path TEXT PRIMARY KEY,
+                phash TEXT NOT NULL,
+                content_hash TEXT
+            )
+        ''')
+        self._conn.commit()
+
+        self._hashes: Dict[str, Tuple[int, Optional[str]]] = {}
+        self._tree = BKTree()
+        for path, phash, digest in self._conn.execute('SELECT path, phash, content_hash FROM phashes'):
+            self._hashes[path] = (int(phash, 16), digest)
+            self._tree.add(int(phash, 16), path)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._hashes
+
+    def contains(self, path: str, digest: Optional[str] = None) -> bool:
+        """Whether a file is hashed, and from content with the given hash if one is passed"""
+        with self._lock:
+            entry = self._hashes.get(path)
+        return entry is not None and (digest is None or entry[1] == digest)
+
+    def get(self, path: str) -> Optional[int]:
+        with self._lock:
+            entry = self._hashes.get(path)
+        return entry[0] if entry else None
+
+    def _forget(self, path: str):
+        entry = self._hashes.pop(path, None)
+        if entry is not None:
+            self._tree.discard(entry[0], path)
+
+    def upsert_many(self, records: Iterable[Tuple[str, int, Optional[str]]]):
+        """Store (path, perceptual hash, content hash) for each image, replacing earlier versions"""
+        records = list(records)
+        if not records:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO phashes (path, phash, content_hash) VALUES (?, ?, ?)',
+                ((path, f'{phash:016x}', digest) for path, phash, digest in records)
+            )
+            for path, phash, digest in records:
+                self._forget(path)
+                self._hashes[path] = (phash, digest)
+                self._tree.add(phash, path)
+
+    def remove(self, paths: Iterable[str]):
+        paths = list(paths)
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM phashes WHERE path = ?', ((path,) for path in paths))
+            for path in paths:
+                self._forget(path)
+
+    def move(self, moves: Dict[str, str]):
+        """Re-key moved images (new path -> old path)"""
+        with self._lock:
+            entries = {new_path: self._hashes[old_path] for new_path, old_path in moves.items()
+                       if old_path in self._hashes}
+        self.remove(moves.values())
+        self.upsert_many((path, phash, digest) for path, (phash, digest) in entries.items())
+
+    def twin(self, phash: int, exclude: Optional[str] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """(path, content hash) of another image with exactly this perceptual hash"""
+        with self._lock:
+            for _, paths, _ in self._tree.search(phash, 0):
+                for path in paths:
+                    if path != exclude:
+                        return path, self._hashes[path][1]
+        return None
+
+    def near(self, phash: int, radius: int = DUPLICATE_RADIUS) -> List[Tuple[str, int]]:
+        """(path, distance) of every image within `radius` bits of a hash, closest first"""
+        with self._lock:
+            found = [(path, distance) for _, paths, distance in self._tree.search(phash, radius) for path in paths]
+        return sorted(found, key=lambda item: (item[1], item[0]))
+
+    def clusters(self, radius: int = DUPLICATE_RADIUS, prefix: str = '') -> List[List[str]]:
+        """
+        Groups of images linked by chains of near-duplicates (single linkage),
+        largest first. Only images under `prefix` are considered.
+        """
+        with self._lock:
+            paths = [path for path in self._hashes if path.startswith(prefix)]
+            parent = {path: path for path in paths}
+
+            def find(path: str) -> str:
+                while parent[path] != path:
+                    parent[path] = parent[parent[path]]
+                    path = parent[path]
+                return path
+
+            for path in paths:
+                for _, neighbours, _ in self._tree.search(self._hashes[path][0], radius):
+                    for neighbour in neighbours:
+                        if neighbour in parent:
+                            a, b = find(path), find(neighbour)
+                            if a != b:
+                                parent[b] = a
+
+        groups: Dict[str, List[str]] = {}
+        for path in paths:
+            groups.setdefault(find(path), []).append(path)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,38 +1,100 @@
 from pathlib import Path
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-from typing import List, Optional, Dict
-import fitz, io, numpy as np, openvino as ov, os, torch
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from chunking import Chunk, MAX_CHUNKS_PER_FILE, chunk_pages, iter_pdf_pages, read_text_pages
+from contextlib import contextmanager
+from metrics import STAGE_SECONDS, timed
+import fitz, io, logging, numpy as np, openvino as ov, os, re, threading, time, torch
 
-# Load the CLIP model and processor
-model_name = "laion/CLIP-ViT-H-14-laion2B-s32B-b79K"
+logger = logging.getLogger(__name__)
+
+# CLIP checkpoints selectable by short name; any other Hugging Face CLIP
+# checkpoint name can be used directly
+MODEL_REGISTRY = {
+    'vit-h-14': 'laion/CLIP-ViT-H-14-laion2B-s32B-b79K',
+    'vit-l-14': 'openai/clip-vit-large-patch14',
+    'vit-b-16': 'openai/clip-vit-base-patch16',
+    'vit-b-32': 'openai/clip-vit-base-patch32',
+}
+
+def resolve_model_name(name: str) -> str:
+    """Checkpoint name for a registry short name or checkpoint name"""
+    return MODEL_REGISTRY.get(name.lower(), name)
+
+# CLIP checkpoint used when an index doesn't choose one
+model_name = resolve_model_name(os.environ.get('FILESEEKR_MODEL', 'vit-h-14'))
 device = "cuda" if torch.cuda.is_available() else "cpu"
-model = CLIPModel.from_pretrained(model_name)
-processor = CLIPProcessor.from_pretrained(model_name)
-
-# Initialize OpenVINO
-core = ov.Core()
-try:
-    # Load optimized models if they exist, otherwise create them
-    if os.path.exists("optimized_image_model.xml") and os.path.exists("optimized_text_model.xml"):
-        image_model = core.compile_model("optimized_image_model.xml")
-        text_model = core.compile_model("optimized_text_model.xml")
-    else:
-        image_model, text_model = optimize_clip_model()
-    
-    USE_OPTIMIZED = True
-except Exception as e:
-    print(f"Failed to load optimized models: {e}. Falling back to PyTorch models.")
-    model.to(device)
-    model.eval()
-    USE_OPTIMIZED = False
+
+# Exported OpenVINO models live next to this module
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Weight precision of the exported OpenVINO models. int8 is weight-compressed,
+# or fully quantized when calibration files are available.
+PRECISIONS = ('fp32', 'fp16', 'int8')
+PRECISION = os.environ.get('FILESEEKR_PRECISION', 'fp32').lower()
+# Local images and text files used to calibrate INT8 quantization
+CALIBRATION_DIR = os.environ.get('FILESEEKR_CALIBRATION_DIR')
+
+if PRECISION not in PRECISIONS:
+    logger.warning(f"Unknown precision {PRECISION!r}, using fp32")
+    PRECISION = 'fp32'
+
+# Supported file types
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+TEXT_EXTENSIONS = {'.txt', '.md', '.py', '.js', '.html', '.css', '.json'}
+PDF_EXTENSIONS = {'.pdf'}
+
+# Number of inputs sent through the model in a single forward pass
+DEFAULT_BATCH_SIZE = 32
+
+# CLIP's text tower only sees this many tokens
+MAX_TEXT_TOKENS = 77
+
+# Characters read from a text file; generous for MAX_CHUNKS_PER_FILE windows
+MAX_TEXT_CHARS = MAX_CHUNKS_PER_FILE * MAX_TEXT_TOKENS * 8
+
+class _InferenceGate:
+    """
+    Serializes access to the shared models. Interactive callers (search
+    queries) are let in ahead of background batches waiting for the model, so
+    a running indexing job only delays a query by at most one batch.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._busy = False
+        self._interactive_waiting = 0
+
+    @contextmanager
+    def hold(self, interactive: bool = False):
+        start = time.perf_counter()
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            while self._busy or (not interactive and self._interactive_waiting):
+                self._cond.wait()
+            if interactive:
+                self._interactive_waiting -= 1
+            self._busy = True
+        STAGE_SECONDS.observe(time.perf_counter() - start,
+                              stage='inference_wait_query' if interactive else 'inference_wait_batch')
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+# Every model shares the same CPU/GPU, so only one batch may run through any
+# of them at a time
+_inference_gate = _InferenceGate()
 
 class ImageFeatureExtractor(torch.nn.Module):
     def __init__(self, model):
         super().__init__()
         self.model = model
         self.vision_model = model.vision_model
-        
+
     def forward(self, pixel_values):
         return self.vision_model(pixel_values)[1]
 
@@ -41,88 +103,496 @@ class TextFeatureExtractor(torch.nn.Module):
         super().__init__()
         self.model = model
         self.text_model = model.text_model
-        
+
     def forward(self, input_ids, attention_mask):
         return self.text_model(input_ids=input_ids, attention_mask=attention_mask)[1]
 
-def optimize_clip_model():
-    """Create and save optimized OpenVINO models for both image and text processing"""
-    # Initialize OpenVINO
-    core = ov.Core()
-    
-    # Prepare example inputs
-    example_image = torch.randn(1, 3, 224, 224)
-    example_text = {
-        'input_ids': torch.randint(0, 1000, (1, 77)),
-        'attention_mask': torch.ones(1, 77)
-    }
-    
-    # Convert image model
-    image_model = ImageFeatureExtractor(model)
-    ov_image_model = ov.convert_model(image_model, example_input=example_image)
-    ov.save_model(ov_image_model, "optimized_image_model.xml")
-    
-    # Convert text model
-    text_model = TextFeatureExtractor(model)
-    ov_text_model = ov.convert_model(text_model, example_input=example_text)
-    ov.save_model(ov_text_model, "optimized_text_model.xml")
-    
-    return (core.compile_model("optimized_image_model.xml"), 
-            core.compile_model("optimized_text_model.xml"))
+def _quantize_int8(ov_model, samples: List[Any]):
+    """
+    Post-training INT8 quantization of weights and activations, calibrated on
+    samples; weight-only INT8 compression when there are no samples.
+    """
+    try:
+        import nncf
+    except ImportError:
+        raise ImportError("INT8 export requires nncf (pip install nncf)")
+
+    if samples:
+        return nncf.quantize(ov_model, nncf.Dataset(samples), model_type=nncf.ModelType.TRANSFORMER,
+                             subset_size=len(samples))
+    return nncf.compress_weights(ov_model)
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+class EmbeddingModel:
+    """
+    One CLIP checkpoint with its processor and exported OpenVINO models.
+    Nothing is loaded on construction: the processor loads on first
+    preprocessing and the models on first inference or load().
+    """
+
+    def __init__(self, name: str, precision: str = PRECISION, calibration_dir: Optional[str] = CALIBRATION_DIR):
+        """
+        Args:
+            name (str): Registry short name or Hugging Face checkpoint name
+            precision (str): Precision of the exported OpenVINO models
+            calibration_dir (Optional[str]): Files to calibrate INT8 quantization on
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+        self.name = resolve_model_name(name)
+        self.precision = precision
+        self.calibration_dir = calibration_dir
+
+        self.model = None
+        self.processor = None
+        self.image_model = None
+        self.text_model = None
+        self.use_optimized = False
+
+        self._load_lock = threading.Lock()
+        self._processor_lock = threading.Lock()
+        self._load_state = {'status': 'not_loaded', 'backend': None, 'precision': None, 'error': None, 'seconds': None}
+
+    def model_id(self) -> str:
+        """Identifies the embedding space: the checkpoint plus the precision it runs at"""
+        # fp32 keeps the bare checkpoint name so caches from before precisions existed stay valid
+        return self.name if self.precision == 'fp32' else f"{self.name}/{self.precision}"
+
+    def model_paths(self, precision: str) -> Tuple[str, str]:
+        """(image model, text model) paths of the exported models for a precision"""
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+        suffix = '' if precision == 'fp32' else f'_{precision}'
+        # The original ViT-H export keeps its unprefixed file names
+        prefix = '' if self.name == MODEL_REGISTRY['vit-h-14'] else re.sub(r'[^a-z0-9]+', '-', self.name.lower()) + '_'
+        return (os.path.join(MODEL_DIR, f"optimized_{prefix}image_model{suffix}.xml"),
+                os.path.join(MODEL_DIR, f"optimized_{prefix}text_model{suffix}.xml"))
+
+    def load_processor(self):
+        """
+        Load only the CLIP tokenizer and image processor. This is all the decode
+        stage needs, so preprocessing (including in worker processes) never pulls
+        in the model weights.
+        """
+        if self.processor is not None:
+            return
+
+        with self._processor_lock:
+            if self.processor is None:
+                from transformers import CLIPProcessor
+                self.processor = CLIPProcessor.from_pretrained(self.name)
+
+    def pixel_shape(self) -> Tuple[int, int, int]:
+        """(channels, height, width) of the pixel values produced by preprocess_image"""
+        self.load_processor()
+        crop_size = self.processor.image_processor.crop_size
+        return 3, crop_size['height'], crop_size['width']
+
+    def load(self):
+        """
+        Load the CLIP processor and models; later calls return immediately.
+
+        When exported OpenVINO models exist only they are compiled and the
+        PyTorch weights are never loaded. Otherwise the PyTorch model is loaded,
+        exported and released, falling back to running it directly if the export
+        fails.
+        """
+        if self._load_state['status'] == 'ready':
+            return
+
+        with self._load_lock:
+            if self._load_state['status'] == 'ready':
+                return
+            self._load_state.update(status='loading', error=None)
+            start = time.perf_counter()
+
+            try:
+                from transformers import CLIPModel
+                self.load_processor()
+
+                image_path, text_path = self.model_paths(self.precision)
+
+                core = ov.Core()
+                try:
+                    # Load optimized models if they exist, otherwise create them
+                    if os.path.exists(image_path) and os.path.exists(text_path):
+                        self.image_model = core.compile_model(image_path)
+                        self.text_model = core.compile_model(text_path)
+                    else:
+                        self.model = CLIPModel.from_pretrained(self.name)
+                        self.image_model, self.text_model = self.export(self.model, self.precision, self.calibration_dir)
+                        # The exported models replace the PyTorch weights
+                        self.model = None
+
+                    self.use_optimized = True
+                except Exception as e:
+                    print(f"Failed to load optimized models: {e}. Falling back to PyTorch models.")
+                    if self.model is None:
+                        self.model = CLIPModel.from_pretrained(self.name)
+                    self.model.to(device)
+                    self.model.eval()
+                    self.use_optimized = False
+            except Exception as e:
+                self._load_state.update(status='failed', error=str(e))
+                raise
+
+            self._load_state.update(
+                status='ready',
+                backend='openvino' if self.use_optimized else 'pytorch',
+                precision=self.precision if self.use_optimized else 'fp32',
+                seconds=round(time.perf_counter() - start, 2)
+            )
+            logger.info(f"Loaded {self.name} ({self._load_state['backend']}, {self._load_state['precision']}) "
+                        f"in {self._load_state['seconds']}s")
+
+    def is_ready(self) -> bool:
+        return self._load_state['status'] == 'ready'
+
+    def load_status(self) -> Dict[str, Any]:
+        """Snapshot of the model loading state"""
+        return {'model': self.name, **self._load_state}
+
+    def calibration_inputs(self, directory: str,
+                           max_samples: int = 128) -> Tuple[List[np.ndarray], List[Dict[str, np.ndarray]]]:
+        """
+        Build quantization calibration samples from the files in a local directory.
+
+        Args:
+            directory (str): Directory of representative images, text files and PDFs
+            max_samples (int): Maximum samples per tower
+        Returns:
+            Tuple[List[np.ndarray], List[Dict[str, np.ndarray]]]: Image model inputs and text model inputs
+        """
+        self.load_processor()
+        image_inputs, text_inputs = [], []
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if len(image_inputs) >= max_samples and len(text_inputs) >= max_samples:
+                    return image_inputs, text_inputs[:max_samples]
+                file_path = os.path.join(root, name)
+                ext = os.path.splitext(name)[1].lower()
+                try:
+                    if ext in IMAGE_EXTENSIONS and len(image_inputs) < max_samples:
+                        image_inputs.append(self.load_image_pixels(file_path)[None])
+                    elif (ext in TEXT_EXTENSIONS or ext in PDF_EXTENSIONS) and len(text_inputs) < max_samples:
+                        pages = iter_pdf_pages(file_path) if ext in PDF_EXTENSIONS else read_text_pages(file_path, MAX_TEXT_CHARS)
+                        for chunk in chunk_pages(pages, self.processor.tokenizer, max_chunks=4):
+                            inputs = self.processor(text=[chunk.text], return_tensors="np",
+                                                    padding=True, truncation=True, max_length=MAX_TEXT_TOKENS)
+                            text_inputs.append({'input_ids': inputs['input_ids'], 'attention_mask': inputs['attention_mask']})
+                except Exception as e:
+                    logger.warning(f"Skipping calibration file {file_path}: {e}")
+        return image_inputs, text_inputs[:max_samples]
+
+    def export(self, model, precision: str = 'fp32', calibration_dir: Optional[str] = None):
+        """
+        Create and save optimized OpenVINO models for both image and text processing.
+
+        Args:
+            model: PyTorch CLIP model of this checkpoint
+            precision (str): fp32, fp16 (weights stored as FP16) or int8
+            calibration_dir (Optional[str]): Files to calibrate INT8 quantization on
+        Returns:
+            Tuple: Compiled image and text models
+        """
+        image_path, text_path = self.model_paths(precision)
+
+        # Initialize OpenVINO
+        core = ov.Core()
+
+        # Prepare example inputs
+        example_image = torch.randn(1, *self.pixel_shape())
+        example_text = {
+            'input_ids': torch.randint(0, 1000, (1, 77)),
+            'attention_mask': torch.ones(1, 77)
+        }
+
+        # Convert image model
+        image_model = ImageFeatureExtractor(model)
+        ov_image_model = ov.convert_model(image_model, example_input=example_image)
+
+        # Convert text model
+        text_model = TextFeatureExtractor(model)
+        ov_text_model = ov.convert_model(text_model, example_input=example_text)
+
+        if precision == 'int8':
+            image_samples, text_samples = self.calibration_inputs(calibration_dir) if calibration_dir else ([], [])
+            logger.info(f"Quantizing to INT8 with {len(image_samples)} image and {len(text_samples)} text calibration samples")
+            ov_image_model = _quantize_int8(ov_image_model, image_samples)
+            ov_text_model = _quantize_int8(ov_text_model, text_samples)
+
+        # Weights left in floating point are stored as FP16 for the reduced precisions
+        compress_to_fp16 = precision != 'fp32'
+        ov.save_model(ov_image_model, image_path, compress_to_fp16=compress_to_fp16)
+        ov.save_model(ov_text_model, text_path, compress_to_fp16=compress_to_fp16)
+
+        return (core.compile_model(image_path),
+                core.compile_model(text_path))
+
+    def preprocess_image(self, image: Image.Image) -> np.ndarray:
+        """Run the CLIP processor on a decoded image and return its (3, H, W) pixel values"""
+        self.load_processor()
+        inputs = self.processor(images=image.convert("RGB"), return_tensors="np")
+        return inputs['pixel_values'][0]
+
+    def load_image_pixels(self, file_path: str) -> np.ndarray:
+        """Decode and preprocess an image file without running the model"""
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        try:
+            with Image.open(file_path) as image:
+                return self.preprocess_image(image)
+        except Exception as e:
+            raise ValueError(f"Error processing image {file_path}: {e}")
+
+    def embed_pixel_values(self, pixel_values: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE,
+                           interactive: bool = False) -> np.ndarray:
+        """
+        Run the image tower over preprocessed images.
+
+        Args:
+            pixel_values (np.ndarray): Stacked (N, 3, H, W) pixel values
+            batch_size (int): Maximum number of images per forward pass
+            interactive (bool): Run ahead of queued background batches
+        Returns:
+            numpy.ndarray: (N, D) normalized embeddings
+        """
+        self.load()
+        outputs = []
+        for i in range(0, len(pixel_values), batch_size):
+            batch = np.ascontiguousarray(pixel_values[i:i + batch_size], dtype=np.float32)
+            with _inference_gate.hold(interactive), timed('inference_image'):
+                if self.use_optimized:
+                    # Use OpenVINO model
+                    embeddings = self.image_model(batch)[0]
+                else:
+                    # Fallback to PyTorch model
+                    with torch.no_grad():
+                        tensor = torch.from_numpy(batch).to(device)
+                        embeddings = self.model.get_image_features(pixel_values=tensor).cpu().numpy()
+            outputs.append(_normalize(embeddings))
+        return np.concatenate(outputs)
+
+    def embed_texts(self, texts: List[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                    interactive: bool = False) -> np.ndarray:
+        """
+        Tokenize and run the text tower over a list of strings.
+
+        Args:
+            texts (List[str]): Text contents to embed
+            batch_size (int): Maximum number of texts per forward pass
+            interactive (bool): Run ahead of queued background batches (search queries)
+        Returns:
+            numpy.ndarray: (N, D) normalized embeddings
+        """
+        self.load()
+        outputs = []
+        for i in range(0, len(texts), batch_size):
+            with timed('tokenize'):
+                inputs = self.processor(text=texts[i:i + batch_size], return_tensors="np",
+                                        padding=True, truncation=True, max_length=MAX_TEXT_TOKENS)
+            with _inference_gate.hold(interactive), timed('inference_text'):
+                if self.use_optimized:
+                    # Use OpenVINO model
+                    text_inputs = {
+                        'input_ids': inputs['input_ids'],
+                        'attention_mask': inputs['attention_mask']
+                    }
+                    embeddings = self.text_model(text_inputs)[0]
+                else:
+                    # Fallback to PyTorch model
+                    with torch.no_grad():
+                        torch_inputs = {k: torch.from_numpy(v).to(device) for k, v in inputs.items()}
+                        embeddings = self.model.get_text_features(**torch_inputs).cpu().numpy()
+            outputs.append(_normalize(embeddings))
+        return np.concatenate(outputs)
+
+    def get_text_embeddings(self, texts: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                            interactive: bool = False) -> np.ndarray:
+        """Generate embeddings for several texts using batched inference"""
+        try:
+            return self.embed_texts(list(texts), batch_size, interactive)
+        except Exception as e:
+            raise ValueError(f"Error processing text: {e}")
+
+    def prepare_file(self, file_path: str) -> Tuple[str, Any]:
+        """
+        Decode or parse a file into model input without running the model.
+
+        Text files and PDFs are split into token windows; only as much of the
+        file is read or parsed as fits in MAX_CHUNKS_PER_FILE chunks.
+
+        Args:
+            file_path (str): Path to the file
+        Returns:
+            Tuple[str, Any]: ('image', pixel values) or ('text', List[Chunk])
+        """
+        file_path = Path(file_path)
+        suffix = file_path.suffix.lower()
+
+        if suffix in IMAGE_EXTENSIONS:
+            return 'image', self.load_image_pixels(str(file_path))
+
+        self.load_processor()
+        tokenizer = self.processor.tokenizer
+        if suffix in TEXT_EXTENSIONS:
+            try:
+                chunks = chunk_pages(read_text_pages(str(file_path), MAX_TEXT_CHARS), tokenizer)
+            except UnicodeDecodeError:
+                raise ValueError(f"Unable to read text file: {file_path}")
+            return 'text', chunks or [Chunk('', None, 0)]
+        elif suffix in PDF_EXTENSIONS:
+            try:
+                chunks = chunk_pages(iter_pdf_pages(str(file_path)), tokenizer)
+                # If PDF has no text content, try to process it as an image
+                if not chunks:
+                    print(f"No text found in PDF {file_path}, attempting to process first page as image...")
+                    with fitz.open(str(file_path)) as doc:
+                        if doc.page_count == 0:
+                            raise ValueError("PDF has no pages")
+                        pix = doc[0].get_pixmap()
+                        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                    return 'image', self.preprocess_image(img)
+                return 'text', chunks
+            except Exception as e:
+                raise ValueError(f"Error processing PDF {file_path}: {e}")
+        else:
+            raise ValueError(f"Unsupported file type: {file_path.suffix}")
+
+    def embed_prepared(self, prepared: List[Tuple[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE,
+                       interactive: bool = False) -> List[np.ndarray]:
+        """
+        Embed inputs produced by prepare_file, batching images and text chunks
+        separately across all inputs.
+
+        Args:
+            prepared (List[Tuple[str, Any]]): Outputs of prepare_file
+            batch_size (int): Maximum number of inputs per forward pass
+            interactive (bool): Run ahead of queued background batches
+        Returns:
+            List[numpy.ndarray]: One (n, D) array per input, in the same order; n is
+            1 for images and the number of chunks for text
+        """
+        embeddings: List[Optional[np.ndarray]] = [None] * len(prepared)
+
+        image_idx = [i for i, (kind, _) in enumerate(prepared) if kind == 'image']
+        if image_idx:
+            pixel_values = np.stack([prepared[i][1] for i in image_idx])
+            for i, embedding in zip(image_idx, self.embed_pixel_values(pixel_values, batch_size, interactive)):
+                embeddings[i] = embedding[np.newaxis]
+
+        text_idx = [i for i, (kind, _) in enumerate(prepared) if kind == 'text']
+        if text_idx:
+            texts = [chunk.text for i in text_idx for chunk in prepared[i][1]]
+            text_embeddings = self.get_text_embeddings(texts, batch_size, interactive)
+            start = 0
+            for i in text_idx:
+                end = start + len(prepared[i][1])
+                embeddings[i] = text_embeddings[start:end]
+                start = end
+
+        return embeddings
+
+_models: Dict[str, EmbeddingModel] = {}
+_models_lock = threading.Lock()
+
+def get_model(name: Optional[str] = None) -> EmbeddingModel:
+    """
+    Shared EmbeddingModel for a registry short name or checkpoint name
+    (the default model when None), created on first use.
+    """
+    checkpoint = resolve_model_name(name) if name else model_name
+    with _models_lock:
+        if checkpoint not in _models:
+            _models[checkpoint] = EmbeddingModel(checkpoint)
+        return _models[checkpoint]
+
+def register_model(model: EmbeddingModel):
+    """Make a custom EmbeddingModel available to get_model (and so to indexes) under its name"""
+    with _models_lock:
+        _models[model.name] = model
+
+# Module-level API, operating on the default model
+
+def model_id() -> str:
+    return get_model().model_id()
+
+def model_paths(precision: str) -> Tuple[str, str]:
+    return get_model().model_paths(precision)
+
+def load_processor():
+    get_model().load_processor()
+
+def pixel_shape() -> Tuple[int, int, int]:
+    return get_model().pixel_shape()
+
+def load_models():
+    get_model().load()
+
+def start_background_load(names: Iterable[Optional[str]] = (None,)) -> threading.Thread:
+    """Load models on a background thread so the server can start serving immediately"""
+    def run():
+        for name in names:
+            try:
+                get_model(name).load()
+            except Exception as e:
+                logger.error(f"Failed to load models: {e}")
+
+    thread = threading.Thread(target=run, name='model-load', daemon=True)
+    thread.start()
+    return thread
+
+def is_ready() -> bool:
+    return get_model().is_ready()
+
+def load_status() -> Dict[str, Any]:
+    """Snapshot of the default model loading state"""
+    return get_model().load_status()
+
+def calibration_inputs(directory: str, max_samples: int = 128) -> Tuple[List[np.ndarray], List[Dict[str, np.ndarray]]]:
+    return get_model().calibration_inputs(directory, max_samples)
+
+def optimize_clip_model(model, precision: str = 'fp32', calibration_dir: Optional[str] = None):
+    """Create and save optimized OpenVINO models of the default checkpoint"""
+    return get_model().export(model, precision, calibration_dir)
+
+def preprocess_image(image: Image.Image) -> np.ndarray:
+    return get_model().preprocess_image(image)
+
+def load_image_pixels(file_path: str) -> np.ndarray:
+    return get_model().load_image_pixels(file_path)
+
+def embed_pixel_values(pixel_values: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    return get_model().embed_pixel_values(pixel_values, batch_size)
+
+def embed_texts(texts: List[str], batch_size: int = DEFAULT_BATCH_SIZE, interactive: bool = False) -> np.ndarray:
+    return get_model().embed_texts(texts, batch_size, interactive)
+
+def get_image_embeddings(file_paths: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    """Generate embeddings for several image files using batched inference"""
+    pixel_values = np.stack([load_image_pixels(str(path)) for path in file_paths])
+    return embed_pixel_values(pixel_values, batch_size)
+
+def get_text_embeddings(texts: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                        interactive: bool = False) -> np.ndarray:
+    """Generate embeddings for several texts using batched inference"""
+    return get_model().get_text_embeddings(texts, batch_size, interactive)
 
 def get_image_embedding(file_path: str):
     """Generate and return the embedding for an image file using optimized CLIP"""
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-    
-    try:
-        image = Image.open(file_path).convert("RGB")
-        inputs = processor(images=image, return_tensors="pt")
-        
-        if USE_OPTIMIZED:
-            # Use OpenVINO model
-            image_tensor = inputs['pixel_values'].numpy()
-            embeddings = image_model(image_tensor)[0]
-        else:
-            # Fallback to PyTorch model
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            with torch.no_grad():
-                embeddings = model.get_image_features(**inputs).cpu().numpy()
-        
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
-        return embeddings[0]
-    
-    except Exception as e:
-        raise ValueError(f"Error processing image {file_path}: {e}")
+    return get_image_embeddings([file_path])[0]
 
-def get_text_embedding(text_content: str):
+def get_text_embedding(text_content: str, interactive: bool = False):
     """Generate and return the embedding for text content using optimized CLIP"""
-    try:
-        inputs = processor(text=text_content, return_tensors="pt", padding=True)
-        
-        if USE_OPTIMIZED:
-            # Use OpenVINO model
-            text_inputs = {
-                'input_ids': inputs['input_ids'].numpy(),
-                'attention_mask': inputs['attention_mask'].numpy()
-            }
-            embeddings = text_model(text_inputs)[0]
-        else:
-            # Fallback to PyTorch model
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            with torch.no_grad():
-                embeddings = model.get_text_features(**inputs).cpu().numpy()
-        
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
-        return embeddings[0]
-    
-    except Exception as e:
-        raise ValueError(f"Error processing text: {e}")
+    return get_text_embeddings([text_content], interactive=interactive)[0]
 
 def extract_text_from_pdf(file_path: str) -> str:
     """
     Extract text content from a PDF file.
-    
+
     Args:
         file_path (str): Path to the PDF file
     Returns:
@@ -131,88 +601,43 @@ def extract_text_from_pdf(file_path: str) -> str:
     try:
         doc = fitz.open(file_path)
         text_content = []
-        
+
         for page in doc:
             text_content.append(page.get_text())
-        
+
         return "\n".join(text_content)
     except Exception as e:
         raise ValueError(f"Error extracting text from PDF {file_path}: {e}")
 
+def prepare_file(file_path: str) -> Tuple[str, Any]:
+    return get_model().prepare_file(file_path)
+
+def embed_prepared(prepared: List[Tuple[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE) -> List[np.ndarray]:
+    return get_model().embed_prepared(prepared, batch_size)
+
 def get_embedding(file_path: str):
     """
     Generate embedding based on file type.
-    
+
     Args:
         file_path (str): Path to the file
     Returns:
-        numpy.ndarray: The embedding
+        numpy.ndarray: The embedding of the file, or of its first chunk for text
     """
-    file_path = Path(file_path)
-    
-    # Image extensions
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-    # Text extensions
-    text_extensions = {'.txt', '.md', '.py', '.js', '.html', '.css', '.json'}
-    # PDF extension
-    pdf_extension = {'.pdf'}
-    
-    if file_path.suffix.lower() in image_extensions:
-        return get_image_embedding(str(file_path))
-    elif file_path.suffix.lower() in text_extensions:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                content = f.read()
-                return get_text_embedding(content)
-            except UnicodeDecodeError:
-                raise ValueError(f"Unable to read text file: {file_path}")
-    elif file_path.suffix.lower() in pdf_extension:
-        try:
-            content = extract_text_from_pdf(str(file_path))
-            # If PDF has no text content, try to process it as an image
-            if not content.strip():
-                print(f"No text found in PDF {file_path}, attempting to process first page as image...")
-                doc = fitz.open(str(file_path))
-                if doc.page_count > 0:
-                    page = doc[0]
-                    pix = page.get_pixmap()
-                    img_data = pix.tobytes()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], img_data)
-                    # Create a temporary buffer for the image
-                    buffer = io.BytesIO()
-                    img.save(buffer, format='PNG')
-                    buffer.seek(0)
-                    # Process as image
-                    return get_image_embedding_from_buffer(buffer)
-                else:
-                    raise ValueError("PDF has no pages")
-            return get_text_embedding(content)
-        except Exception as e:
-            raise ValueError(f"Error processing PDF {file_path}: {e}")
-    else:
-        raise ValueError(f"Unsupported file type: {file_path.suffix}")
+    return embed_prepared([prepare_file(file_path)])[0][0]
 
 def get_image_embedding_from_buffer(buffer):
     """
     Generate embedding for an image from a buffer.
-    
+
     Args:
         buffer (io.BytesIO): Buffer containing the image data
     Returns:
         numpy.ndarray: The image embedding
     """
     try:
-        image = Image.open(buffer).convert("RGB")
-        inputs = processor(images=image, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            outputs = model.get_image_features(**inputs)
-        
-        embeddings = outputs.cpu().numpy()
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
-        
-        return embeddings[0]
+        with Image.open(buffer) as image:
+            pixel_values = preprocess_image(image)
+        return embed_pixel_values(pixel_values[np.newaxis])[0]
     except Exception as e:
         raise ValueError(f"Error processing image from buffer: {e}")
-
@@ -0,0 +1,146 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib, json, os, sqlite3, threading, time
+import numpy as np
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Bytes read from the start, middle and end of large files when hashing
+SAMPLE_SIZE = 1024 * 1024
+
+
+def _new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def content_hash(file_path: str, sample_size: int = SAMPLE_SIZE) -> str:
+    """
+    Fast content hash of a file. Files up to three samples long are hashed in
+    full; larger files hash their size plus the first, middle and last
+    `sample_size` bytes, so the cost is bounded regardless of file size.
+
+    Args:
+        file_path (str): Path to the file
+        sample_size (int): Bytes per sample for large files
+    Returns:
+        str: Hex digest
+    """
+    hasher = _new_hasher()
+    size = os.path.getsize(file_path)
+    hasher.update(size.to_bytes(8, 'little'))
+
+    with open(file_path, 'rb') as f:
+        if size <= 3 * sample_size:
+            hasher.update(f.read())
+        else:
+            for offset in (0, (size - sample_size) // 2, size - sample_size):
+                f.seek(offset)
+                hasher.update(f.read(sample_size))
+    return hasher.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by content hash and model, so renamed,
+    moved and duplicated files are never sent through the model twice.
+    Least recently used entries are evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, db_path: str, namespace: str, max_entries: int = 200_000):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+            namespace (str): Model identifier; embeddings from other models are never returned
+            max_entries (int): Maximum number of cached embeddings
+        """
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                chunks TEXT
+            )
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(embeddings)')}
+        if 'chunks' not in columns:
+            self._conn.execute('ALTER TABLE embeddings ADD COLUMN chunks TEXT')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+        self._conn.commit()
+
+    def _key(self, digest: str) -> str:
+        return f"{self.namespace}:{digest}"
+
+    def get(self, digest: str) -> Optional[Tuple[np.ndarray, Optional[List[Tuple[Optional[int], int]]]]]:
+        """
+        Return the cached embeddings for a content hash, or None.
+
+        Returns:
+            Optional[Tuple[np.ndarray, Optional[List]]]: (n, D) embeddings and the
+            (page, offset) of every chunk, or None for files embedded as a whole
+        """
+        key = self._key(digest)
+        with self._lock:
+            row = self._conn.execute('SELECT embedding, chunks FROM embeddings WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute('UPDATE embeddings SET last_used = ? WHERE key = ?', (time.time(), key))
+        chunks = json.loads(row[1]) if row[1] else None
+        embeddings = np.frombuffer(row[0], dtype=np.float32).reshape(len(chunks) if chunks else 1, -1)
+        return embeddings, [tuple(chunk) for chunk in chunks] if chunks else None
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray, Optional[List[Tuple[Optional[int], int]]]]]):
+        """
+        Store (content hash, (n, D) embeddings, chunk positions) entries and
+        evict the least recently used overflow.
+        """
+        now = time.time()
+        rows = [
+            (self._key(digest), np.asarray(embeddings, dtype=np.float32).tobytes(), now,
+             json.dumps(chunks) if chunks else None)
+            for digest, embeddings, chunks in items
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, embedding, last_used, chunks) VALUES (?, ?, ?, ?)', rows
+            )
+            count = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    '''DELETE FROM embeddings WHERE key IN (
+                           SELECT key FROM embeddings ORDER BY last_used LIMIT ?)''',
+                    (count - self.max_entries,)
+                )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
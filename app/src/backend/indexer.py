@@ -1,47 +1,119 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from embedding import get_embedding, get_text_embedding
+from embedding import DEFAULT_BATCH_SIZE, MAX_TEXT_CHARS, MODEL_REGISTRY, get_model, model_name, resolve_model_name
+from chunking import CHUNK_OVERLAP, CHUNK_TOKENS, MAX_CHUNKS_PER_FILE
+from discovery import DirectoryState, FileDiscovery
+from duplicates import DUPLICATE_RADIUS, DuplicateIndex, hamming, image_phash
+from embedding_cache import EmbeddingCache, content_hash
+from lexical_index import LexicalIndex, chunks_text, extract_text, is_exact_query, reciprocal_rank_fusion
+from metadata_index import MetadataIndex
+from metrics import FILES_FAILED, FILES_INDEXED, timed
+from query_encoding import QueryBatcher, QueryEmbeddingCache, normalize_query
+from pipeline import DecodePool, process_pool_supported
+from search_filters import ResultPages, SearchFilters, combine_where
+from shards import DEFAULT_SHARD, SHARDS_FILE, ShardedVectorStore
+from thumbnails import ThumbnailCache
+from vector_store import open_vector_store
 from pathlib import Path
+from PIL import Image
 from tqdm import tqdm
-from typing import List, Set, Optional, Dict, Any
-import chromadb
+from typing import List, Set, Optional, Dict, Any, Iterator, Tuple, Callable
 import numpy as np
-import logging, multiprocessing, os, platform, subprocess
+from work_queue import WorkQueue
+import hashlib, io, logging, multiprocessing, os, platform, sqlite3, subprocess, threading
+
+# Chunk hits fetched per requested file before collapsing them into files
+SEARCH_OVERSAMPLE = 4
+
+# Candidate files fetched with the index model per result when a re-rank model is set
+RERANK_CANDIDATES = 4
+
+# Directory filters matching at most this many files are pushed into the Chroma query
+# as a path list; larger ones are applied to the hits instead
+MAX_PATH_FILTER = 2000
+
+# Extra results ranked per requested result when near-duplicates are collapsed
+COLLAPSE_OVERSAMPLE = 2
+
+# Collection metadata key recording the checkpoint every stored vector came from
+MODEL_METADATA_KEY = 'embedding_model'
+
+# Called after every batch with (files processed so far, total files, paths that failed in the batch).
+# It may block to pause indexing or raise to abort it.
+ProgressCallback = Callable[[int, int, List[str]], None]
+
+
+class _ImageQuery:
+    """Preprocessed query image, identified by its content so identical concurrent uploads are embedded once"""
+    __slots__ = ('digest', 'pixel_values')
+
+    def __init__(self, data: bytes, pixel_values: np.ndarray):
+        self.digest = hashlib.blake2b(data, digest_size=16).digest()
+        self.pixel_values = pixel_values
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __eq__(self, other):
+        return isinstance(other, _ImageQuery) and self.digest == other.digest
 
 class FileIndexer:
-    def __init__(self, persist_directory: str):
+    def __init__(self, persist_directory: str, inference_batch_size: int = DEFAULT_BATCH_SIZE,
+                 io_workers: Optional[int] = None, decode_workers: Optional[int] = None,
+                 model: Optional[str] = None, rerank_model: Optional[str] = None,
+                 skip_duplicates: bool = False, vector_engine: Optional[str] = None, ivf_lists: int = 0,
+                 shards: Optional[str] = None, shard_workers: bool = False):
         """
-        Initialize the FileIndexer with ChromaDB persistence directory.
+        Initialize the FileIndexer with its persistence directory.
         
         Args:
-            persist_directory (str): Directory to persist ChromaDB data
+            persist_directory (str): Directory to persist the index data
+            inference_batch_size (int): Number of files sent through the model per forward pass
+            io_workers (Optional[int]): Threads hashing files and checking the embedding cache
+            decode_workers (Optional[int]): Processes decoding and preprocessing files; 0 decodes
+                in the hashing threads instead
+            model (Optional[str]): Model the index is built with; defaults to the model recorded in
+                the collection, or the default model for a new index. A model different from the
+                recorded one is rejected.
+            rerank_model (Optional[str]): Larger model re-ranking the top candidates of every search
+            skip_duplicates (bool): Reuse the embedding of an indexed image with the same perceptual
+                hash instead of embedding a re-encoded or resized copy
+            vector_engine (Optional[str]): 'chroma' or 'mmap' (a memory-mapped float16 matrix);
+                defaults to the engine the index was built with, or Chroma for a new index
+            ivf_lists (int): With the mmap engine, cluster vectors into this many IVF lists and
+                search only the nearest ones; 0 searches exhaustively
+            shards (Optional[str]): Split vectors into shards, 'root' (one per indexed root) or
+                'hash:N'; fixed when the index is created
+            shard_workers (bool): Serve each shard from its own worker process
         """
         os.makedirs(persist_directory, exist_ok=True)
         self.persist_directory = persist_directory
+
+        # Set number of workers based on CPU cores
+        self.max_workers = io_workers or max(1, multiprocessing.cpu_count() - 1)
+        if decode_workers is None:
+            decode_workers = max(1, multiprocessing.cpu_count() - 1)
+        self.decode_workers = decode_workers if process_pool_supported() else 0
+        # Decode workers are forked, so they start first, before any store opens threads
+        self._decode_pool = self._start_decode_pool()
         
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=chromadb.Settings(
-                anonymized_telemetry=False,
-                allow_reset=True,
-                is_persistent=True
-            )
-        )
-        
-        # Get or create collection
-        try:
-            self.collection = self.client.get_collection("file_collection")
-        except:
-            self.collection = self.client.create_collection("file_collection")
+        # Vector store: the Chroma collection or the mmap engine, behind one interface, optionally sharded
+        if shards or os.path.exists(os.path.join(persist_directory, SHARDS_FILE)):
+            self.collection = ShardedVectorStore(persist_directory, shards, vector_engine, ivf_lists,
+                                                 workers=shard_workers)
+        else:
+            self.collection = open_vector_store(persist_directory, vector_engine, ivf_lists)
+        self.model = get_model(self._check_index_model(model))
+
+        # Two-stage retrieval: the index model finds candidates, the re-rank model orders them
+        self.rerank_model = None
+        if rerank_model and resolve_model_name(rerank_model) != self.model.name:
+            self.rerank_model = get_model(rerank_model)
         
         # Supported file extensions
         self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
         self.text_extensions = {'.txt', '.md', '.py', '.js', '.html', '.css', '.json'}
         self.pdf_extensions = {'.pdf'}
         
-        # Load existing indexed files
-        self.indexed_paths = self._load_indexed_paths()
-        print(f"Connected to ChromaDB at {persist_directory} with {len(self.indexed_paths)} indexed files")
-
         # Configure logging
         logging.basicConfig(
             level=logging.INFO,
@@ -53,271 +125,1367 @@ class FileIndexer:
         )
         self.logger = logging.getLogger(__name__)
 
-        # Set number of workers based on CPU cores
-        self.max_workers = max(1, multiprocessing.cpu_count() - 1)
+        # Durable record of pending/done/failed files for resuming interrupted indexing
+        self.work_queue = WorkQueue(os.path.join(persist_directory, 'work_queue.sqlite3'))
+
+        # Embeddings keyed by file content, so moved, renamed and duplicate files skip the model
+        # Chunking settings are part of the key: different settings mean different embeddings
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(persist_directory, 'embedding_cache.sqlite3'),
+            f"{self.model.model_id()}/chunks-{CHUNK_TOKENS}-{CHUNK_OVERLAP}-{MAX_CHUNKS_PER_FILE}"
+        )
+
+        # Re-rank model embeddings, computed the first time a file is a search candidate
+        self.rerank_cache = None
+        if self.rerank_model is not None:
+            self.rerank_cache = EmbeddingCache(
+                os.path.join(persist_directory, 'rerank_cache.sqlite3'),
+                f"{self.rerank_model.model_id()}/chunks-{CHUNK_TOKENS}-{CHUNK_OVERLAP}-{MAX_CHUNKS_PER_FILE}"
+            )
+
+        # Thumbnails are rendered while indexing so search never has to
+        self.thumbnail_cache = ThumbnailCache(os.path.join(persist_directory, 'thumbnails'))
+        self.directory_state = DirectoryState(os.path.join(persist_directory, 'directories.sqlite3'))
+
+        # Per-file metadata mirrored from the collection, for listings and prefix lookups
+        self.metadata_index = MetadataIndex(os.path.join(persist_directory, 'metadata_index.sqlite3'))
+
+        # BM25 over file names and text for exact identifiers and names, fused with vector results
+        try:
+            self.lexical_index = LexicalIndex(os.path.join(persist_directory, 'lexical_index.sqlite3'))
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"Lexical search disabled, SQLite lacks FTS5: {e}")
+            self.lexical_index = None
+
+        # Perceptual hashes of images for near-duplicate clusters and collapsing search results
+        self.duplicate_index = DuplicateIndex(os.path.join(persist_directory, 'duplicates.sqlite3'))
+        self.skip_duplicates = skip_duplicates
+
+        # Repeated queries skip the text model; concurrent ones share a single call
+        self.query_cache = QueryEmbeddingCache()
+        self.query_batcher = QueryBatcher(lambda texts: self.model.get_text_embeddings(texts, interactive=True))
+        self.rerank_query_cache = QueryEmbeddingCache()
+        # Concurrent image queries share one pass through the image tower
+        self.image_query_batcher = QueryBatcher(lambda images: self.model.embed_pixel_values(
+            np.stack([image.pixel_values for image in images]), self.inference_batch_size, interactive=True
+        ))
+        # Rankings of recent searches for pagination; index_version invalidates them on any change
+        self.result_pages = ResultPages()
+        self.index_version = 0
+
         self.batch_size = 128  # Increased batch size for better parallelization
+        self.inference_batch_size = inference_batch_size
+
+        # Held by every change to the index, so the job worker and the file watcher
+        # never write the same files at once
+        self.index_lock = threading.RLock()
+
+        # Load existing indexed files
+        self.indexed_paths = self._load_indexed_paths()
+        print(f"Opened index at {persist_directory} with {len(self.indexed_paths)} indexed files")
+        # Index built before lexical search or duplicate detection existed: fill them in the background
+        backfill = []
+        if self.lexical_index is not None and self.lexical_index.is_empty() and self.indexed_paths:
+            backfill.append(self._backfill_lexical_index)
+        if self.duplicate_index.is_empty() and self.indexed_paths:
+            backfill.append(self._backfill_duplicate_index)
+        if backfill:
+            threading.Thread(target=lambda: [task() for task in backfill], daemon=True).start()
+
+    def _check_index_model(self, requested: Optional[str]) -> str:
+        """
+        Resolve the model of this index and record it in the collection metadata.
+        Vectors from different models aren't comparable, so a model different
+        from the one the index was built with is rejected.
+        """
+        metadata = dict(self.collection.metadata or {})
+        recorded = metadata.get(MODEL_METADATA_KEY)
+        if recorded is None and self.collection.count() > 0:
+            # Indexes built before the model was recorded all used ViT-H
+            recorded = MODEL_REGISTRY['vit-h-14']
+
+        name = resolve_model_name(requested) if requested else (recorded or model_name)
+        if recorded is not None and recorded != name:
+            raise ValueError(
+                f"Index at {self.persist_directory} was built with {recorded} and can't be used with {name}; "
+                f"re-index into a new directory to change models"
+            )
+        if recorded is not None and recorded != model_name and not requested:
+            print(f"Using {recorded}, the model this index was built with")
+
+        # Chroma refuses metadata updates carrying index settings, so such collections go unrecorded
+        if metadata.get(MODEL_METADATA_KEY) != name and not any(key.startswith('hnsw:') for key in metadata):
+            metadata[MODEL_METADATA_KEY] = name
+            self.collection.modify(metadata=metadata)
+        return name
 
     def _load_indexed_paths(self) -> Set[str]:
         try:
-            results = self.collection.get()
-            if results['metadatas']:
-                return {meta['path'] for meta in results['metadatas']}
+            if self.metadata_index.is_empty() and self.collection.count() > 0:
+                # Collection predates the metadata index: scan it once to seed it
+                results = self.collection.get(include=['metadatas'])
+                first_chunks, chunk_counts = {}, {}
+                for metadata in results['metadatas'] or []:
+                    path = metadata['path']
+                    chunk_counts[path] = chunk_counts.get(path, 0) + 1
+                    if metadata.get('chunk', 0) == 0:
+                        first_chunks[path] = metadata
+                self.metadata_index.upsert_many(
+                    (metadata, chunk_counts[path]) for path, metadata in first_chunks.items()
+                )
+
+            paths = self.metadata_index.paths()
+            if self.work_queue.is_empty():
+                self.work_queue.mark_done(paths)
+            return paths
         except Exception as e:
             print(f"Warning: Error loading indexed paths: {e}")
         return set()
 
-    def _process_files_parallel(self, files: List[Path]) -> List[Dict[str, Any]]:
+    def _backfill_lexical_index(self, batch_size: int = 200):
+        """Add every indexed file missing from the lexical index, reading its text again"""
+        metadata_by_path = self.metadata_index.files_with_prefix('')
+        paths = [path for path in metadata_by_path if not self.lexical_index.contains(path)]
+        self.logger.info(f"Building lexical index for {len(paths)} files")
+        for i in range(0, len(paths), batch_size):
+            records = []
+            for path in paths[i:i + batch_size]:
+                metadata = metadata_by_path[path]
+                try:
+                    text = extract_text(path, metadata.get('type', 'text'), MAX_TEXT_CHARS)
+                except Exception as e:
+                    self.logger.debug(f"Indexing only the name of {path}: {e}")
+                    text = ''
+                records.append((path, metadata.get('content_hash') or None, text))
+            self.lexical_index.upsert_many(records)
+        self.logger.info("Lexical index built")
+
+    def _backfill_duplicate_index(self, batch_size: int = 200):
+        """Perceptual hashes for every indexed image missing from the duplicate index"""
+        metadata_by_path = self.metadata_index.files_with_prefix('')
+        paths = [path for path, metadata in metadata_by_path.items()
+                 if metadata.get('type') == 'image' and not self.duplicate_index.contains(path)]
+        self.logger.info(f"Hashing {len(paths)} images for duplicate detection")
+        for i in range(0, len(paths), batch_size):
+            records = []
+            for path in paths[i:i + batch_size]:
+                try:
+                    records.append((path, image_phash(path), metadata_by_path[path].get('content_hash') or None))
+                except Exception as e:
+                    self.logger.debug(f"Unable to hash {path}: {e}")
+            self.duplicate_index.upsert_many(records)
+        self.logger.info("Duplicate index built")
+
+    @staticmethod
+    def _first_chunks(items: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], int]]:
+        """(first chunk metadata, chunk count) per file of a list of collection records"""
+        chunk_counts: Dict[str, int] = {}
+        for item in items:
+            chunk_counts[item['document']] = chunk_counts.get(item['document'], 0) + 1
+        return [
+            (item['metadata'], chunk_counts[item['document']])
+            for item in items if item['metadata'].get('chunk', 0) == 0
+        ]
+
+    def _prepare_file(self, file_path: Path) -> Tuple[str, Optional[Tuple[np.ndarray, Optional[List]]], Any, Dict[str, Any]]:
         """
-        Process multiple files in parallel using thread pools.
+        Hash a file and look it up in the embedding cache; only on a miss is
+        it sent to the decode stage. Images also get a perceptual hash, and
+        with skip_duplicates an image visually identical to an indexed one
+        reuses its embedding.
+
+        Returns:
+            Tuple[str, Optional[Tuple[np.ndarray, Optional[List]]], Any, Dict[str, Any]]: (content hash,
+            cached embeddings and chunk positions, prepared model input, side index data: 'text'
+            for the lexical index unless taken from the prepared input, and the image 'phash')
         """
-        processed_items = []
+        path = str(file_path)
+        with timed('hash'):
+            digest = content_hash(path)
+            cached = self.embedding_cache.get(digest)
+
+        extras: Dict[str, Any] = {}
+        if self._get_file_type(file_path) == 'image' and not self.duplicate_index.contains(path, digest):
+            with timed('phash'):
+                try:
+                    extras['phash'] = image_phash(path)
+                except Exception as e:
+                    self.logger.debug(f"Unable to hash {path}: {e}")
+            if cached is None and self.skip_duplicates and 'phash' in extras:
+                twin = self.duplicate_index.twin(extras['phash'], exclude=path)
+                if twin is not None and twin[1]:
+                    cached = self.embedding_cache.get(twin[1])
+
+        if cached is not None:
+            self.thumbnail_cache.pregenerate(path)
+            if self.lexical_index is not None and not self.lexical_index.contains(path, digest):
+                extras['text'] = extract_text(path, self._get_file_type(file_path), MAX_TEXT_CHARS)
+            return digest, cached, None, extras
+        with timed('decode'):
+            return digest, None, self._decode(path), extras
+
+    def _start_decode_pool(self) -> Optional[DecodePool]:
+        """
+        Fork the decode worker processes. Forking a process that runs other
+        threads can leave locks they held (logging, SQLite, the inference
+        runtime) locked forever in the children, so this runs at the top of
+        __init__, before any store is opened: Chroma and the shard pool start
+        threads as soon as they are used. The workers load nothing until the
+        first file reaches them.
+        """
+        if self.decode_workers <= 0:
+            return None
+        try:
+            return DecodePool(self.decode_workers, slots=max(self.max_workers, self.decode_workers) * 2)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Falling back to in-process decoding: {e}")
+            self.decode_workers = 0
+            return None
+
+    def _decode(self, file_path: str) -> Tuple[str, Any]:
+        """Render the thumbnail and decode/parse a file, in a worker process when available"""
+        pool = self._decode_pool
+        if pool is not None:
+            return pool.prepare(file_path, self.model.name, self.thumbnail_cache)
+        self.thumbnail_cache.pregenerate(file_path)
+        return self.model.prepare_file(file_path)
+
+    def _process_files_parallel(self, files: List[Path], errors: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Process multiple files: worker threads hash and check the embedding
+        cache, handing misses to the decode stage (worker processes when
+        enabled), then a single inference stage embeds the misses as one batch.
+
+        Args:
+            files (List[Path]): Files to process
+            errors (Optional[Dict[str, str]]): Filled with the error of every file that failed
+        """
+        if errors is None:
+            errors = {}
+        prepared = []
         
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all files for processing
+            # Submit all files for hashing and decoding/preprocessing
             future_to_file = {
-                executor.submit(self._process_single_file, file_path): file_path 
+                executor.submit(self._prepare_file, file_path): file_path 
                 for file_path in files
             }
             
-            # Process completed futures as they finish
+            # Collect prepared inputs as they finish
             for future in as_completed(future_to_file):
                 file_path = future_to_file[future]
                 try:
-                    result = future.result()
-                    if result is not None:
-                        processed_items.append(result)
+                    prepared.append((file_path, *future.result()))
                 except Exception as e:
                     self.logger.error(f"Error processing {file_path}: {e}")
+                    errors[str(file_path)] = str(e)
+        
+        if not prepared:
+            return []
         
+        embeddings = [cached for _, _, cached, _, _ in prepared]
+        misses = [i for i, (_, _, cached, _, _) in enumerate(prepared) if cached is None]
+        chunk_positions = {
+            i: [(chunk.page, chunk.offset) for chunk in prepared[i][3][1]] if prepared[i][3][0] == 'text' else None
+            for i in misses
+        }
+        # Identical files within the batch are embedded once
+        first_by_digest: Dict[str, int] = {}
+        copies = {i: first_by_digest.setdefault(prepared[i][1], i) for i in misses}
+        copies = {i: first for i, first in copies.items() if i != first}
+        misses = [i for i in misses if i not in copies]
+        if misses:
+            try:
+                with timed('embed_batch'):
+                    new_embeddings = self.model.embed_prepared([prepared[i][3] for i in misses], self.inference_batch_size)
+            except Exception as e:
+                # Retry one file at a time so a single bad input doesn't drop the whole batch
+                self.logger.error(f"Error embedding batch of {len(misses)} files: {e}")
+                new_embeddings = []
+                for i in misses:
+                    try:
+                        new_embeddings.append(self.model.embed_prepared([prepared[i][3]])[0])
+                    except Exception as e:
+                        self.logger.error(f"Error processing {prepared[i][0]}: {e}")
+                        errors[str(prepared[i][0])] = str(e)
+                        new_embeddings.append(None)
+            
+            for i, embedding in zip(misses, new_embeddings):
+                if embedding is not None:
+                    embeddings[i] = (embedding, chunk_positions[i])
+            self.embedding_cache.put_many(
+                (prepared[i][1], *embeddings[i]) for i in misses if embeddings[i] is not None
+            )
+            for i, first in copies.items():
+                embeddings[i] = embeddings[first]
+                if embeddings[i] is None:
+                    errors[str(prepared[i][0])] = errors.get(str(prepared[first][0]), 'Embedding failed')
+        
+        processed_items = []
+        for (file_path, digest, _, decoded, extras), embedded in zip(prepared, embeddings):
+            if embedded is None:
+                continue
+            items = self._build_items(file_path, *embedded, digest)
+            if items:
+                if decoded is not None:
+                    extras['text'] = chunks_text(decoded[1]) if decoded[0] == 'text' else ''
+                # Carried on the first chunk to the side indexes; a missing key means it is up to date
+                items[0].update(extras)
+                processed_items.extend(items)
+            else:
+                errors[str(file_path)] = 'Unable to read file metadata'
         return processed_items
 
-    def _process_single_file(self, file_path: Path) -> Optional[Dict[str, Any]]:
+    def _get_file_type(self, file_path: Path) -> str:
+        suffix = file_path.suffix.lower()
+        if suffix in self.image_extensions:
+            return 'image'
+        elif suffix in self.pdf_extensions:
+            return 'pdf'
+        return 'text'
+
+    @staticmethod
+    def _chunk_id(path: str, chunk: int) -> str:
+        """Record ID of a chunk; the first chunk is keyed by the bare path"""
+        return path if chunk == 0 else f"{path}#{chunk}"
+
+    def _build_items(self, file_path: Path, embeddings: np.ndarray,
+                     chunk_positions: Optional[List[Tuple[Optional[int], int]]] = None,
+                     digest: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        Process a single file and return its data.
+        Build the collection records for a file: one per embedding, carrying
+        the page and character offset of its chunk when the file was chunked.
         """
         try:
-            embedding = get_embedding(str(file_path))
-            if embedding is None:
-                return None
-                
-            suffix = file_path.suffix.lower()
-            file_type = 'image' if suffix in self.image_extensions else \
-                       'pdf' if suffix in self.pdf_extensions else 'text'
-            
-            return {
-                'embedding': embedding.tolist(),
-                'document': str(file_path),
-                'metadata': {
-                    'name': file_path.name,
-                    'path': str(file_path),
-                    'timestamp': file_path.stat().st_mtime,
-                    'type': file_type
-                },
-                'id': str(file_path)
+            base_metadata = {
+                'name': file_path.name,
+                'path': str(file_path),
+                **self._file_signature(file_path.stat()),
+                'type': self._get_file_type(file_path),
+                'content_hash': digest or ''
             }
-            
         except Exception as e:
             self.logger.error(f"Error processing {file_path}: {e}")
-            return None
+            return []
+
+        items = []
+        for chunk, embedding in enumerate(embeddings):
+            metadata = {**base_metadata, 'chunk': chunk}
+            if chunk_positions:
+                page, offset = chunk_positions[chunk]
+                metadata['offset'] = offset
+                if page is not None:
+                    metadata['page'] = page
+            items.append({
+                'embedding': embedding,
+                'document': str(file_path),
+                'metadata': metadata,
+                'id': self._chunk_id(str(file_path), chunk)
+            })
+        return items
 
-    def index_directories(self, directories: List[str], file_extensions: Optional[List[str]] = None):
+    def index_directories(self, directories: List[str], file_extensions: Optional[List[str]] = None,
+                          progress_callback: Optional[ProgressCallback] = None):
         """
         Index new files in the specified directories using parallel batch processing.
+
+        Discovery is streamed: each batch is queued and indexed as soon as it
+        has been found, while the rest of the tree is still being walked.
         """
         if file_extensions is None:
             file_extensions = list(self.image_extensions | self.text_extensions | self.pdf_extensions)
 
-        # Collect files to process
-        files_to_process = []
-        for directory in directories:
-            try:
-                dir_path = Path(os.path.join(directory, '')).expanduser().resolve()
-                if not dir_path.exists():
+        roots = [str(Path(os.path.join(directory, '')).expanduser().resolve()) for directory in directories]
+        if isinstance(self.collection, ShardedVectorStore) and self.collection.mode == 'root':
+            for root in roots:
+                if self.collection.shard_for(os.path.join(root, '')) == DEFAULT_SHARD:
+                    self.add_shard(root)
+        discovery = FileDiscovery(roots, set(file_extensions), directory_state=self.directory_state)
+
+        self.logger.info(f"Using {self.max_workers} worker threads")
+        discovered = 0
+        completed = 0
+        batch: List[Path] = []
+
+        def flush():
+            nonlocal completed
+            # Record the work before starting so an interrupted run can resume
+            self.work_queue.enqueue(str(path) for path in batch)
+            # Everything found so far is queued, so the scanned directories can be pruned next time
+            discovery.commit()
+            with self.index_lock:
+                _, failed = self._index_batch(batch)
+            completed += len(batch)
+            pbar.update(len(batch))
+            if progress_callback is not None:
+                progress_callback(completed, discovered, failed)
+            batch.clear()
+
+        with tqdm(desc="Indexing files") as pbar:
+            for file_path, _ in discovery:
+                if file_path in self.indexed_paths:
                     continue
+                discovered += 1
+                pbar.total = discovered
+                batch.append(Path(file_path))
+                if len(batch) >= self.batch_size:
+                    flush()
+            if batch:
+                flush()
+        discovery.commit()
+
+        self.logger.info(
+            f"Discovered {discovered} new files "
+            f"({discovery.directories_listed} directories listed, {discovery.directories_pruned} unchanged)"
+        )
+
+        # Retries and anything left over from an interrupted run
+        self.resume_pending(progress_callback=progress_callback, processed=completed, total=discovered)
 
-                for file_path in dir_path.rglob('*'):
-                    str_path = str(file_path)
-                    if (file_path.is_file() and 
-                        file_path.suffix.lower() in file_extensions and 
-                        str_path not in self.indexed_paths):
-                        files_to_process.append(file_path)
+        self.logger.info(f"Indexing complete. Total documents in collection: {self.collection.count()}")
+
+    def _index_batch(self, batch: List[Path]) -> Tuple[Set[str], List[str]]:
+        """
+        Embed one batch of files and upsert it into the collection.
+
+        Returns:
+            Tuple[Set[str], List[str]]: Paths written to the collection, and paths that failed
+        """
+        indexed = set()
+
+        # Process the batch in parallel
+        errors: Dict[str, str] = {}
+        processed_items = self._process_files_parallel(batch, errors)
+
+        if processed_items:
+            try:
+                # Drop every chunk of re-indexed files; the new version may have fewer
+                stale = list({item['document'] for item in processed_items} & self.indexed_paths)
+                if stale:
+                    self._delete_records(stale, replacing=True)
+
+                # Add batch to the vector store, replacing stale records for modified files
+                with timed('collection_upsert'):
+                    self.collection.upsert(
+                        embeddings=np.stack([item['embedding'] for item in processed_items]),
+                        documents=[item['document'] for item in processed_items],
+                        metadatas=[item['metadata'] for item in processed_items],
+                        ids=[item['id'] for item in processed_items]
+                    )
+                self.metadata_index.upsert_many(self._first_chunks(processed_items))
+                if self.lexical_index is not None:
+                    self.lexical_index.upsert_many(
+                        (item['document'], item['metadata']['content_hash'], item['text'])
+                        for item in processed_items if item.get('text') is not None
+                    )
+                self.duplicate_index.upsert_many(
+                    (item['document'], item['phash'], item['metadata']['content_hash'])
+                    for item in processed_items if item.get('phash') is not None
+                )
+                self.index_version += 1
+
+                # Update indexed paths
+                self.indexed_paths.update(item['document'] for item in processed_items)
+                indexed.update(item['document'] for item in processed_items)
+                self.work_queue.mark_done({item['document'] for item in processed_items})
 
             except Exception as e:
-                continue
+                self.logger.error(f"Error adding batch to collection: {e}")
+                for item in processed_items:
+                    errors[item['document']] = str(e)
 
-        if not files_to_process:
-            return
+        failed = [str(path) for path in batch if str(path) not in indexed]
+        for path in batch:
+            counter = FILES_INDEXED if str(path) in indexed else FILES_FAILED
+            counter.inc(type=self._get_file_type(Path(path)))
+        self._record_failures(failed, errors)
+        return indexed, failed
 
-        total_files = len(files_to_process)
-        self.logger.info(f"Found {total_files} new files to index")
-        self.logger.info(f"Using {self.max_workers} worker threads")
+    def _index_files(self, files: List[Path], desc: str = "Indexing files",
+                     progress_callback: Optional[ProgressCallback] = None) -> Set[str]:
+        """
+        Embed files in parallel batches and upsert them into the collection.
+
+        Args:
+            files (List[Path]): Files to embed
+            desc (str): Label for the progress bar
+            progress_callback (Optional[ProgressCallback]): Called after every batch
+        Returns:
+            Set[str]: IDs of the files written to the collection
+        """
+        indexed = set()
+
+        with tqdm(total=len(files), desc=desc) as pbar:
+            for i in range(0, len(files), self.batch_size):
+                batch = files[i:i + self.batch_size]
+                with self.index_lock:
+                    batch_indexed, failed = self._index_batch(batch)
+                indexed |= batch_indexed
 
-        # Process files in parallel batches
-        with tqdm(total=total_files, desc="Indexing files") as pbar:
-            for i in range(0, total_files, self.batch_size):
-                batch = files_to_process[i:i + self.batch_size]
-                
-                # Process the batch in parallel
-                processed_items = self._process_files_parallel(batch)
-                
-                if processed_items:
-                    try:
-                        # Add batch to ChromaDB
-                        self.collection.add(
-                            embeddings=[item['embedding'] for item in processed_items],
-                            documents=[item['document'] for item in processed_items],
-                            metadatas=[item['metadata'] for item in processed_items],
-                            ids=[item['id'] for item in processed_items]
-                        )
-                        
-                        # Update indexed paths
-                        self.indexed_paths.update(item['document'] for item in processed_items)
-                        
-                    except Exception as e:
-                        self.logger.error(f"Error adding batch to collection: {e}")
-                
                 pbar.update(len(batch))
+                if progress_callback is not None:
+                    progress_callback(min(i + self.batch_size, len(files)), len(files), failed)
 
-        self.logger.info(f"Indexing complete. Total documents in collection: {self.collection.count()}")
+        return indexed
+
+    def _record_failures(self, failed: List[str], errors: Dict[str, str]):
+        """Schedule failed files for retry; files that disappeared are dropped from the queue"""
+        vanished = [path for path in failed if not os.path.exists(path)]
+        if vanished:
+            self.work_queue.remove(vanished)
+        retry = {path: errors.get(path, 'Unknown error') for path in failed if path not in vanished}
+        if retry:
+            self.work_queue.mark_failed(retry)
+
+    def resume_pending(self, progress_callback: Optional[ProgressCallback] = None,
+                       processed: int = 0, total: int = 0) -> Set[str]:
+        """
+        Index everything left in the work queue: files pending from this or an
+        interrupted earlier run, plus failed files whose retry backoff has expired.
+        Retries not yet due are left to a later job rather than waited for.
+
+        Args:
+            progress_callback (Optional[ProgressCallback]): Called after every batch
+            processed (int): Files already processed by the calling job, so its progress continues
+            total (int): Files already counted in the calling job's total
+        Returns:
+            Set[str]: IDs of the files written to the collection
+        """
+        indexed = set()
+        paths = self.work_queue.due()
+        while paths:
+            total += len(paths)
+            report = None
+            if progress_callback is not None:
+                def report(done, _, failed, start=processed, total=total):
+                    progress_callback(start + done, total, failed)
+            indexed |= self._index_files([Path(path) for path in paths], progress_callback=report)
+            processed += len(paths)
+            paths = self.work_queue.due()
+        return indexed
+
+    @staticmethod
+    def _file_signature(stat: os.stat_result) -> Dict[str, Any]:
+        """Metadata fields used to detect modified and moved files"""
+        return {
+            'timestamp': stat.st_mtime,
+            'size': stat.st_size,
+            'inode': stat.st_ino
+        }
+
+    @staticmethod
+    def _is_modified(metadata: Dict[str, Any], stat: os.stat_result) -> bool:
+        if metadata.get('timestamp') != stat.st_mtime:
+            return True
+        # Records indexed before size/inode were stored only carry a timestamp
+        if 'size' in metadata and metadata['size'] != stat.st_size:
+            return True
+        if 'inode' in metadata and metadata['inode'] != stat.st_ino:
+            return True
+        return False
+
+    def scan_files(self, directory: str, file_extensions: Set[str]) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Walk a directory tree, yielding supported files and their stat results.
+        Every directory is listed: callers need the complete set of files.
+        """
+        yield from FileDiscovery([directory], file_extensions)
+
+    def index_files(self, file_paths: List[str]) -> Set[str]:
+        """
+        Embed and upsert specific files, replacing any existing records.
+
+        Args:
+            file_paths (List[str]): Absolute paths of the files to index
+        Returns:
+            Set[str]: IDs of the files written to the collection
+        """
+        files = [Path(path) for path in file_paths if os.path.isfile(path)]
+        if not files:
+            return set()
+        self.work_queue.enqueue(str(path) for path in files)
+        return self._index_files(files, desc="Updating files")
+
+    def remove_files(self, file_paths: List[str]):
+        """Remove specific files from the index"""
+        try:
+            self._delete_ids([str(path) for path in file_paths])
+        except Exception as e:
+            self.logger.error(f"Error removing files from index: {e}")
+
+    def _delete_records(self, paths: List[str], chunk_size: int = 5000, replacing: bool = False):
+        """
+        Delete every record (all chunks) of the given files from the collection.
+        When `replacing`, the files are re-added right after, so their lexical
+        and duplicate index entries stay: those are only refreshed when the
+        content changed.
+        """
+        for i in range(0, len(paths), chunk_size):
+            with timed('collection_delete'):
+                self.collection.delete(where={'path': {'$in': paths[i:i + chunk_size]}})
+            self.metadata_index.remove(paths[i:i + chunk_size])
+            if not replacing:
+                if self.lexical_index is not None:
+                    self.lexical_index.remove(paths[i:i + chunk_size])
+                self.duplicate_index.remove(paths[i:i + chunk_size])
+            self.index_version += 1
+
+    def _delete_ids(self, ids: List[str], chunk_size: int = 5000):
+        """Delete files from the collection in bulk"""
+        with self.index_lock:
+            self._delete_records(ids, chunk_size)
+            self.indexed_paths.difference_update(ids)
+            self.work_queue.remove(ids)
+        # Their directories must be listed again to pick the files up if they come back
+        self.directory_state.invalidate({os.path.dirname(path) for path in ids})
+
+    def _apply_moves(self, moves: Dict[str, str], stats: Dict[str, os.stat_result]):
+        """Re-key stored embeddings (every chunk) for moved files without re-embedding them"""
+        new_path_by_old = {old_path: new_path for new_path, old_path in moves.items()}
+        old_ids = list(new_path_by_old)
+        stored = self.collection.get(where={'path': {'$in': old_ids}}, include=['embeddings', 'metadatas'])
+
+        ids, embeddings, metadatas = [], [], []
+        for embedding, metadata in zip(stored['embeddings'], stored['metadatas']):
+            new_path = new_path_by_old[metadata['path']]
+            file_path = Path(new_path)
+            ids.append(self._chunk_id(new_path, metadata.get('chunk', 0)))
+            embeddings.append(embedding)
+            metadatas.append({
+                **metadata,
+                'name': file_path.name,
+                'path': new_path,
+                **self._file_signature(stats[new_path]),
+                'type': self._get_file_type(file_path)
+            })
+
+        if ids:
+            documents = [metadata['path'] for metadata in metadatas]
+            self.collection.upsert(embeddings=np.asarray(embeddings), documents=documents, metadatas=metadatas, ids=ids)
+            self.metadata_index.upsert_many(self._first_chunks([
+                {'document': document, 'metadata': metadata} for document, metadata in zip(documents, metadatas)
+            ]))
+            self.indexed_paths.update(documents)
+            self.work_queue.mark_done(set(documents))
+            if self.lexical_index is not None:
+                self.lexical_index.move(moves)
+            self.duplicate_index.move(moves)
+        self._delete_ids(old_ids)
+
+    def reconcile_directories(self, directories: List[str], file_extensions: Optional[List[str]] = None,
+                              progress_callback: Optional[ProgressCallback] = None) -> Dict[str, int]:
+        """
+        Bring the index for the given directories in line with what is on disk.
+
+        New and modified files are (re-)embedded and upserted, moved files keep
+        their stored embedding under the new path, and files that no longer
+        exist are deleted in bulk.
+
+        Args:
+            directories (List[str]): Root directories to reconcile
+            file_extensions (Optional[List[str]]): Extensions to index
+            progress_callback (Optional[ProgressCallback]): Called after every embedded batch
+        Returns:
+            Dict[str, int]: Counts of added, updated, moved, removed, unchanged and failed files
+        """
+        if file_extensions is None:
+            file_extensions = list(self.image_extensions | self.text_extensions | self.pdf_extensions)
+        extensions = {ext.lower() for ext in file_extensions}
+
+        roots = []
+        for directory in directories:
+            root = str(Path(os.path.join(directory, '')).expanduser().resolve())
+            if os.path.isdir(root):
+                roots.append(os.path.join(root, ''))
+
+        counts = {'added': 0, 'updated': 0, 'moved': 0, 'removed': 0, 'unchanged': 0, 'failed': 0}
+        if not roots:
+            return counts
+
+        # Stored files under the roots (first chunk only)
+        stored = {}
+        for root in roots:
+            stored.update(self.metadata_index.files_with_prefix(root))
+
+        # Current state on disk
+        on_disk = {}
+        for root in roots:
+            for path, stat in self.scan_files(root, extensions):
+                on_disk[path] = stat
+
+        new_files, modified_files = [], []
+        for path, stat in on_disk.items():
+            metadata = stored.get(path)
+            if metadata is None:
+                new_files.append(path)
+            elif self._is_modified(metadata, stat):
+                modified_files.append(path)
+            else:
+                counts['unchanged'] += 1
+        vanished = [record_id for record_id in stored if record_id not in on_disk]
+
+        # A vanished record with the same inode, size and mtime as a new file was moved
+        vanished_by_signature = {
+            (stored[record_id]['inode'], stored[record_id].get('size'), stored[record_id]['timestamp']): record_id
+            for record_id in vanished if 'inode' in stored[record_id]
+        }
+        moves = {}
+        for path in new_files:
+            stat = on_disk[path]
+            old_id = vanished_by_signature.pop((stat.st_ino, stat.st_size, stat.st_mtime), None)
+            if old_id is not None:
+                moves[path] = old_id
+
+        try:
+            if moves:
+                with self.index_lock:
+                    self._apply_moves(moves, on_disk)
+                counts['moved'] = len(moves)
+
+            moved_ids = set(moves.values())
+            removed = [record_id for record_id in vanished if record_id not in moved_ids]
+            if removed:
+                self._delete_ids(removed)
+                counts['removed'] = len(removed)
+        except Exception as e:
+            self.logger.error(f"Error updating collection during reconcile: {e}")
+
+        new_files = [path for path in new_files if path not in moves]
+        to_embed = [Path(path) for path in modified_files + new_files]
+        if to_embed:
+            self.logger.info(f"Re-embedding {len(modified_files)} modified and {len(new_files)} new files")
+            self.work_queue.enqueue(str(path) for path in to_embed)
+            indexed = self._index_files(to_embed, desc="Reconciling files", progress_callback=progress_callback)
+            counts['added'] = sum(1 for path in new_files if path in indexed)
+            counts['updated'] = sum(1 for path in modified_files if path in indexed)
+            counts['failed'] = len(to_embed) - len(indexed)
+
+        self.logger.info(f"Reconcile complete: {counts}")
+        return counts
 
     def _add_to_collection(self, file_path: Path, embedding: np.ndarray):
         """Add a file and its embedding to the collection"""
         try:
-            # Update file type detection to include PDFs
-            suffix = file_path.suffix.lower()
-            if suffix in self.image_extensions:
-                file_type = 'image'
-            elif suffix in self.pdf_extensions:
-                file_type = 'pdf'
-            else:
-                file_type = 'text'
+            file_type = self._get_file_type(file_path)
+            metadata = {
+                'name': file_path.name,
+                'path': str(file_path),
+                'timestamp': file_path.stat().st_mtime,
+                'type': file_type
+            }
             
-            # Add document to ChromaDB
+            # Add document to the vector store
             self.collection.add(
-                embeddings=[embedding.tolist()],
+                embeddings=embedding[np.newaxis],
                 documents=[str(file_path)],
-                metadatas=[{
-                    'name': file_path.name,
-                    'path': str(file_path),
-                    'timestamp': file_path.stat().st_mtime,
-                    'type': file_type
-                }],
+                metadatas=[metadata],
                 ids=[str(file_path)]
             )
+            self.metadata_index.upsert_many([(metadata, 1)])
+            self.index_version += 1
             
             # Add to indexed paths
             self.indexed_paths.add(str(file_path))
+            self.work_queue.mark_done([str(file_path)])
             
         except Exception as e:
             self.logger.error(f"Failed to add {file_path} to collection: {e}")
 
     def remove_path(self, path: str):
         """Remove a path and all its files from the index"""
+        self.directory_state.invalidate_prefix(path)
         try:
-            # Get all documents that start with this path
-            results = self.collection.get()
-            if not results['metadatas']:
-                return
-
-            # Find IDs to remove
-            ids_to_remove = []
-            paths_to_remove = set()
-            for i, metadata in enumerate(results['metadatas']):
-                if metadata['path'].startswith(path):
-                    ids_to_remove.append(results['ids'][i])
-                    paths_to_remove.add(metadata['path'])
-
-            if ids_to_remove:
-                self.collection.delete(ids=ids_to_remove)
+            # Files whose path starts with this path
+            paths_to_remove = self.metadata_index.paths_with_prefix(path)
+
+            if paths_to_remove:
+                self._delete_records(paths_to_remove)
                 # Update indexed paths
-                self.indexed_paths -= paths_to_remove
-                print(f"Removed {len(ids_to_remove)} files from index for path: {path}")
+                self.indexed_paths.difference_update(paths_to_remove)
+                self.work_queue.remove(paths_to_remove)
+                print(f"Removed {len(paths_to_remove)} files from index for path: {path}")
             
         except Exception as e:
             print(f"Error removing path {path}: {e}")
 
+    def _sharded_store(self) -> ShardedVectorStore:
+        if not isinstance(self.collection, ShardedVectorStore):
+            raise ValueError("This index isn't sharded")
+        return self.collection
+
+    def _shard_paths(self, name: str) -> List[str]:
+        store = self._sharded_store()
+        return [path for path in self.metadata_index.paths() if store.shard_for(path) == name]
+
+    def list_shards(self) -> List[Dict[str, Any]]:
+        """Shards of a sharded index with the number of files in each"""
+        store = self._sharded_store()
+        counts: Dict[str, int] = {}
+        for path in self.metadata_index.paths():
+            name = store.shard_for(path)
+            counts[name] = counts.get(name, 0) + 1
+        return [{**entry, 'files': counts.get(entry['name'], 0)} for entry in store.shards()]
+
+    def add_shard(self, root: str) -> str:
+        """
+        Give a root directory its own shard (root-sharded index). Indexed
+        files under it move there with their stored vectors.
+
+        Returns:
+            str: Name of the new shard
+        """
+        root = os.path.join(str(Path(root).expanduser().resolve()), '')
+        store = self._sharded_store()
+        with self.index_lock:
+            name = store.add_shard(root, self.metadata_index.paths_with_prefix(root))
+            self.index_version += 1
+        self.logger.info(f"Added shard {name} for {root}")
+        return name
+
+    def drop_shard(self, name: str) -> int:
+        """
+        Remove a shard and every file in it from the index (root-sharded index).
+
+        Returns:
+            int: Number of files removed
+        """
+        store = self._sharded_store()
+        with self.index_lock:
+            paths = self._shard_paths(name)
+            self._delete_ids(paths)
+            store.drop_shard(name)
+        self.logger.info(f"Dropped shard {name} with {len(paths)} files")
+        return len(paths)
+
+    def reindex_shard(self, name: str, progress_callback: Optional[ProgressCallback] = None) -> Set[str]:
+        """
+        Rebuild one shard from scratch while the others keep serving: its
+        store is emptied and its files that still exist are indexed again
+        (embeddings come from the cache where the content is unchanged).
+
+        Returns:
+            Set[str]: IDs of the files written to the shard
+        """
+        store = self._sharded_store()
+        with self.index_lock:
+            paths = self._shard_paths(name)
+            store.reset_shard(name)
+            self._delete_ids(paths)
+        existing = [Path(path) for path in paths if os.path.exists(path)]
+        self.work_queue.enqueue(str(path) for path in existing)
+        return self._index_files(existing, desc=f"Re-indexing shard {name}", progress_callback=progress_callback)
+
     def _is_file_indexed(self, file_path: str) -> bool:
         """Check if a file is already indexed based on its path."""
         try:
-            result = self.collection.get(ids=[str(file_path)])
-            return len(result['ids']) > 0
+            return self.metadata_index.contains(str(file_path))
         except:
             return False
 
     def get_directories(self):
         """Get a list of all indexed directories"""
-        results = self.collection.get()
-        if not results['metadatas']:
-            return []
-        
-        # Extract unique directories from metadata
-        directories = set()
-        for metadata in results['metadatas']:
-            directory = os.path.dirname(metadata['path'])
-            directories.add(directory)
-        
-        return list(directories)
+        return self.metadata_index.directories()
 
     def get_files_in_directory(self, directory):
         """Get all indexed files in a specific directory"""
-        results = self.collection.get()
-        if not results['metadatas']:
-            return []
-        
         files = []
-        for metadata in results['metadatas']:
-            if directory in metadata['path']:
-                files.append({
-                    'name': metadata['name'],
-                    'type': metadata['type'],
-                    'relative_path': os.path.relpath(metadata['path'], directory),
-                    'path': metadata['path']
-                })
+        for path, metadata in self.metadata_index.files_with_prefix(os.path.join(directory, '')).items():
+            files.append({
+                'name': metadata['name'],
+                'type': metadata['type'],
+                'relative_path': os.path.relpath(path, directory),
+                'path': path
+            })
         return files
 
-    def search(self, query: str, limit: int = 5) -> list:
+    def search(self, query: str, limit: int = 5, filters: Optional[SearchFilters] = None,
+               offset: int = 0, collapse_duplicates: bool = False) -> list:
         """
         Search for files matching the query using CLIP text embeddings.
+
+        Args:
+            query (str): Search text
+            limit (int): Maximum number of results
+            filters (Optional[SearchFilters]): Restrict results by type, directory, mtime and size
+            offset (int): Number of top results to skip
+            collapse_duplicates (bool): Fold identical files and near-duplicate images into the
+                best ranked one, listed under its 'duplicates'
         """
         try:
-            # Debug logging
-            self.logger.info(f"Searching for query: {query}")
-            self.logger.info(f"Collection count: {self.collection.count()}")
-
-            # Get text embedding for the query
-            query_embedding = get_text_embedding(query)
-            
-            # Search ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=min(limit, self.collection.count()),
-                include=["metadatas", "distances", "documents"]
-            )
-            
-            # Format results
-            formatted_results = []
-            if results and results['ids'] and len(results['ids'][0]) > 0:
-                for i in range(len(results['ids'][0])):
-                    metadata = results['metadatas'][0][i]
-                    distance = float(results['distances'][0][i])
-                    similarity = 1.0 - distance
-                    
-                    formatted_results.append({
-                        'path': metadata['path'],
-                        'name': metadata['name'],
-                        'type': metadata['type'],
-                        'similarity': round(similarity, 4)
-                    })
-                
-                # Sort by similarity (highest first)
-                formatted_results.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return formatted_results
-            
+            return self.search_page(query, limit, filters, offset, collapse_duplicates=collapse_duplicates)['results']
         except Exception as e:
             self.logger.error(f"Search error: {str(e)}")
             return []
 
+    def search_page(self, query: str, limit: int = 5, filters: Optional[SearchFilters] = None,
+                    offset: int = 0, cursor: Optional[str] = None,
+                    collapse_duplicates: bool = False) -> Dict[str, Any]:
+        """
+        One page of search results. Pages after the first extend the ranking
+        kept for the search instead of recomputing it; pass the returned
+        cursor to continue from the same ranking.
+
+        Args:
+            cursor (Optional[str]): `nextCursor` of the previous page; overrides offset
+
+        Returns:
+            Dict[str, Any]: 'results', their 'offset', and 'nextCursor' (None on the last page)
+        """
+        filters = filters or SearchFilters()
+        token = None
+        if cursor:
+            token, offset = ResultPages.parse_cursor(cursor)
+        if limit <= 0 or offset < 0:
+            raise ValueError("limit must be positive and offset non-negative")
+
+        key = (normalize_query(query), filters, collapse_duplicates, self.index_version)
+        token, session = self.result_pages.session(key, token)
+        with session['lock']:
+            results = self._extend_ranking(query, filters, session, offset + limit, collapse_duplicates)
+            session['served'] = max(session['served'], min(offset + limit, len(results)))
+
+        page = results[offset:offset + limit]
+        more = offset + limit < len(results) or not session['exhausted']
+        return {
+            'results': page,
+            'offset': offset,
+            'nextCursor': ResultPages.make_cursor(token, offset + limit) if page and more else None
+        }
+
+    def _extend_ranking(self, query: str, filters: SearchFilters, session: Dict[str, Any], depth: int,
+                        collapse_duplicates: bool = False) -> list:
+        """Rank at least `depth` files for a search session, keeping the results already served in place"""
+        ranked = session['results']
+        if len(ranked) >= depth or session['exhausted']:
+            return ranked
+        # Grow geometrically so paging through n results costs O(log n) queries
+        depth = max(depth, 2 * len(ranked))
+
+        self.logger.info(f"Searching for query: {query} (depth {depth})")
+        deeper, exhausted = self._rank_many([query], depth, filters, collapse_duplicates)[0]
+
+        # A deeper query can reorder the head slightly (ANN, re-ranking); pages
+        # already returned must not change or results would repeat or vanish
+        served = ranked[:session['served']]
+        served_paths = {result['path'] for result in served}
+        ranked = served + [result for result in deeper if result['path'] not in served_paths]
+        session['results'] = ranked
+        session['exhausted'] = exhausted
+        return ranked
+
+    def search_many(self, queries: List[str], limit: int = 5, filters: Optional[SearchFilters] = None,
+                    collapse_duplicates: bool = False) -> List[list]:
+        """
+        Search for several queries at once: every query needing the text
+        model is encoded in one batched call and the collection is queried
+        once for all of them.
+
+        Returns:
+            List[list]: Results of each query, in order
+        """
+        if not queries:
+            return []
+        unique = list(dict.fromkeys(queries))
+        ranked = dict(zip(unique, self._rank_many(unique, limit, filters, collapse_duplicates, batch_request=True)))
+        return [ranked[query][0] for query in queries]
+
+    def _rank_many(self, queries: List[str], depth: int, filters: Optional[SearchFilters] = None,
+                   collapse_duplicates: bool = False, batch_request: bool = False) -> List[Tuple[list, bool]]:
+        """
+        Top `depth` files of each query, fusing vector and BM25 rankings.
+        Queries are encoded through the query batcher, so concurrent searches
+        share model calls, unless `batch_request` (a /search/batch call,
+        already one batch of its own).
+
+        Returns:
+            List[Tuple[list, bool]]: Per query, the results and whether fewer than `depth` exist
+        """
+        if collapse_duplicates:
+            ranked = self._rank_many(queries, depth * COLLAPSE_OVERSAMPLE, filters, batch_request=batch_request)
+            return [(self._collapse_duplicates(results)[:depth], exhausted) for results, exhausted in ranked]
+
+        # Identifiers, file names and quoted phrases: files containing the exact
+        # phrase answer without the text model; without one, fuse as usual
+        exact = [self._lexical_results(query, depth, filters, phrase=True) if is_exact_query(query) else []
+                 for query in queries]
+        lexical = [exact[i] or self._lexical_results(query, depth, filters) for i, query in enumerate(queries)]
+        semantic_queries = [i for i in range(len(queries)) if not exact[i]]
+
+        semantic: Dict[int, list] = {}
+        if semantic_queries:
+            texts = [queries[i] for i in semantic_queries]
+            with timed('query_encode'):
+                if len(texts) == 1:
+                    query_embeddings = self.embed_query(texts[0])[np.newaxis]
+                else:
+                    query_embeddings = self.embed_queries(texts, direct=batch_request)
+            if self.rerank_model is None:
+                hits = self._query_files_many(query_embeddings, depth, filters)
+            else:
+                candidates = self._query_files_many(query_embeddings, depth * RERANK_CANDIDATES, filters)
+                with timed('rerank'):
+                    hits = self._rerank_many(texts, candidates, depth)
+            semantic = dict(zip(semantic_queries, hits))
+
+        ranked = []
+        for i in range(len(queries)):
+            if i not in semantic:
+                ranked.append((lexical[i], len(lexical[i]) < depth))
+            elif lexical[i]:
+                fused = reciprocal_rank_fusion([semantic[i], lexical[i]])[:depth]
+                ranked.append((fused, len(semantic[i]) < depth and len(lexical[i]) < depth))
+            else:
+                ranked.append((semantic[i], len(semantic[i]) < depth))
+        return ranked
+
+    def stored_embedding(self, path_or_id: str) -> Optional[np.ndarray]:
+        """
+        Stored vector of an indexed file, averaged over its chunks, or of a
+        single chunk given its record ID ('path#n'). None if not indexed.
+        """
+        if path_or_id in self.indexed_paths:
+            stored = self.collection.get(where={'path': path_or_id}, include=['embeddings'])
+        else:
+            stored = self.collection.get(ids=[path_or_id], include=['embeddings'])
+        if not stored['ids']:
+            return None
+        vector = np.asarray(stored['embeddings'], dtype=np.float32).mean(axis=0)
+        return vector / np.linalg.norm(vector)
+
+    def search_similar(self, path_or_id: str, limit: int = 5, filters: Optional[SearchFilters] = None,
+                       collapse_duplicates: bool = False) -> list:
+        """
+        Files similar to an indexed file or chunk ("more like this"). The
+        stored vector is the query, so no model runs.
+
+        Raises:
+            ValueError: The file or chunk isn't indexed
+        """
+        with timed('similar_lookup'):
+            query_embedding = self.stored_embedding(path_or_id)
+        if query_embedding is None:
+            raise ValueError(f"Not indexed: {path_or_id}")
+        source = path_or_id if path_or_id in self.indexed_paths else path_or_id.rpartition('#')[0]
+        return self._vector_search(query_embedding, limit, filters, collapse_duplicates, exclude=source)
+
+    def search_by_image(self, data: bytes, limit: int = 5, filters: Optional[SearchFilters] = None,
+                        collapse_duplicates: bool = False) -> list:
+        """
+        Files similar to an uploaded image. Images arriving concurrently are
+        embedded together in one batch through the image tower.
+
+        Raises:
+            ValueError: The data isn't a readable image
+        """
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                pixel_values = self.model.preprocess_image(image)
+        except Exception as e:
+            raise ValueError(f"Error processing image: {e}")
+        with timed('image_query_encode'):
+            query_embedding = self.image_query_batcher.encode(_ImageQuery(data, pixel_values))
+        return self._vector_search(query_embedding, limit, filters, collapse_duplicates)
+
+    def _vector_search(self, query_embedding: np.ndarray, limit: int, filters: Optional[SearchFilters] = None,
+                       collapse_duplicates: bool = False, exclude: Optional[str] = None) -> list:
+        """Nearest files to a vector, leaving out `exclude`"""
+        depth = limit + (1 if exclude else 0)
+        if collapse_duplicates:
+            depth *= COLLAPSE_OVERSAMPLE
+        results = [result for result in self._query_files(query_embedding, depth, filters) if result['path'] != exclude]
+        if collapse_duplicates:
+            results = self._collapse_duplicates(results)
+        return results[:limit]
+
+    def find_duplicates(self, prefix: str = '', radius: int = DUPLICATE_RADIUS) -> List[Dict[str, Any]]:
+        """
+        Groups of duplicate files under a path prefix, largest first: files
+        with identical content ('exact') and images whose perceptual hashes
+        are within `radius` bits, directly or through a chain ('near').
+        """
+        digests = {
+            path: metadata.get('content_hash')
+            for path, metadata in self.metadata_index.files_with_prefix(prefix).items()
+        }
+        clusters = []
+        clustered = set()
+        for paths in self.duplicate_index.clusters(radius, prefix):
+            exact = digests.get(paths[0]) and all(digests.get(path) == digests[paths[0]] for path in paths)
+            clusters.append({'kind': 'exact' if exact else 'near', 'paths': paths})
+            clustered.update(paths)
+
+        # Identical non-image files, and identical images the perceptual index hasn't hashed yet
+        by_digest: Dict[str, List[str]] = {}
+        for path, digest in digests.items():
+            if digest and path not in clustered:
+                by_digest.setdefault(digest, []).append(path)
+        clusters.extend({'kind': 'exact', 'paths': sorted(paths)} for paths in by_digest.values() if len(paths) > 1)
+        return sorted(clusters, key=lambda cluster: len(cluster['paths']), reverse=True)
+
+    def _collapse_duplicates(self, results: list, radius: int = DUPLICATE_RADIUS) -> list:
+        """
+        Keep the best ranked file of every group of identical files (same
+        content hash) or near-duplicate images (perceptual hashes within
+        `radius` bits); the others are listed under its 'duplicates'.
+        """
+        kept, kept_hashes = [], []
+        for result in results:
+            phash = self.duplicate_index.get(result['path']) if result.get('type') == 'image' else None
+            for representative, representative_hash in zip(kept, kept_hashes):
+                same_content = result.get('content_hash') and result['content_hash'] == representative.get('content_hash')
+                similar = phash is not None and representative_hash is not None and hamming(phash, representative_hash) <= radius
+                if same_content or similar:
+                    representative['duplicates'].append(result['path'])
+                    break
+            else:
+                kept.append({**result, 'duplicates': []})
+                kept_hashes.append(phash)
+        return kept
+
+    def _lexical_results(self, query: str, limit: int, filters: Optional[SearchFilters] = None,
+                         phrase: bool = False) -> list:
+        """
+        BM25 matches of a query, in the same shape as vector results. Their
+        similarity is the BM25 score relative to the best match. With
+        `phrase`, only files containing the query's words in order match.
+        """
+        if self.lexical_index is None:
+            return []
+        filtered = filters is not None and not filters.is_empty()
+        with timed('lexical_query'):
+            hits = self.lexical_index.search(query, limit * SEARCH_OVERSAMPLE if filtered else limit, phrase)
+        if not hits:
+            return []
+        metadata_by_path = self.metadata_index.get_many(path for path, _ in hits)
+        top_score = hits[0][1] or 1.0
+
+        results = []
+        for path, score in hits:
+            metadata = metadata_by_path.get(path)
+            if metadata is None or (filtered and not filters.matches(metadata)):
+                continue
+            results.append({
+                'path': path,
+                'name': metadata['name'],
+                'type': metadata['type'],
+                'similarity': round(score / top_score, 4),
+                'chunk': 0,
+                'page': None,
+                'offset': None,
+                'content_hash': metadata.get('content_hash')
+            })
+        return results[:limit]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Text embedding of a search query, from the query cache when possible"""
+        embedding = self.query_cache.get(query)
+        if embedding is None:
+            embedding = self.query_batcher.encode(query)
+            self.query_cache.put(query, embedding)
+        return embedding
+
+    def embed_queries(self, queries: List[str], direct: bool = False) -> np.ndarray:
+        """
+        Text embeddings of several queries, from the query cache when possible.
+
+        Args:
+            queries (List[str]): Queries to embed
+            direct (bool): Encode cache misses in one model call of their own
+                rather than through the query batcher
+
+        Returns:
+            np.ndarray: (N, D) embeddings, in order
+        """
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+        if missing:
+            if direct and len(missing) > 1:
+                vectors = self.model.get_text_embeddings(missing, self.inference_batch_size, interactive=True)
+            else:
+                vectors = self.query_batcher.encode_many(missing)
+            encoded = dict(zip(missing, vectors))
+            for query in missing:
+                self.query_cache.put(query, encoded[query])
+            embeddings = [encoded[query] if embedding is None else embedding
+                          for query, embedding in zip(queries, embeddings)]
+        return np.stack(embeddings)
+
+    def _compile_filters(self, filters: Optional[SearchFilters]) -> Tuple[Optional[Dict[str, Any]], bool, Optional[int]]:
+        """
+        Translate filters into a Chroma where clause. A directory prefix is
+        resolved through the metadata index into a path list when it is small
+        enough; otherwise hits are checked against the filters afterwards.
+
+        Returns:
+            Tuple: (where clause, whether hits need post-filtering,
+            upper bound on matching files or None if unknown)
+        """
+        if filters is None or filters.is_empty():
+            return None, False, None
+        where = filters.where()
+        if filters.directory is None:
+            return where, False, None
+        paths = self.metadata_index.paths_with_prefix(filters.directory)
+        if len(paths) > MAX_PATH_FILTER:
+            return where, True, len(paths)
+        return combine_where(where, {'path': {'$in': paths}}), False, len(paths)
+
+    def _query_files(self, query_embedding: np.ndarray, limit: int,
+                     filters: Optional[SearchFilters] = None) -> list:
+        """
+        Query the collection and collapse chunk hits into one result per file,
+        scored by its best matching chunk.
+        """
+        return self._query_files_many(query_embedding[np.newaxis], limit, filters)[0]
+
+    def _query_files_many(self, query_embeddings: np.ndarray, limit: int,
+                          filters: Optional[SearchFilters] = None) -> List[list]:
+        """Top files for each of several query embeddings, in one collection query per widening step"""
+        total = self.collection.count()
+        where, post_filter, matching_files = self._compile_filters(filters)
+        if total == 0 or limit <= 0 or matching_files == 0:
+            return [[] for _ in query_embeddings]
+        n_results = min(limit * SEARCH_OVERSAMPLE, total)
+
+        best = [{} for _ in query_embeddings]
+        pending = list(range(len(query_embeddings)))
+        while pending:
+            # Search the vector store
+            with timed('vector_query'):
+                results = self.collection.query(
+                    query_embeddings=query_embeddings[pending],
+                    n_results=n_results,
+                    where=where,
+                    include=["metadatas", "distances"]
+                )
+
+            widen = []
+            for row, i in enumerate(pending):
+                metadatas, distances = results['metadatas'][row], results['distances'][row]
+                best[i] = self._best_chunk_per_file(metadatas, distances, filters if post_filter else None)
+                # Many chunks of a few files (or hits removed by post-filtering) can
+                # crowd out other files; widen the query until the filtered set runs out
+                if len(best[i]) < limit and n_results < total and len(metadatas) >= n_results:
+                    widen.append(i)
+            pending = widen
+            n_results = min(n_results * 2, total)
+
+        # Sort by similarity (highest first)
+        return [sorted(hits.values(), key=lambda x: x['similarity'], reverse=True)[:limit] for hits in best]
+
+    @staticmethod
+    def _best_chunk_per_file(metadatas: List[Dict[str, Any]], distances: List[float],
+                             filters: Optional[SearchFilters] = None) -> Dict[str, Dict[str, Any]]:
+        """Keep the best chunk per file; hits come back best first"""
+        best_by_path = {}
+        for metadata, distance in zip(metadatas, distances):
+            if metadata['path'] in best_by_path:
+                continue
+            if filters is not None and not filters.matches(metadata):
+                continue
+            similarity = 1.0 - float(distance)
+
+            best_by_path[metadata['path']] = {
+                'path': metadata['path'],
+                'name': metadata['name'],
+                'type': metadata['type'],
+                'similarity': round(similarity, 4),
+                'chunk': metadata.get('chunk', 0),
+                'page': metadata.get('page'),
+                'offset': metadata.get('offset'),
+                'content_hash': metadata.get('content_hash')
+            }
+        return best_by_path
+
+    def _rerank_embeddings(self, candidates: List[Dict[str, Any]]) -> Dict[str, Tuple[np.ndarray, Optional[List]]]:
+        """
+        Re-rank model embeddings and chunk positions of candidate files, from
+        the re-rank cache or embedded now (and cached) on a miss.
+        """
+        embedded = {}
+        misses = []
+        for candidate in candidates:
+            cached = self.rerank_cache.get(candidate['content_hash']) if candidate.get('content_hash') else None
+            if cached is not None:
+                embedded[candidate['path']] = cached
+            else:
+                misses.append(candidate['path'])
+        if not misses:
+            return embedded
+
+        def prepare(path: str):
+            try:
+                return path, content_hash(path), self.rerank_model.prepare_file(path)
+            except Exception as e:
+                self.logger.error(f"Error preparing {path} for re-ranking: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            prepared = [result for result in executor.map(prepare, misses) if result is not None]
+        if not prepared:
+            return embedded
+
+        embeddings = self.rerank_model.embed_prepared(
+            [item for _, _, item in prepared], self.inference_batch_size, interactive=True
+        )
+        entries = []
+        for (path, digest, (kind, payload)), matrix in zip(prepared, embeddings):
+            positions = [(chunk.page, chunk.offset) for chunk in payload] if kind == 'text' else None
+            embedded[path] = (matrix, positions)
+            entries.append((digest, matrix, positions))
+        self.rerank_cache.put_many(entries)
+        return embedded
+
+    def _rerank(self, query: str, candidates: List[Dict[str, Any]], limit: int) -> list:
+        """Order candidate files by their best matching chunk under the re-rank model"""
+        return self._rerank_many([query], [candidates], limit)[0]
+
+    def _rerank_many(self, queries: List[str], candidate_lists: List[List[Dict[str, Any]]], limit: int) -> List[list]:
+        """Re-rank the candidates of several queries, embedding queries and files shared between them once"""
+        active = [i for i, candidates in enumerate(candidate_lists) if candidates]
+        if not active:
+            return [[] for _ in queries]
+
+        query_embeddings = {query: self.rerank_query_cache.get(query) for query in {queries[i] for i in active}}
+        missing = [query for query, embedding in query_embeddings.items() if embedding is None]
+        if missing:
+            for query, embedding in zip(missing, self.rerank_model.get_text_embeddings(missing, interactive=True)):
+                self.rerank_query_cache.put(query, embedding)
+                query_embeddings[query] = embedding
+
+        unique = {candidate['path']: candidate for i in active for candidate in candidate_lists[i]}
+        embedded = self._rerank_embeddings(list(unique.values()))
+        return [
+            self._order_by_rerank(query_embeddings[queries[i]], candidate_lists[i], embedded, limit) if candidate_lists[i] else []
+            for i in range(len(queries))
+        ]
+
+    @staticmethod
+    def _order_by_rerank(query_embedding: np.ndarray, candidates: List[Dict[str, Any]],
+                         embedded: Dict[str, Tuple[np.ndarray, Optional[List]]], limit: int) -> list:
+        reranked, unranked = [], []
+        for candidate in candidates:
+            if candidate['path'] not in embedded:
+                # Keep files the re-rank model couldn't read, after the re-ranked ones
+                unranked.append(candidate)
+                continue
+            matrix, positions = embedded[candidate['path']]
+            scores = matrix @ query_embedding
+            best = int(np.argmax(scores))
+            # Same scale as the collection's squared L2 distances between unit vectors
+            similarity = 1.0 - (2.0 - 2.0 * float(scores[best]))
+            page, offset = positions[best] if positions else (None, None)
+            reranked.append({
+                **candidate,
+                'similarity': round(similarity, 4),
+                'chunk': best,
+                'page': page,
+                'offset': offset
+            })
+
+        reranked.sort(key=lambda x: x['similarity'], reverse=True)
+        return (reranked + unranked)[:limit]
+
     def open_file(self, file_path: str) -> bool:
         """
         Open a file using the default system application.
@@ -350,8 +1518,28 @@ class FileIndexer:
 
     def __del__(self):
         """Cleanup when the indexer is destroyed"""
-        if hasattr(self, 'client'):
+        if getattr(self, '_decode_pool', None) is not None:
+            try:
+                self._decode_pool.close()
+            except:
+                pass
+        if hasattr(self, 'metadata_index'):
+            try:
+                self.metadata_index.close()
+            except:
+                pass
+        if hasattr(self, 'duplicate_index'):
+            try:
+                self.duplicate_index.close()
+            except:
+                pass
+        if getattr(self, 'lexical_index', None) is not None:
+            try:
+                self.lexical_index.close()
+            except:
+                pass
+        if hasattr(self, 'collection'):
             try:
-                self.client._system.close()
+                self.collection.close()
             except:
                 pass
@@ -0,0 +1,271 @@
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+import logging, queue, threading, time, uuid
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = {COMPLETED, FAILED, CANCELLED}
+
+# Kinds of work a job can run
+JOB_KINDS = {'index', 'reconcile', 'resume', 'reindex_shard'}
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback to abort a running job"""
+
+
+class Job:
+    """
+    A unit of indexing work run by the JobScheduler worker.
+
+    The indexer reports progress through `progress`, which is also where the
+    job blocks while paused and aborts once cancelled.
+    """
+
+    def __init__(self, kind: str, paths: List[str], extensions: Optional[List[str]] = None,
+                 requeue: Optional[Callable[['Job'], None]] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.paths = paths
+        self.extensions = extensions
+
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self.total = 0
+        self.processed = 0
+        self.failed = 0
+        self.errors = deque(maxlen=100)
+        self.result: Any = None
+
+        self._lock = threading.Lock()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._cancelled = False
+        # Set when the scheduler skipped the job because it was paused; resume() hands
+        # it back through `requeue`
+        self._requeue = requeue
+        self._parked = False
+        self._paused_at: Optional[float] = None
+        self._paused_seconds = 0.0
+        self._changed = threading.Condition(self._lock)
+
+    def _notify(self):
+        self._changed.notify_all()
+
+    def progress(self, processed: int, total: int, failed: List[str]):
+        """Progress callback handed to the indexer"""
+        with self._lock:
+            self.processed = processed
+            self.total = total
+            self.failed += len(failed)
+            self.errors.extend(f"Failed to index {path}" for path in failed)
+            self._notify()
+
+        # Block here while paused; the indexer resumes with the next batch
+        self._resume.wait()
+        if self._cancelled:
+            raise JobCancelled()
+
+    def pause(self) -> bool:
+        with self._lock:
+            if self.status not in (QUEUED, RUNNING):
+                return False
+            self._resume.clear()
+            self._paused_at = time.time()
+            self.status = PAUSED
+            self._notify()
+        return True
+
+    def resume(self) -> bool:
+        with self._lock:
+            if self.status != PAUSED:
+                return False
+            self._paused_seconds += time.time() - self._paused_at
+            self._paused_at = None
+            self.status = RUNNING if self.started_at is not None else QUEUED
+            self._resume.set()
+            self._notify()
+            parked, self._parked = self._parked, False
+        if parked and self._requeue is not None:
+            self._requeue(self)
+        return True
+
+    def cancel(self) -> bool:
+        with self._lock:
+            if self.status in FINISHED_STATES:
+                return False
+            self._cancelled = True
+            if self.started_at is None:
+                self.status = CANCELLED
+                self.finished_at = time.time()
+            self._resume.set()
+            self._notify()
+        return True
+
+    def wait_for_change(self, timeout: float):
+        """Block until the job reports progress or changes state"""
+        with self._lock:
+            self._changed.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable snapshot of the job including throughput and ETA"""
+        with self._lock:
+            now = self.finished_at or time.time()
+            elapsed = 0.0
+            if self.started_at is not None:
+                paused = self._paused_seconds
+                if self._paused_at is not None:
+                    paused += now - self._paused_at
+                elapsed = max(0.0, now - self.started_at - paused)
+
+            files_per_sec = self.processed / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, self.total - self.processed)
+            eta = remaining / files_per_sec if files_per_sec > 0 and self.status not in FINISHED_STATES else None
+
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'paths': self.paths,
+                'status': self.status,
+                'total': self.total,
+                'processed': self.processed,
+                'failed': self.failed,
+                'filesPerSec': round(files_per_sec, 2),
+                'etaSeconds': round(eta, 1) if eta is not None else None,
+                'elapsedSeconds': round(elapsed, 1),
+                'errors': list(self.errors),
+                'result': self.result,
+                'createdAt': self.created_at,
+                'startedAt': self.started_at,
+                'finishedAt': self.finished_at
+            }
+
+
+class JobScheduler:
+    """
+    Runs indexing jobs one at a time on a dedicated worker thread so HTTP
+    requests return immediately and searches keep being served.
+    """
+
+    def __init__(self, indexer, max_history: int = 50):
+        """
+        Args:
+            indexer (FileIndexer): Indexer the jobs run against
+            max_history (int): Number of finished jobs kept for status queries
+        """
+        self.indexer = indexer
+        self.max_history = max_history
+        self.jobs: Dict[str, Job] = {}
+        self._queue: 'queue.Queue[Optional[Job]]' = queue.Queue()
+        self._lock = threading.Lock()
+        # Queues a resume job once the next failed file's retry backoff expires
+        self._retry_timer: Optional[threading.Timer] = None
+        self._worker = threading.Thread(target=self._run, name='index-jobs', daemon=True)
+        self._worker.start()
+
+    def submit(self, kind: str, paths: List[str], extensions: Optional[List[str]] = None) -> Job:
+        """Queue a new job and return it"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job type: {kind}")
+
+        job = Job(kind, paths, extensions, requeue=self._queue.put)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self._queue.put(job)
+        logger.info(f"Queued {kind} job {job.id} for {len(paths)} paths")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status in FINISHED_STATES]
+        finished.sort(key=lambda job: job.created_at)
+        for job in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job.id]
+
+    def shutdown(self):
+        """Cancel outstanding jobs and stop the worker"""
+        with self._lock:
+            if self._retry_timer is not None:
+                self._retry_timer.cancel()
+        for job in self.list():
+            job.cancel()
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with job._lock:
+                if job._cancelled:
+                    continue
+                # A job paused while queued is set aside, so the jobs behind it
+                # (retries included) still run; resuming it queues it again
+                if job.status == PAUSED:
+                    job._parked = True
+                    continue
+                job.started_at = time.time()
+                job.status = RUNNING
+                job._notify()
+            self._execute(job)
+            self._schedule_retry()
+
+    def _schedule_retry(self):
+        """
+        Jobs don't wait out retry backoff, so failed files still to be retried
+        get a resume job of their own once the earliest is due.
+        """
+        wait = self.indexer.work_queue.next_retry_in()
+        if wait is None:
+            return
+        with self._lock:
+            if self._retry_timer is not None and self._retry_timer.is_alive():
+                return
+            self._retry_timer = threading.Timer(wait, self.submit, args=('resume', []))
+            self._retry_timer.daemon = True
+            self._retry_timer.start()
+
+    def _execute(self, job: Job):
+        try:
+            if job.kind == 'index':
+                self.indexer.index_directories(job.paths, job.extensions, progress_callback=job.progress)
+            elif job.kind == 'resume':
+                job.result = {'indexed': len(self.indexer.resume_pending(progress_callback=job.progress))}
+            elif job.kind == 'reindex_shard':
+                # paths holds the shard name
+                job.result = {'indexed': len(self.indexer.reindex_shard(job.paths[0], progress_callback=job.progress))}
+            else:
+                job.result = self.indexer.reconcile_directories(job.paths, job.extensions, progress_callback=job.progress)
+            status = COMPLETED
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.errors.append(str(e))
+            status = FAILED
+
+        with job._lock:
+            job.status = status
+            job.finished_at = time.time()
+            job._notify()
+        logger.info(f"Job {job.id} {status}")
@@ -0,0 +1,233 @@
+from chunking import Chunk, iter_pdf_pages, read_text_pages
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import os, re, sqlite3, threading
+
+# Column weights for BM25: a hit in the file name counts far more than one in the body
+NAME_WEIGHT = 4.0
+BODY_WEIGHT = 1.0
+PARTS_WEIGHT = 0.5
+
+# Constant of reciprocal rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+
+_WORD_PATTERN = re.compile(r'\w+')
+# Lower/upper case boundaries and letter/digit boundaries inside an identifier
+_CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+# Queries that name something exactly: quoted text, or a single token with
+# identifier or file name punctuation or camelCase. Digits alone don't count,
+# so '2019' or 'iphone 12' are still searched by meaning.
+_EXACT_QUERY_PATTERN = re.compile(r'^"[^"]+"$|^\S*(?:[_./\\:-]|[a-z][A-Z])\S*$')
+
+
+def identifier_parts(text: str) -> str:
+    """
+    Sub-words of the snake_case and camelCase identifiers in text, so a
+    query for 'embedding' also finds get_text_embedding and getTextEmbedding.
+    """
+    parts = []
+    for word in _WORD_PATTERN.findall(text):
+        pieces = [piece for segment in word.split('_') for piece in _CAMEL_PATTERN.findall(segment)]
+        if len(pieces) > 1:
+            parts.extend(pieces)
+    return ' '.join(parts)
+
+
+def chunks_text(chunks: Sequence[Chunk]) -> str:
+    """Text covered by a file's chunks, with the overlap between neighbouring chunks counted once"""
+    parts = []
+    for chunk, following in zip(chunks, list(chunks[1:]) + [None]):
+        if following is not None and following.page == chunk.page and following.offset > chunk.offset:
+            parts.append(chunk.text[:following.offset - chunk.offset])
+        else:
+            parts.append(chunk.text)
+    return ''.join(parts)
+
+
+def extract_text(file_path: str, file_type: str, max_chars: int) -> str:
+    """Up to `max_chars` characters of a 'text' or 'pdf' file; empty for images"""
+    if file_type == 'pdf':
+        pages = iter_pdf_pages(file_path)
+    elif file_type == 'text':
+        pages = read_text_pages(file_path, max_chars)
+    else:
+        return ''
+    parts, total = [], 0
+    for _, text in pages:
+        parts.append(text[:max_chars - total])
+        total += len(parts[-1])
+        if total >= max_chars:
+            break
+    return '\n'.join(parts)
+
+
+def fts_query(query: str, prefix: bool = True) -> Optional[str]:
+    """
+    FTS5 MATCH expression ORing the words of a query, each quoted so user
+    input can't inject FTS syntax. The last word also matches as a prefix
+    for type-ahead.
+    """
+    words = _WORD_PATTERN.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in dict.fromkeys(word.lower() for word in words)]
+    if prefix:
+        terms[-1] += '*'
+    return ' OR '.join(terms)
+
+
+def fts_phrase(query: str) -> Optional[str]:
+    """
+    FTS5 MATCH expression requiring the words of a query next to each other
+    in order, with no prefix matching: "annual report" matches only that
+    phrase, and t-shirt matches "t shirt". Words are \\w runs, so they can't
+    contain FTS syntax.
+    """
+    words = _WORD_PATTERN.findall(query)
+    if not words:
+        return None
+    return '"' + ' '.join(word.lower() for word in words) + '"'
+
+
+def is_exact_query(query: str) -> bool:
+    """Whether a query looks like an identifier, file name or quoted phrase rather than a description"""
+    return bool(_EXACT_QUERY_PATTERN.match(query.strip()))
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by reciprocal rank fusion: every file scores
+    the sum of 1 / (k + rank) over the lists it appears in. Rank-based, so
+    BM25 scores and cosine similarities never have to share a scale. The
+    first list's entry wins when a file is in several lists.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking):
+            path = result['path']
+            fused.setdefault(path, result)
+            scores[path] = scores.get(path, 0.0) + 1.0 / (k + rank + 1)
+    ordered = sorted(fused, key=lambda path: scores[path], reverse=True)
+    return [{**fused[path], 'score': round(scores[path], 6)} for path in ordered]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over file names and extracted text, using SQLite's
+    FTS5 extension in a file next to the Chroma data. Updated per indexing
+    batch alongside the collection. Tokens keep underscores, so identifiers
+    match whole, and their snake_case/camelCase parts are indexed in a
+    separate low-weight column.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+        Raises:
+            sqlite3.OperationalError: SQLite was built without FTS5
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # FTS5 has no index on its own columns; documents maps paths to its rowids
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                content_hash TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(
+                name, body, parts, tokenize = "unicode61 tokenchars '_'"
+            );
+        ''')
+        self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM documents LIMIT 1').fetchone() is None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def contains(self, path: str, digest: Optional[str] = None) -> bool:
+        """Whether a file is indexed, and with the given content hash if one is passed"""
+        with self._lock:
+            row = self._conn.execute('SELECT content_hash FROM documents WHERE path = ?', (path,)).fetchone()
+        return row is not None and (digest is None or row[0] == digest)
+
+
+    def _delete(self, paths: Iterable[str]):
+        for path in paths:
+            row = self._conn.execute('SELECT id FROM documents WHERE path = ?', (path,)).fetchone()
+            if row is not None:
+                self._conn.execute('DELETE FROM terms WHERE rowid = ?', row)
+                self._conn.execute('DELETE FROM documents WHERE id = ?', row)
+
+    def upsert_many(self, records: Iterable[Tuple[str, Optional[str], str]]):
+        """Index (path, content hash, text) for each file, replacing earlier versions"""
+        records = list(records)
+        if not records:
+            return
+        with self._lock, self._conn:
+            self._delete(path for path, _, _ in records)
+            for path, digest, text in records:
+                name = os.path.basename(path)
+                cursor = self._conn.execute(
+                    'INSERT INTO documents (path, content_hash) VALUES (?, ?)', (path, digest)
+                )
+                self._conn.execute(
+                    'INSERT INTO terms (rowid, name, body, parts) VALUES (?, ?, ?, ?)',
+                    (cursor.lastrowid, name, text, identifier_parts(f"{name} {text}"))
+                )
+
+    def remove(self, paths: Iterable[str]):
+        with self._lock, self._conn:
+            self._delete(paths)
+
+    def move(self, moves: Dict[str, str]):
+        """Re-key moved files (new path -> old path) without re-reading their text"""
+        with self._lock, self._conn:
+            self._delete(moves)
+            for new_path, old_path in moves.items():
+                row = self._conn.execute('SELECT id FROM documents WHERE path = ?', (old_path,)).fetchone()
+                if row is None:
+                    continue
+                name = os.path.basename(new_path)
+                body = self._conn.execute('SELECT body FROM terms WHERE rowid = ?', row).fetchone()[0]
+                self._conn.execute('UPDATE documents SET path = ? WHERE id = ?', (new_path, row[0]))
+                self._conn.execute(
+                    'UPDATE terms SET name = ?, parts = ? WHERE rowid = ?',
+                    (name, identifier_parts(f"{name} {body}"), row[0])
+                )
+
+    def search(self, query: str, limit: int, phrase: bool = False) -> List[Tuple[str, float]]:
+        """
+        Best matching files by BM25.
+
+        Args:
+            query (str): Search text
+            limit (int): Maximum number of files
+            phrase (bool): Match the query as one exact phrase instead of any of its words
+        Returns:
+            List[Tuple[str, float]]: (path, BM25 score) pairs, best first; higher is better
+        """
+        match = fts_phrase(query) if phrase else fts_query(query)
+        if match is None or limit <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                '''SELECT documents.path, bm25(terms, ?, ?, ?) AS rank FROM terms
+                   JOIN documents ON documents.id = terms.rowid
+                   WHERE terms MATCH ? ORDER BY rank LIMIT ?''',
+                (NAME_WEIGHT, BODY_WEIGHT, PARTS_WEIGHT, match, limit)
+            ).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best first
+        return [(path, -rank) for path, rank in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,137 @@
+from typing import Any, Dict, Iterable, List, Set, Tuple
+import json, os, sqlite3, threading
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    # Smallest string greater than every string starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class MetadataIndex:
+    """
+    Compact side index of the files in the collection: one row per file with
+    the metadata of its first chunk, kept in SQLite next to the Chroma data.
+    Paths are the primary key, so prefix lookups are B-tree range scans, and
+    per-directory file counts are maintained by triggers. Listing, prefix
+    deletes and reconcile read this instead of pulling every record out of
+    the collection.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                files INTEGER NOT NULL
+            );
+            CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+                INSERT INTO directories (path, files) VALUES (NEW.directory, 1)
+                    ON CONFLICT(path) DO UPDATE SET files = files + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+                UPDATE directories SET files = files - 1 WHERE path = OLD.directory;
+                DELETE FROM directories WHERE path = OLD.directory AND files <= 0;
+            END;
+        ''')
+        self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM files LIMIT 1').fetchone() is None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def upsert_many(self, records: Iterable[Tuple[Dict[str, Any], int]]):
+        """
+        Store (first chunk metadata, chunk count) for each file, replacing
+        earlier versions of the same paths.
+        """
+        rows = [
+            (metadata['path'], os.path.dirname(metadata['path']), metadata['name'],
+             metadata['type'], chunks, json.dumps(metadata))
+            for metadata, chunks in records
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            # An upsert (not INSERT OR REPLACE) keeps the directory counts exact
+            self._conn.executemany(
+                '''INSERT INTO files (path, directory, name, type, chunks, metadata) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET name = excluded.name, type = excluded.type,
+                       chunks = excluded.chunks, metadata = excluded.metadata''',
+                rows
+            )
+
+    def remove(self, paths: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM files WHERE path = ?', ((path,) for path in paths))
+
+    def contains(self, path: str) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM files WHERE path = ?', (path,)).fetchone() is not None
+
+    def get_many(self, paths: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """First chunk metadata of the given files that are indexed, by path"""
+        paths = list(paths)
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(paths), 500):
+                batch = paths[i:i + 500]
+                found.update(
+                    (path, json.loads(metadata)) for path, metadata in self._conn.execute(
+                        f"SELECT path, metadata FROM files WHERE path IN ({','.join('?' * len(batch))})", batch
+                    )
+                )
+        return found
+
+    def paths(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute('SELECT path FROM files')}
+
+    def paths_with_prefix(self, prefix: str) -> List[str]:
+        """Paths of all files whose path starts with prefix"""
+        if not prefix:
+            return sorted(self.paths())
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT path FROM files WHERE path >= ? AND path < ? ORDER BY path',
+                (prefix, _prefix_upper_bound(prefix))
+            )]
+
+    def files_with_prefix(self, prefix: str) -> Dict[str, Dict[str, Any]]:
+        """First chunk metadata of all files whose path starts with prefix, by path"""
+        if not prefix:
+            query, params = 'SELECT path, metadata FROM files', ()
+        else:
+            query = 'SELECT path, metadata FROM files WHERE path >= ? AND path < ? ORDER BY path'
+            params = (prefix, _prefix_upper_bound(prefix))
+        with self._lock:
+            return {path: json.loads(metadata) for path, metadata in self._conn.execute(query, params)}
+
+    def directories(self) -> List[str]:
+        """Every directory containing at least one indexed file"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT path FROM directories ORDER BY path')]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
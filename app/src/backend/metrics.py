@@ -0,0 +1,299 @@
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import math, os, sys, threading, time
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second model loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (usually seconds) in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: (count per bucket, sum, count)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total!r}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+class Gauge(_Metric):
+    """
+    Point-in-time value read by a callback on every scrape, so queue depths
+    and cache statistics are never stale and cost nothing between scrapes.
+    The callback returns a number, or a dict of label values to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, callback: Callable[[], GaugeValue], labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        value = self.callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labels, key)} {_format_value(v)}'
+            for key, v in sorted(value.items()) if v is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registering replaces the metric, e.g. gauges bound to a new indexer
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                lines.append(f'# {metric.name} unavailable: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def gauge(name: str, help: str, callback: Callable[[], GaugeValue], labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, callback, labels))
+
+
+# Shared hot-path instruments
+STAGE_SECONDS = histogram(
+    'fileseekr_stage_seconds', 'Time spent in each indexing and search stage', labels=('stage',)
+)
+FILES_INDEXED = counter('fileseekr_files_indexed_total', 'Files written to the index', labels=('type',))
+FILES_FAILED = counter('fileseekr_files_failed_total', 'Files that failed to index', labels=('type',))
+
+
+def timed(stage: str):
+    """Context manager recording the duration of a stage in STAGE_SECONDS"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that can be switched on and off at runtime. A
+    background thread samples the stack of every other thread at a fixed
+    interval and counts the folded stacks, which are cheap to collect and
+    can be fed straight to flame graph tools.
+
+    Stacks include line numbers, so a long run can see a great many distinct
+    ones. Past `max_stacks`, the rarest are folded into a single '[other]'
+    entry, which keeps memory bounded while the hot stacks stay exact.
+    """
+
+    OTHER = '[other]'
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64, max_stacks: int = 10000):
+        """
+        Args:
+            interval (float): Seconds between samples
+            max_depth (int): Frames kept per stack, innermost first
+            max_stacks (int): Distinct stacks kept; the table is trimmed back to this
+                size once it holds twice as many
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.samples: '_Tally[str]' = _Tally()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: Optional[float] = None, reset: bool = True):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if interval:
+                self.interval = interval
+            if reset:
+                self.samples.clear()
+                self.sample_count = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(names)))
+            with self._lock:
+                self.samples.update(stacks)
+                self.sample_count += 1
+                if len(self.samples) > 2 * self.max_stacks:
+                    self._fold_rare()
+
+    def _fold_rare(self):
+        """Keep the most frequent stacks and count the rest under '[other]'"""
+        other = self.samples.pop(self.OTHER, 0)
+        kept = self.samples.most_common(self.max_stacks - 1)
+        other += sum(self.samples.values()) - sum(count for _, count in kept)
+        self.samples = _Tally(dict(kept))
+        self.samples[self.OTHER] = other
+
+    def folded(self, limit: Optional[int] = None) -> str:
+        """Collected stacks in folded format: 'outer;...;inner count' per line, most frequent first"""
+        with self._lock:
+            items = self.samples.most_common(limit)
+        return '\n'.join(f'{stack} {count}' for stack, count in items) + '\n'
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'intervalSeconds': self.interval,
+                'samples': self.sample_count,
+                'stacks': len(self.samples),
+                'startedAt': self.started_at
+            }
+
+
+PROFILER = SamplingProfiler()
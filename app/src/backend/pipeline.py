@@ -0,0 +1,148 @@
+from concurrent.futures import ProcessPoolExecutor
+from embedding import get_model
+from multiprocessing import resource_tracker, shared_memory
+from thumbnails import ThumbnailCache, has_thumbnail, render_thumbnail
+from typing import Any, Optional, Tuple
+import logging, multiprocessing, os, queue, threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Worker-process state: the caller's shared memory, attached on a worker's first image
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_slots: Optional[np.ndarray] = None
+
+
+def _worker_buffer(shm_name: str, shape: Tuple[int, ...]) -> np.ndarray:
+    global _worker_shm, _worker_slots
+    if _worker_shm is None or _worker_shm.name != shm_name:
+        _worker_shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_slots = np.ndarray(shape, dtype=np.float32, buffer=_worker_shm.buf)
+    return _worker_slots
+
+
+def _prepare_in_worker(file_path: str, slot: int, shm_name: str, shape: Tuple[int, ...],
+                       model_name: Optional[str],
+                       thumbnail_size: Optional[Tuple[int, int]]) -> Tuple[str, Any, Optional[bytes]]:
+    """
+    Decode/parse a file in a worker process. Pixel values are written straight
+    into the caller's shared memory slot instead of being pickled back. The
+    thumbnail, if asked for, comes back as PNG bytes for the caller's cache.
+    """
+    thumbnail = None
+    if thumbnail_size is not None:
+        try:
+            thumbnail = render_thumbnail(file_path, thumbnail_size)
+        except Exception as e:
+            logger.debug(f"Thumbnail pre-generation failed for {file_path}: {e}")
+    # The processor loads on the worker's first file
+    kind, payload = get_model(model_name).prepare_file(file_path)
+    if kind == 'image':
+        _worker_buffer(shm_name, shape)[slot] = payload
+        return kind, None, thumbnail
+    return kind, payload, thumbnail
+
+
+def process_pool_supported() -> bool:
+    # Workers are forked so they don't re-run the server's module-level setup
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+class DecodePool:
+    """
+    Decode/parse stage running in worker processes, so PIL decoding, CLIP
+    preprocessing, PDF text extraction and thumbnail rendering are not
+    serialized on the GIL of the indexing process.
+
+    Preprocessed images come back through a shared memory buffer with one
+    slot per in-flight task; text chunks are small and are returned normally.
+
+    Workers are forked when the pool is created, so create it before the
+    process opens stores or starts threads: a fork copies locks held by
+    other threads (logging, SQLite, Chroma, the inference runtime) in their
+    locked state. Nothing is loaded up front; the CLIP processor and the
+    shared memory buffer are set up by the first file, so the forks are all
+    an idle pool costs.
+    """
+
+    def __init__(self, workers: int, slots: int):
+        """
+        Args:
+            workers (int): Number of worker processes, forked right away
+            slots (int): Shared memory slots; bounds the number of files decoded at once
+        """
+        self.workers = workers
+        self.slots = slots
+        self.shape: Optional[Tuple[int, ...]] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._slots: Optional[np.ndarray] = None
+        self._buffer_lock = threading.Lock()
+        self._free: 'queue.Queue[int]' = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+        # The buffer is created after the fork; workers must share this process's resource
+        # tracker, or one of their own would unlink it when the worker exits
+        resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+        # A fork context starts every worker on the first submit; do it now, while the
+        # caller still knows which threads exist, not later from an indexing thread
+        self._executor.submit(int).result()
+        logger.info(f"Started {workers} decode worker processes")
+
+    def _buffer(self, model_name: Optional[str]) -> np.ndarray:
+        """Shared memory for the pixel values, sized by the model of the first file"""
+        with self._buffer_lock:
+            if self._shm is None:
+                self.shape = (self.slots, *get_model(model_name).pixel_shape())
+                self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * 4)
+                self._slots = np.ndarray(self.shape, dtype=np.float32, buffer=self._shm.buf)
+            return self._slots
+
+    def prepare(self, file_path: str, model_name: Optional[str] = None,
+                thumbnail_cache: Optional[ThumbnailCache] = None) -> Tuple[str, Any]:
+        """
+        Decode/parse a file in a worker process; same result as prepare_file.
+        Blocks the calling thread until the worker is done.
+
+        Args:
+            file_path (str): File to decode
+            model_name (Optional[str]): Model whose preprocessing applies (default model when None);
+                one pool serves a single model
+            thumbnail_cache (Optional[ThumbnailCache]): Cache a missing thumbnail is rendered for.
+                The worker only renders it; this process stores it, so the cache's size
+                accounting and eviction stay in one place.
+        """
+        buffer = self._buffer(model_name)
+        stat, thumbnail_size = None, None
+        if thumbnail_cache is not None and has_thumbnail(file_path):
+            try:
+                stat = os.stat(file_path)
+                if thumbnail_cache.lookup(file_path, stat) is None:
+                    thumbnail_size = thumbnail_cache.max_size
+            except OSError:
+                pass
+
+        slot = self._free.get()
+        try:
+            kind, payload, thumbnail = self._executor.submit(
+                _prepare_in_worker, file_path, slot, self._shm.name, self.shape, model_name, thumbnail_size
+            ).result()
+            if thumbnail is not None:
+                try:
+                    thumbnail_cache.put(file_path, stat, thumbnail)
+                except OSError as e:
+                    logger.debug(f"Unable to store thumbnail of {file_path}: {e}")
+            if kind == 'image':
+                # Copy out so the slot can be reused right away
+                payload = buffer[slot].copy()
+            return kind, payload
+        finally:
+            self._free.put(slot)
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+        self._slots = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
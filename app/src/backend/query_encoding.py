@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import threading, time
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    # CLIP's tokenizer lowercases and collapses whitespace, so these all embed identically
+    return ' '.join(query.split()).lower()
+
+
+class QueryEmbeddingCache:
+    """
+    In-memory LRU cache of query embeddings. Type-ahead search repeats the
+    same prefixes constantly; a hit skips the text model entirely. Entries
+    expire after `ttl` seconds and the least recently used are evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0):
+        """
+        Args:
+            max_entries (int): Maximum number of cached queries
+            ttl (float): Seconds an entry stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, embedding: np.ndarray):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hitRate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class _PendingQuery:
+    __slots__ = ('text', 'ready', 'lead', 'result', 'error')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.ready = threading.Event()
+        self.lead = False
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryBatcher:
+    """
+    Coalesces query encodings from concurrent requests into one model call.
+
+    The first caller to arrive becomes the leader: it waits `max_wait`
+    seconds for others to join, then encodes every pending query in a single
+    batch while the rest block. Queries arriving during that call are picked
+    up by the next leader, promoted from among them, without waiting again.
+    A lone query only pays `max_wait` of extra latency.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray],
+                 max_wait: float = 0.005, max_batch: int = 32):
+        """
+        Args:
+            encode (Callable[[List[str]], np.ndarray]): Embeds a list of texts, returning (N, D).
+                Any hashable query type works; equal queries in a batch are embedded once
+            max_wait (float): Seconds the leader waits for concurrent queries
+            max_batch (int): Maximum queries per model call
+        """
+        self._encode = encode
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending: List[_PendingQuery] = []
+        self._leader_active = False
+        self.queries = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    def encode(self, text: str) -> np.ndarray:
+        """Embed one query, batched with any concurrent callers"""
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed several queries, batched with each other and any concurrent callers"""
+        items = [_PendingQuery(text) for text in texts]
+        if not items:
+            return []
+        with self._lock:
+            self._pending.extend(items)
+            # No leader means nothing is pending, so these items go in the first batch
+            if not self._leader_active:
+                self._leader_active = True
+                items[0].lead = True
+
+        if items[0].lead:
+            time.sleep(self.max_wait)
+            self._lead()
+        # Batches are taken in arrival order, so waiting on each item in turn
+        # sees every promotion of one of them to leader
+        for item in items:
+            item.ready.wait()
+            if item.lead:
+                # Promoted: the previous leader finished with queries still waiting
+                self._lead()
+
+        for item in items:
+            if item.error is not None:
+                raise item.error
+        return [item.result for item in items]
+
+    def _lead(self):
+        with self._lock:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:len(batch)]
+        self._run(batch)
+
+        with self._lock:
+            if not self._pending:
+                self._leader_active = False
+                return
+            successor = self._pending[0]
+        successor.lead = True
+        successor.ready.set()
+
+    def _run(self, batch: List[_PendingQuery]):
+        texts = list(dict.fromkeys(item.text for item in batch))
+        try:
+            embeddings = self._encode(texts)
+            by_text = dict(zip(texts, embeddings))
+            for item in batch:
+                item.result = by_text[item.text]
+        except Exception as e:
+            for item in batch:
+                item.error = e
+
+        with self._lock:
+            self.queries += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for item in batch:
+            item.lead = False
+            item.ready.set()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'queries': self.queries,
+                'batches': self.batches,
+                'largestBatch': self.largest_batch,
+                'meanBatchSize': round(self.queries / self.batches, 2) if self.batches else 0.0
+            }
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+import os, secrets, threading, time
+
+# Values of the 'type' metadata field
+FILE_TYPES = ('image', 'pdf', 'text')
+
+
+class SearchFilters(NamedTuple):
+    """Restrictions on which files a search may return; None means unrestricted"""
+    types: Optional[Tuple[str, ...]] = None
+    directory: Optional[str] = None         # Path prefix, with a trailing separator
+    modified_after: Optional[float] = None  # Inclusive, seconds since the epoch
+    modified_before: Optional[float] = None  # Exclusive
+    min_size: Optional[int] = None          # Bytes, inclusive
+    max_size: Optional[int] = None          # Bytes, inclusive
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self)
+
+    def where(self) -> Optional[Dict[str, Any]]:
+        """
+        Chroma `where` clause for the type, mtime and size filters. The
+        directory prefix has no Chroma operator; callers resolve it to paths.
+        """
+        clauses: List[Dict[str, Any]] = []
+        if self.types is not None:
+            clauses.append({'type': {'$in': list(self.types)}})
+        if self.modified_after is not None:
+            clauses.append({'timestamp': {'$gte': self.modified_after}})
+        if self.modified_before is not None:
+            clauses.append({'timestamp': {'$lt': self.modified_before}})
+        if self.min_size is not None:
+            clauses.append({'size': {'$gte': self.min_size}})
+        if self.max_size is not None:
+            clauses.append({'size': {'$lte': self.max_size}})
+        return combine_where(*clauses)
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """Whether a record's metadata passes every filter"""
+        if self.types is not None and metadata.get('type') not in self.types:
+            return False
+        if self.directory is not None and not metadata.get('path', '').startswith(self.directory):
+            return False
+        timestamp, size = metadata.get('timestamp'), metadata.get('size')
+        if self.modified_after is not None and (timestamp is None or timestamp < self.modified_after):
+            return False
+        if self.modified_before is not None and (timestamp is None or timestamp >= self.modified_before):
+            return False
+        if self.min_size is not None and (size is None or size < self.min_size):
+            return False
+        if self.max_size is not None and (size is None or size > self.max_size):
+            return False
+        return True
+
+
+def combine_where(*clauses: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """AND together Chroma where clauses, skipping empty ones"""
+    clauses = [clause for clause in clauses if clause]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def _parse_time(value: str, name: str) -> float:
+    """Seconds since the epoch, or an ISO 8601 date/datetime in local time"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"{name} must be a Unix timestamp or an ISO 8601 date: {value!r}")
+
+
+def _parse_size(value: str, name: str) -> int:
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number of bytes: {value!r}")
+    if size < 0:
+        raise ValueError(f"{name} must not be negative")
+    return size
+
+
+def parse_filters(args: Mapping[str, Any]) -> SearchFilters:
+    """
+    Build filters from request arguments or a JSON object: `type` (comma
+    separated, repeated or a list), `dir`, `modified_after`,
+    `modified_before`, `min_size` and `max_size`. Raises ValueError on
+    invalid values.
+    """
+    if hasattr(args, 'getlist'):
+        raw_types = args.getlist('type')
+    else:
+        # JSON bodies may pass a list
+        raw_types = args.get('type') or []
+        if not isinstance(raw_types, (list, tuple)):
+            raw_types = [raw_types]
+    types = [t.strip().lower() for value in raw_types for t in str(value).split(',') if t.strip()]
+    unknown = set(types) - set(FILE_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown file types: {', '.join(sorted(unknown))}")
+
+    directory = args.get('dir')
+    if directory:
+        directory = os.path.join(os.path.expanduser(directory), '')
+
+    filters = SearchFilters(
+        types=tuple(sorted(set(types))) or None,
+        directory=directory or None,
+        modified_after=_parse_time(str(args['modified_after']), 'modified_after') if args.get('modified_after') else None,
+        modified_before=_parse_time(str(args['modified_before']), 'modified_before') if args.get('modified_before') else None,
+        min_size=_parse_size(str(args['min_size']), 'min_size') if args.get('min_size') not in (None, '') else None,
+        max_size=_parse_size(str(args['max_size']), 'max_size') if args.get('max_size') not in (None, '') else None
+    )
+    if filters.min_size is not None and filters.max_size is not None and filters.min_size > filters.max_size:
+        raise ValueError("min_size is larger than max_size")
+    return filters
+
+
+class ResultPages:
+    """
+    Ranked results of recent searches, so paging deeper extends a ranking
+    instead of recomputing it, and every page of one cursor comes from the
+    same ranking. Sessions expire after `ttl` seconds and the least recently
+    used are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._sessions: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> Tuple[str, int]:
+        """(session token, offset) encoded in a cursor"""
+        token, _, offset = cursor.rpartition(':')
+        if not token or not offset.isdigit():
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+        return token, int(offset)
+
+    @staticmethod
+    def make_cursor(token: str, offset: int) -> str:
+        return f"{token}:{offset}"
+
+    def session(self, key: Tuple, token: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        The session of a cursor token when it is still live and was opened
+        for the same search, otherwise a new session for `key`.
+
+        Returns:
+            Tuple[str, Dict[str, Any]]: Token and session, holding 'results'
+            ranked so far, how many were 'served' and whether the ranking is 'exhausted'
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token) if token else None
+            if session is not None and (session['expires'] < now or session['key'] != key):
+                session = None
+            if session is None:
+                token = secrets.token_urlsafe(9)
+                session = {'key': key, 'results': [], 'served': 0, 'exhausted': False, 'lock': threading.Lock()}
+                self._sessions[token] = session
+            session['expires'] = now + self.ttl
+            self._sessions.move_to_end(token)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+            return token, session
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
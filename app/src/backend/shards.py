@@ -0,0 +1,525 @@
+"""
+Sharded vector storage: an index's vectors split across several stores, each
+in its own directory, by root directory or by path hash.
+
+Shards can also be served by separate processes, locally (one worker per
+shard) or on other hosts. To serve a shard directory from another machine:
+
+    FILESEEKR_SHARD_KEY=secret python shards.py DIRECTORY --host 0.0.0.0 --port 7001 [--engine mmap]
+
+and give its entry in the index's shards.json an "address": ["host", 7001]. The
+indexer must run with the same FILESEEKR_SHARD_KEY. Connections are
+authenticated with the key but carry pickled data, so only expose a shard
+server on a network you trust.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import argparse, json, os, re, secrets, shutil, subprocess, sys, threading, zlib
+import numpy as np
+
+from vector_store import VECTOR_ENGINES, VectorStore, open_vector_store
+
+SHARDS_FILE = 'shards.json'
+SHARD_MODES = ('root', 'hash')
+
+# Root-mode shard for files under none of the roots
+DEFAULT_SHARD = 'default'
+
+# Calls a shard server answers
+_SHARD_METHODS = {'metadata', 'modify', 'count', 'get', 'upsert', 'add', 'delete', 'query'}
+
+# Records moved per call when a new root shard takes over files
+_MOVE_BATCH = 500
+
+
+def parse_shard_spec(spec: str) -> Tuple[str, int]:
+    """
+    (mode, shard count) of a spec: 'root' for one shard per indexed root,
+    or 'hash:N' for N shards by path hash.
+
+    Raises:
+        ValueError: Malformed spec
+    """
+    mode, _, count = spec.partition(':')
+    if mode == 'root' and not count:
+        return mode, 0
+    if mode == 'hash' and count.isdigit() and int(count) > 0:
+        return mode, int(count)
+    raise ValueError(f"Invalid shard spec {spec!r}; expected 'root' or 'hash:N'")
+
+
+def _path_clause(where: Optional[Dict[str, Any]]) -> Tuple[Optional[List[str]], Optional[Dict[str, Any]]]:
+    """
+    Paths a where clause is restricted to, and the clause without that
+    restriction. (None, where) when it doesn't name paths.
+    """
+    if not where:
+        return None, where
+    clauses = where['$and'] if list(where) == ['$and'] else [where]
+    for i, clause in enumerate(clauses):
+        if list(clause) != ['path']:
+            continue
+        condition = clause['path']
+        if isinstance(condition, str):
+            paths = [condition]
+        elif isinstance(condition, dict) and list(condition) == ['$eq']:
+            paths = [condition['$eq']]
+        elif isinstance(condition, dict) and list(condition) == ['$in']:
+            paths = list(condition['$in'])
+        else:
+            continue
+        rest = clauses[:i] + clauses[i + 1:]
+        return paths, (None if not rest else rest[0] if len(rest) == 1 else {'$and': rest})
+    return None, where
+
+
+def _with_paths(paths: List[str], where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    clause = {'path': {'$in': paths}}
+    return {'$and': [clause, where]} if where else clause
+
+
+class RemoteShard(VectorStore):
+    """Vector store served by a shard server in another process or on another host"""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        """
+        Args:
+            address (Tuple[str, int]): Host and port of the shard server
+            authkey (bytes): Shared secret of the server
+        """
+        self.address = tuple(address)
+        self.authkey = authkey
+        # One connection per calling thread, so concurrent searches don't queue on a socket
+        self._local = threading.local()
+        self._connections: List[Any] = []
+        self._lock = threading.Lock()
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = Client(self.address, authkey=self.authkey)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        connection.send((method, args, kwargs))
+        status, value = connection.recv()
+        if status == 'error':
+            raise RuntimeError(f"Shard at {self.address[0]}:{self.address[1]}: {value}")
+        return value
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self._call('metadata')
+
+    def modify(self, metadata: Dict[str, Any]):
+        self._call('modify', metadata)
+
+    def count(self) -> int:
+        return self._call('count')
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ('metadatas',)) -> Dict[str, Any]:
+        return self._call('get', ids=ids, where=where, include=list(include))
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+               documents: Optional[List[str]] = None):
+        self._call('upsert', ids=ids, embeddings=np.asarray(embeddings, dtype=np.float32),
+                   metadatas=metadatas, documents=documents)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        self._call('delete', ids=ids, where=where)
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ('metadatas', 'distances')) -> Dict[str, List[list]]:
+        return self._call('query', np.asarray(query_embeddings, dtype=np.float32), n_results,
+                          where=where, include=list(include))
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.close()
+                except OSError:
+                    pass
+            self._connections.clear()
+
+
+def _serve_connection(store: VectorStore, connection):
+    with connection:
+        while True:
+            try:
+                method, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                return
+            if method not in _SHARD_METHODS:
+                connection.send(('error', f"Unknown method {method!r}"))
+                continue
+            try:
+                # metadata is a property: its value is sent as is
+                value = getattr(store, method)
+                connection.send(('ok', value(*args, **kwargs) if callable(value) else value))
+            except Exception as e:
+                connection.send(('error', f"{type(e).__name__}: {e}"))
+
+
+def serve_shard(directory: str, engine: Optional[str], ivf_lists: int, nprobe: int,
+                address: Tuple[str, int], authkey: bytes,
+                ready: Optional[Callable[[Tuple[str, int]], None]] = None):
+    """
+    Serve the vector store in `directory` to RemoteShard clients, one thread
+    per connection, until the process is stopped.
+
+    Args:
+        ready: Called with the bound address once listening (for port 0)
+    """
+    store = open_vector_store(directory, engine, ivf_lists, nprobe)
+    listener = Listener(tuple(address), authkey=authkey)
+    if ready is not None:
+        ready(listener.address)
+    while True:
+        connection = listener.accept()
+        threading.Thread(target=_serve_connection, args=(store, connection), daemon=True).start()
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Vectors split across shard stores, each in its own directory under
+    `shards/`. Records go to the shard of their file's path: the shard of
+    the longest matching root (root mode, with a default shard for the
+    rest) or the path's CRC32 modulo the shard count (hash mode). All chunks
+    of a file land in the same shard.
+
+    Queries run on every shard in parallel and the per-shard top-k are merged
+    by distance; clauses naming paths only go to the shards owning them.
+    Shards are opened in this process, in one worker process each
+    (`workers`), or reached at the address in their config entry.
+    """
+
+    def __init__(self, directory: str, spec: Optional[str] = None, engine: Optional[str] = None,
+                 ivf_lists: int = 0, nprobe: int = 8, workers: bool = False):
+        """
+        Args:
+            directory (str): Index directory, holding shards.json and the shard directories
+            spec (Optional[str]): 'root' or 'hash:N' for a new index; must match an existing one
+            engine (Optional[str]): Vector engine of every shard
+            ivf_lists (int): IVF lists of mmap shards
+            nprobe (int): Lists mmap shards score per query
+            workers (bool): Serve each local shard from its own process
+        Raises:
+            ValueError: Bad spec, a spec different from the index's, or an unsharded index
+        """
+        self.directory = directory
+        self.engine = engine
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.workers = workers
+        self._config_path = os.path.join(directory, SHARDS_FILE)
+        self._lock = threading.RLock()
+        self._processes: Dict[str, Any] = {}
+        # Remote shards need the key their servers were started with; local workers get a fresh one
+        self._shared_key = os.environ.get('FILESEEKR_SHARD_KEY')
+        self._authkey = (self._shared_key or secrets.token_hex(16)).encode()
+
+        if os.path.exists(self._config_path):
+            with open(self._config_path, encoding='utf-8') as f:
+                self._config = json.load(f)
+            if spec is not None and parse_shard_spec(spec) != (self._config['mode'], self._config.get('count', 0)):
+                raise ValueError(f"Index at {directory} is sharded as {self.spec}, not {spec}")
+        else:
+            if os.path.exists(os.path.join(directory, 'chroma.sqlite3')) or os.path.exists(os.path.join(directory, 'vectors')):
+                raise ValueError(f"Index at {directory} isn't sharded; re-index into a new directory to shard it")
+            mode, count = parse_shard_spec(spec or 'root')
+            if mode == 'hash':
+                shards = [{'name': f'shard-{i}'} for i in range(count)]
+            else:
+                shards = [{'name': DEFAULT_SHARD, 'root': None}]
+            self._config = {'mode': mode, 'count': count, 'shards': shards, 'metadata': {}}
+            self._save()
+
+        self._shards: Dict[str, VectorStore] = {}
+        for entry in self._config['shards']:
+            self._shards[entry['name']] = self._open_shard(entry)
+        self._executor = ThreadPoolExecutor(max_workers=min(32, max(4, 2 * len(self._shards))),
+                                            thread_name_prefix='shard')
+
+    @property
+    def mode(self) -> str:
+        return self._config['mode']
+
+    @property
+    def spec(self) -> str:
+        return 'root' if self.mode == 'root' else f"hash:{self._config['count']}"
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self._config_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self._config, f, indent=2)
+        os.replace(temporary, self._config_path)
+
+    def _shard_directory(self, name: str) -> str:
+        return os.path.join(self.directory, 'shards', name)
+
+    def _open_shard(self, entry: Dict[str, Any]) -> VectorStore:
+        if entry.get('address'):
+            if not self._shared_key:
+                raise ValueError(
+                    f"Shard {entry['name']} is served at {entry['address'][0]}:{entry['address'][1]}; "
+                    f"set FILESEEKR_SHARD_KEY to the key its server was started with"
+                )
+            return RemoteShard(tuple(entry['address']), self._authkey)
+        directory = self._shard_directory(entry['name'])
+        os.makedirs(directory, exist_ok=True)
+        if not self.workers:
+            return open_vector_store(directory, self.engine, self.ivf_lists, self.nprobe)
+        # A local stand-in for a shard host: this module's server on a loopback port. Started
+        # as a script, since a multiprocessing child would re-run the server's main module
+        command = [sys.executable, os.path.abspath(__file__), directory, '--host', '127.0.0.1', '--port', '0',
+                   '--ivf-lists', str(self.ivf_lists), '--nprobe', str(self.nprobe)]
+        if self.engine:
+            command += ['--engine', self.engine]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True,
+                                   env={**os.environ, 'FILESEEKR_SHARD_KEY': self._authkey.decode()})
+        # The server's first line names the address it is listening on
+        line = process.stdout.readline().strip()
+        if not line:
+            process.wait()
+            raise RuntimeError(f"Worker for shard {entry['name']} exited with status {process.returncode}")
+        self._processes[entry['name']] = process
+        host, port = line.rsplit(' ', 1)[-1].rsplit(':', 1)
+        return RemoteShard((host, int(port)), self._authkey)
+
+    def shard_for(self, path: str) -> str:
+        """Name of the shard a file's records belong in"""
+        if self.mode == 'hash':
+            return f"shard-{zlib.crc32(path.encode('utf-8')) % self._config['count']}"
+        best, best_length = DEFAULT_SHARD, -1
+        for entry in self._config['shards']:
+            root = entry.get('root')
+            if root and path.startswith(root) and len(root) > best_length:
+                best, best_length = entry['name'], len(root)
+        return best
+
+    def shards(self) -> List[Dict[str, Any]]:
+        """Config entries of the shards: name, and root or address where set"""
+        with self._lock:
+            return [dict(entry) for entry in self._config['shards']]
+
+    def _map(self, calls: Dict[str, Tuple]) -> Dict[str, Any]:
+        """Run (method, args, kwargs) on several shards in parallel, by shard name"""
+        with self._lock:
+            stores = {name: self._shards[name] for name in calls}
+        futures = {
+            name: self._executor.submit(getattr(stores[name], method), *args, **kwargs)
+            for name, (method, args, kwargs) in calls.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+    def _targets(self, where: Optional[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Where clause to send to each shard: narrowed to the shard's own paths when it names paths"""
+        paths, rest = _path_clause(where)
+        with self._lock:
+            if paths is None:
+                return {name: where for name in self._shards}
+            by_shard: Dict[str, List[str]] = {}
+            for path in paths:
+                by_shard.setdefault(self.shard_for(path), []).append(path)
+        return {name: _with_paths(shard_paths, rest) for name, shard_paths in by_shard.items()}
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._config.get('metadata', {}))
+
+    def modify(self, metadata: Dict[str, Any]):
+        with self._lock:
+            self._config['metadata'] = metadata
+            self._save()
+
+    def count(self) -> int:
+        with self._lock:
+            names = list(self._shards)
+        return sum(self._map({name: ('count', (), {}) for name in names}).values())
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+               documents: Optional[List[str]] = None):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        by_shard: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, metadata in enumerate(metadatas):
+                by_shard.setdefault(self.shard_for(metadata['path']), []).append(i)
+        self._map({
+            name: ('upsert', (), {
+                'ids': [ids[i] for i in rows], 'embeddings': embeddings[rows],
+                'metadatas': [metadatas[i] for i in rows],
+                'documents': [documents[i] for i in rows] if documents else None
+            })
+            for name, rows in by_shard.items()
+        })
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        # IDs don't reliably give the path ('#' may be part of a file name), so they go everywhere
+        targets = self._targets(where) if ids is None else {name: where for name in self._shards}
+        self._map({name: ('delete', (), {'ids': ids, 'where': clause}) for name, clause in targets.items()})
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ('metadatas',)) -> Dict[str, Any]:
+        targets = self._targets(where) if ids is None else {name: where for name in self._shards}
+        parts = self._map({
+            name: ('get', (), {'ids': ids, 'where': clause, 'include': list(include)})
+            for name, clause in targets.items()
+        })
+        merged: Dict[str, Any] = {'ids': []}
+        for key in ('metadatas', 'documents', 'embeddings'):
+            if key in include:
+                merged[key] = []
+        for part in parts.values():
+            merged['ids'].extend(part['ids'])
+            for key in merged:
+                if key != 'ids':
+                    merged[key].extend(part[key] if part.get(key) is not None else [])
+        if 'embeddings' in merged:
+            merged['embeddings'] = np.asarray(merged['embeddings'], dtype=np.float32).reshape(len(merged['ids']), -1)
+        return merged
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ('metadatas', 'distances')) -> Dict[str, List[list]]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis]
+        include = list(dict.fromkeys([*include, 'distances']))
+        parts = list(self._map({
+            name: ('query', (queries, n_results), {'where': clause, 'include': include})
+            for name, clause in self._targets(where).items()
+        }).values())
+
+        keys = ['ids', *[key for key in include if key != 'distances'], 'distances']
+        merged: Dict[str, List[list]] = {key: [] for key in keys}
+        for i in range(len(queries)):
+            # Each shard's hits are sorted already; keep the overall closest n_results
+            hits = [(distance, shard, rank) for shard, part in enumerate(parts)
+                    for rank, distance in enumerate(part['distances'][i])]
+            hits.sort()
+            hits = hits[:n_results]
+            for key in keys:
+                merged[key].append([parts[shard][key][i][rank] for _, shard, rank in hits])
+        return merged
+
+    def add_shard(self, root: str, move: Optional[List[str]] = None) -> str:
+        """
+        Add a root shard (root mode). Records of the files in `move`, which
+        now belong to it, are copied over from their old shards.
+
+        Returns:
+            str: Name of the new shard
+        Raises:
+            ValueError: Hash-mode index, or the root already has a shard
+        """
+        if self.mode != 'root':
+            raise ValueError("Shards can only be added to an index sharded by root")
+        root = os.path.join(root, '')
+        with self._lock:
+            if any(entry.get('root') == root for entry in self._config['shards']):
+                raise ValueError(f"{root} already has a shard")
+            previous = {path: self.shard_for(path) for path in move or []}
+            base = re.sub(r'[^\w.-]', '_', os.path.basename(os.path.dirname(root))) or 'root'
+            name = f"{base}-{zlib.crc32(root.encode('utf-8')):08x}"
+            entry = {'name': name, 'root': root}
+            self._shards[name] = self._open_shard(entry)
+            self._config['shards'].append(entry)
+            self._save()
+
+        by_shard: Dict[str, List[str]] = {}
+        for path, shard in previous.items():
+            if shard != name:
+                by_shard.setdefault(shard, []).append(path)
+        for shard, paths in by_shard.items():
+            for i in range(0, len(paths), _MOVE_BATCH):
+                clause = {'path': {'$in': paths[i:i + _MOVE_BATCH]}}
+                stored = self._shards[shard].get(where=clause, include=['embeddings', 'metadatas', 'documents'])
+                if stored['ids']:
+                    self._shards[name].upsert(ids=stored['ids'], embeddings=stored['embeddings'],
+                                              metadatas=stored['metadatas'], documents=stored['documents'])
+                self._shards[shard].delete(where=clause)
+        return name
+
+    def _close_shard(self, name: str):
+        store = self._shards.pop(name)
+        store.close()
+        process = self._processes.pop(name, None)
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=5)
+
+    def drop_shard(self, name: str):
+        """
+        Remove a root shard and its directory (root mode). Its files fall back
+        to the shard of an enclosing root or the default shard; callers delete
+        or re-index them.
+
+        Raises:
+            ValueError: Hash-mode index, the default shard, or an unknown shard
+        """
+        if self.mode != 'root':
+            raise ValueError("Hash shards can't be dropped; every path hashes to one of them")
+        if name == DEFAULT_SHARD:
+            raise ValueError("The default shard can't be dropped")
+        with self._lock:
+            if name not in self._shards:
+                raise ValueError(f"Unknown shard: {name}")
+            entry = next(entry for entry in self._config['shards'] if entry['name'] == name)
+            self._close_shard(name)
+            self._config['shards'].remove(entry)
+            self._save()
+        if not entry.get('address'):
+            shutil.rmtree(self._shard_directory(name), ignore_errors=True)
+
+    def reset_shard(self, name: str):
+        """
+        Empty a local shard by deleting its directory and opening it afresh.
+
+        Raises:
+            ValueError: Unknown or remote shard
+        """
+        with self._lock:
+            entry = next((entry for entry in self._config['shards'] if entry['name'] == name), None)
+            if entry is None:
+                raise ValueError(f"Unknown shard: {name}")
+            if entry.get('address'):
+                raise ValueError(f"Shard {name} is remote; reset it on its host")
+            self._close_shard(name)
+            shutil.rmtree(self._shard_directory(name), ignore_errors=True)
+            self._shards[name] = self._open_shard(entry)
+
+    def close(self):
+        with self._lock:
+            for name in list(self._shards):
+                try:
+                    self._close_shard(name)
+                except Exception:
+                    pass
+        self._executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shard directory to remote indexers")
+    parser.add_argument('directory', help='Shard directory')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Interface to listen on; use 0.0.0.0 to serve other hosts on a trusted network')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--engine', choices=VECTOR_ENGINES)
+    parser.add_argument('--ivf-lists', type=int, default=0)
+    parser.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args()
+
+    key = os.environ.get('FILESEEKR_SHARD_KEY')
+    if not key:
+        parser.error("FILESEEKR_SHARD_KEY must be set to the secret shared with the indexer")
+    os.makedirs(args.directory, exist_ok=True)
+    serve_shard(args.directory, args.engine, args.ivf_lists, args.nprobe, (args.host, args.port), key.encode(),
+                ready=lambda address: print(f"Serving {args.directory} on {address[0]}:{address[1]}", flush=True))
+
+
+if __name__ == '__main__':
+    main()
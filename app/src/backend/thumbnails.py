@@ -0,0 +1,184 @@
+from PIL import Image
+from typing import Dict, Optional, Tuple
+import fitz, hashlib, io, logging, os, threading
+
+logger = logging.getLogger(__name__)
+
+IMAGE_THUMBNAIL_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+PDF_THUMBNAIL_EXTENSIONS = {'.pdf'}
+THUMBNAIL_EXTENSIONS = IMAGE_THUMBNAIL_EXTENSIONS | PDF_THUMBNAIL_EXTENSIONS
+
+
+def file_icon(file_path: str) -> str:
+    """Icon class the UI shows for files without a rendered thumbnail"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ['.txt', '.md']:
+        return "text-file-icon"
+    elif ext in ['.py', '.js', '.html', '.css']:
+        return "code-file-icon"
+    elif ext == '.pdf':
+        return "pdf-file-icon"
+    return "generic-file-icon"
+
+
+def has_thumbnail(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in THUMBNAIL_EXTENSIONS
+
+
+def render_thumbnail(file_path: str, max_size: Tuple[int, int] = (100, 100)) -> bytes:
+    """
+    Render a PNG thumbnail of an image or of the first page of a PDF.
+
+    Args:
+        file_path (str): Path to the file
+        max_size (Tuple[int, int]): Bounding box of the thumbnail
+    Returns:
+        bytes: PNG data
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in IMAGE_THUMBNAIL_EXTENSIONS:
+        with Image.open(file_path) as img:
+            img.draft('RGB', max_size)
+            img.thumbnail(max_size)
+            if img.mode not in ('RGB', 'RGBA', 'L', 'P'):
+                img = img.convert('RGB')
+            buffer = io.BytesIO()
+            img.save(buffer, format='PNG')
+            return buffer.getvalue()
+    elif ext in PDF_THUMBNAIL_EXTENSIONS:
+        with fitz.open(file_path) as doc:
+            if doc.page_count == 0:
+                raise ValueError("PDF has no pages")
+            pix = doc[0].get_pixmap(matrix=fitz.Matrix(0.5, 0.5))
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        img.thumbnail(max_size)
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+    raise ValueError(f"No thumbnail for file type: {ext}")
+
+
+class ThumbnailCache:
+    """
+    Rendered thumbnails stored as PNG files, keyed by path, mtime and size so
+    an edited file gets a fresh thumbnail. Once the cache grows past
+    `max_bytes`, the least recently used thumbnails are deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024,
+                 max_size: Tuple[int, int] = (100, 100)):
+        """
+        Args:
+            cache_dir (str): Directory holding the PNG files
+            max_bytes (int): Maximum total size of the cache
+            max_size (Tuple[int, int]): Bounding box of the thumbnails
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith('.png')
+        )
+
+    @staticmethod
+    def key(file_path: str, stat: os.stat_result) -> str:
+        return hashlib.sha1(f"{file_path}\0{stat.st_mtime_ns}\0{stat.st_size}".encode()).hexdigest()
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get_or_create(self, file_path: str, stat: Optional[os.stat_result] = None) -> Optional[str]:
+        """
+        Path of the cached thumbnail for a file, rendering it on a miss.
+
+        Returns:
+            Optional[str]: Path of the PNG file, or None if the file has no thumbnail
+        """
+        if not has_thumbnail(file_path):
+            return None
+        if stat is None:
+            stat = os.stat(file_path)
+        cache_path = self.lookup(file_path, stat)
+        if cache_path is None:
+            cache_path = self.put(file_path, stat, render_thumbnail(file_path, self.max_size))
+        return cache_path
+
+    def lookup(self, file_path: str, stat: os.stat_result) -> Optional[str]:
+        """
+        Path of the cached thumbnail for a file, or None on a miss. Rendering
+        can then happen elsewhere (a decode worker) with the result handed to
+        `put`, so this process alone tracks the size of the cache.
+        """
+        cache_path = self._cache_path(self.key(file_path, stat))
+        try:
+            # Bump the access time used for LRU eviction
+            os.utime(cache_path)
+            self.hits += 1
+            return cache_path
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+    def put(self, file_path: str, stat: os.stat_result, data: bytes) -> str:
+        """
+        Store a rendered thumbnail, evicting old ones if the cache is over budget.
+
+        Returns:
+            str: Path of the PNG file
+        """
+        cache_path = self._cache_path(self.key(file_path, stat))
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+
+        with self._lock:
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return cache_path
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'bytes': self._total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _evict(self):
+        """Delete least recently used thumbnails until the cache is at 90% of its budget"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except OSError:
+                    continue
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._total_bytes = total
+
+    def pregenerate(self, file_path: str):
+        """Render a thumbnail ahead of time, ignoring failures"""
+        try:
+            self.get_or_create(file_path)
+        except Exception as e:
+            logger.debug(f"Thumbnail pre-generation failed for {file_path}: {e}")
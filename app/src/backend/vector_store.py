@@ -0,0 +1,698 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import chromadb
+import json, os, sqlite3, threading
+import numpy as np
+
+# Engines that can hold an index's vectors
+VECTOR_ENGINES = ('chroma', 'mmap')
+
+COLLECTION_NAME = 'file_collection'
+
+# Rows scored per matmul in exact search; bounds the float32 copy of a block (64 MB at 1024-d)
+SEARCH_BLOCK_ROWS = 16384
+
+# k-means wants a few dozen points per cluster: an IVF index is trained once
+# there are this many rows per list, on a sample of this many rows per list
+IVF_MIN_ROWS_PER_LIST = 39
+IVF_SAMPLE_PER_LIST = 64
+IVF_ITERATIONS = 10
+
+# Metadata fields held as in-memory columns, so where clauses on them are vectorized
+_NUMERIC_COLUMNS = ('timestamp', 'size')
+
+_SQL_OPERATORS = {'$eq': '=', '$ne': '!=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+_NUMPY_OPERATORS = {
+    '$eq': np.equal, '$ne': np.not_equal, '$gt': np.greater,
+    '$gte': np.greater_equal, '$lt': np.less, '$lte': np.less_equal
+}
+
+
+def _as_matrix(embeddings: Any) -> np.ndarray:
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    return matrix[np.newaxis] if matrix.ndim == 1 else matrix
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) of every vector"""
+    centroid_sqnorms = np.einsum('ij,ij->i', centroids, centroids)
+    nearest = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        # ||v||^2 is the same for every centroid, so it doesn't change the argmin
+        nearest[start:start + len(block)] = np.argmin(centroid_sqnorms - 2 * block @ centroids.T, axis=1)
+    return nearest
+
+
+class VectorStore(ABC):
+    """
+    Storage and nearest-neighbour search of chunk vectors behind FileIndexer:
+    the part of Chroma's collection API the indexer uses. Records are
+    (id, embedding, metadata, document), embeddings go in as NumPy arrays,
+    `where` clauses use Chroma's syntax and distances are squared L2.
+    """
+
+    @property
+    @abstractmethod
+    def metadata(self) -> Dict[str, Any]:
+        """Index-level settings, such as the model the index was built with"""
+
+    @abstractmethod
+    def modify(self, metadata: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ('metadatas',)) -> Dict[str, Any]:
+        """Records by ID and/or where clause: 'ids' plus the included 'embeddings', 'metadatas' and 'documents'"""
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+               documents: Optional[List[str]] = None):
+        pass
+
+    def add(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+            documents: Optional[List[str]] = None):
+        self.upsert(ids, embeddings, metadatas, documents)
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        pass
+
+    @abstractmethod
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ('metadatas', 'distances')) -> Dict[str, List[list]]:
+        """Nearest records to each query, closest first: one list per query under each key"""
+
+    def close(self):
+        pass
+
+
+class ChromaStore(VectorStore):
+    """Chroma persistent collection, searched with its HNSW index"""
+
+    def __init__(self, persist_directory: str):
+        """
+        Args:
+            persist_directory (str): Directory of the Chroma database
+        """
+        self.client = chromadb.PersistentClient(
+            path=persist_directory,
+            settings=chromadb.Settings(
+                anonymized_telemetry=False,
+                allow_reset=True,
+                is_persistent=True
+            )
+        )
+        try:
+            self.collection = self.client.get_collection(COLLECTION_NAME)
+        except Exception:
+            self.collection = self.client.create_collection(COLLECTION_NAME)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.collection.metadata or {}
+
+    def modify(self, metadata: Dict[str, Any]):
+        self.collection.modify(metadata=metadata)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ('metadatas',)) -> Dict[str, Any]:
+        return self.collection.get(ids=ids, where=where, include=list(include))
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+               documents: Optional[List[str]] = None):
+        # Chroma only takes nested lists of Python floats
+        self.collection.upsert(ids=list(ids), embeddings=_as_matrix(embeddings).tolist(),
+                               metadatas=metadatas, documents=documents)
+
+    def add(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+            documents: Optional[List[str]] = None):
+        self.collection.add(ids=list(ids), embeddings=_as_matrix(embeddings).tolist(),
+                            metadatas=metadatas, documents=documents)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        self.collection.delete(ids=ids, where=where)
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ('metadatas', 'distances')) -> Dict[str, List[list]]:
+        return self.collection.query(query_embeddings=_as_matrix(query_embeddings).tolist(),
+                                     n_results=n_results, where=where, include=list(include))
+
+    def close(self):
+        self.client._system.close()
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Vectors as one append-only float16 matrix, memory-mapped from a file, with
+    record IDs and metadata in SQLite. Half the size of float32 and no
+    per-float Python objects: opening maps the file rather than loading it,
+    and the OS pages in only what searches touch.
+
+    Search is exact by default: blocks of rows are scored with one matmul
+    per block and the best picked with argpartition. With `ivf_lists`, rows
+    are clustered by k-means into an inverted file index once there are
+    enough of them, and a query only scores the rows of the `nprobe` lists
+    nearest to it.
+
+    Replaced and deleted records leave dead rows in the matrix; it is
+    compacted on open once they make up half of it.
+    """
+
+    def __init__(self, directory: str, ivf_lists: int = 0, nprobe: int = 8):
+        """
+        Args:
+            directory (str): Directory of the matrix and record database
+            ivf_lists (int): Number of k-means lists of the IVF index; 0 searches exhaustively
+            nprobe (int): Lists scored per query when the IVF index is in use
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'records.sqlite3'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # row is the record's row in the matrix; filterable fields get their own columns
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                path TEXT NOT NULL,
+                type TEXT,
+                timestamp REAL,
+                size REAL,
+                sqnorm REAL NOT NULL,
+                list INTEGER NOT NULL DEFAULT -1,
+                document TEXT,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        ''')
+        self._conn.commit()
+        self._settings = {key: json.loads(value) for key, value in self._conn.execute('SELECT key, value FROM settings')}
+        self._centroids: Optional[np.ndarray] = None
+        if os.path.exists(self._centroids_path):
+            self._centroids = np.load(self._centroids_path)
+
+        self._load()
+        if self._rows and self.count() * 2 < self._rows:
+            self.compact()
+        if self.ivf_lists and self._centroids is not None:
+            self._assign_unlisted()
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._settings.get('dim')
+
+    @property
+    def _vectors_path(self) -> str:
+        # Compaction writes a new file and switches to it in the transaction renumbering the rows
+        return os.path.join(self.directory, self._settings.get('vectors_file', 'vectors.f16'))
+
+    @property
+    def _centroids_path(self) -> str:
+        return os.path.join(self.directory, 'ivf_centroids.npy')
+
+    def _set(self, key: str, value: Any):
+        self._conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+        self._settings[key] = value
+
+    def _load(self):
+        """Map the matrix and read the record columns into memory"""
+        self._rows = 0
+        if self.dim and os.path.exists(self._vectors_path):
+            row_bytes = 2 * self.dim
+            size = os.path.getsize(self._vectors_path)
+            if size % row_bytes:
+                # A write cut short by a crash; its rows were never committed
+                os.truncate(self._vectors_path, size - size % row_bytes)
+            self._rows = size // row_bytes
+        self._remap()
+
+        capacity = max(self._rows, 1024)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._types = np.full(capacity, -1, dtype=np.int16)
+        self._columns = {name: np.full(capacity, np.nan) for name in _NUMERIC_COLUMNS}
+        self._sqnorms = np.zeros(capacity, dtype=np.float32)
+        self._lists = np.full(capacity, -1, dtype=np.int32)
+        self._type_codes: Dict[str, int] = {}
+        self._row_of_id: Dict[str, int] = {}
+        self._rows_of_path: Dict[str, List[int]] = {}
+        # Row -> (id, path) of live rows
+        self._keys: List[Optional[Tuple[str, str]]] = [None] * self._rows
+        self._posting_cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+        # Rows past the end of the file belong to an append that never finished
+        records = self._conn.execute(
+            'SELECT row, id, path, type, timestamp, size, sqnorm, list FROM records WHERE row < ?', (self._rows,)
+        ).fetchall()
+        if records:
+            self._store_columns(*zip(*records))
+
+    def _store_columns(self, rows, ids, paths, types, timestamps, sizes, sqnorms, lists):
+        rows = np.array(rows, dtype=np.int64)
+        self._live[rows] = True
+        self._types[rows] = [self._type_code(file_type) for file_type in types]
+        self._columns['timestamp'][rows] = np.array(timestamps, dtype=float)
+        self._columns['size'][rows] = np.array(sizes, dtype=float)
+        self._sqnorms[rows] = sqnorms
+        self._lists[rows] = lists
+        self._posting_cache = None
+        for row, record_id, path in zip(rows.tolist(), ids, paths):
+            self._row_of_id[record_id] = row
+            self._rows_of_path.setdefault(path, []).append(row)
+            self._keys[row] = (record_id, path)
+
+    def _type_code(self, file_type: Optional[str]) -> int:
+        if file_type is None:
+            return -1
+        return self._type_codes.setdefault(file_type, len(self._type_codes))
+
+    def _remap(self):
+        # A new map per append; searches holding the previous one keep a consistent view
+        if self._rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float16, mode='r', shape=(self._rows, self.dim))
+        else:
+            self._matrix = np.zeros((0, self.dim or 0), dtype=np.float16)
+
+    def _grow(self, rows: int):
+        """Make room in the columns for `rows` rows, doubling the capacity"""
+        self._keys.extend([None] * (rows - len(self._keys)))
+        capacity = len(self._live)
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2)
+
+        def grown(array: np.ndarray, fill) -> np.ndarray:
+            new = np.full(capacity, fill, dtype=array.dtype)
+            new[:len(array)] = array
+            return new
+
+        self._live = grown(self._live, False)
+        self._types = grown(self._types, -1)
+        self._columns = {name: grown(column, np.nan) for name, column in self._columns.items()}
+        self._sqnorms = grown(self._sqnorms, 0)
+        self._lists = grown(self._lists, -1)
+
+    def _delete_rows(self, rows: List[int]):
+        """Delete records by row; their vectors stay in the matrix as dead rows"""
+        for i in range(0, len(rows), 500):
+            batch = rows[i:i + 500]
+            self._conn.execute(f"DELETE FROM records WHERE row IN ({','.join('?' * len(batch))})", batch)
+        for row in rows:
+            record_id, path = self._keys[row]
+            self._keys[row] = None
+            self._live[row] = False
+            del self._row_of_id[record_id]
+            path_rows = self._rows_of_path[path]
+            path_rows.remove(row)
+            if not path_rows:
+                del self._rows_of_path[path]
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return dict(self._settings.get('metadata', {}))
+
+    def modify(self, metadata: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._set('metadata', metadata)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._row_of_id)
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+               documents: Optional[List[str]] = None):
+        """Append records, replacing those with the same IDs"""
+        ids = list(ids)
+        if not ids:
+            return
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate IDs in upsert")
+        vectors = _as_matrix(embeddings).astype(np.float16)
+        if len(vectors) != len(ids) or len(metadatas) != len(ids):
+            raise ValueError("ids, embeddings and metadatas must have the same length")
+        documents = documents or [None] * len(ids)
+        # Norms of the stored (rounded) vectors, so distances match what is searched
+        sqnorms = np.einsum('ij,ij->i', vectors.astype(np.float32), vectors.astype(np.float32))
+
+        with self._lock:
+            if self.dim is None:
+                with self._conn:
+                    self._set('dim', int(vectors.shape[1]))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} doesn't match the index ({self.dim})")
+            lists = (_nearest_centroids(vectors, self._centroids) if self._centroids is not None
+                     else np.full(len(ids), -1, dtype=np.int32))
+
+            # Vectors first: rows in the file that SQLite doesn't know are dead, never the other way around
+            first = self._rows
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            self._rows += len(ids)
+            self._grow(self._rows)
+            rows = list(range(first, first + len(ids)))
+            columns = (
+                rows, ids, [metadata['path'] for metadata in metadatas],
+                [metadata.get('type') for metadata in metadatas],
+                [metadata.get('timestamp') for metadata in metadatas],
+                [metadata.get('size') for metadata in metadatas],
+                sqnorms.tolist(), lists.tolist()
+            )
+            with self._conn:
+                self._delete_rows([self._row_of_id[record_id] for record_id in ids if record_id in self._row_of_id])
+                self._conn.executemany(
+                    '''INSERT INTO records (row, id, path, type, timestamp, size, sqnorm, list, document, metadata)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    zip(*columns, documents, (json.dumps(metadata) for metadata in metadatas))
+                )
+            self._store_columns(*columns)
+            self._remap()
+            train = (self.ivf_lists and self._centroids is None
+                     and len(self._row_of_id) >= self.ivf_lists * IVF_MIN_ROWS_PER_LIST)
+        if train:
+            self.build_ivf()
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock, self._conn:
+            self._delete_rows(self._select(ids, where).tolist())
+
+    def _select(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Live rows with the given IDs (in that order) and/or matching a where clause"""
+        mask = self._mask(where)
+        if ids is None:
+            return np.flatnonzero(mask)
+        rows = np.array([self._row_of_id.get(record_id, -1) for record_id in ids], dtype=np.int64)
+        rows = rows[rows >= 0]
+        return rows[mask[rows]]
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Live rows matching a where clause, as a new boolean array"""
+        live = self._live[:self._rows]
+        return live & self._where_mask(where) if where else live.copy()
+
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        masks = []
+        for key, condition in where.items():
+            if key in ('$and', '$or'):
+                parts = [self._where_mask(clause) for clause in condition]
+                masks.append(np.logical_and.reduce(parts) if key == '$and' else np.logical_or.reduce(parts))
+                continue
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for operator, value in condition.items():
+                masks.append(self._field_mask(key, operator, value))
+        return np.logical_and.reduce(masks) if masks else np.ones(self._rows, dtype=bool)
+
+    def _field_mask(self, field: str, operator: str, value: Any) -> np.ndarray:
+        if operator not in _SQL_OPERATORS and operator not in ('$in', '$nin'):
+            raise ValueError(f"Unsupported where operator: {operator}")
+        negate = operator in ('$ne', '$nin')
+        values = value if operator in ('$in', '$nin') else [value]
+
+        membership = operator in ('$eq', '$ne', '$in', '$nin')
+        if field == 'path' and membership:
+            mask = np.zeros(self._rows, dtype=bool)
+            for path in values:
+                mask[self._rows_of_path.get(path, [])] = True
+        elif field == 'type' and membership:
+            codes = [self._type_codes[file_type] for file_type in values if file_type in self._type_codes]
+            mask = np.isin(self._types[:self._rows], codes)
+        elif field in _NUMERIC_COLUMNS and membership:
+            mask = np.isin(self._columns[field][:self._rows], values)
+        elif field in _NUMERIC_COLUMNS:
+            column = self._columns[field][:self._rows]
+            # Missing values (NaN) never match, as in Chroma
+            with np.errstate(invalid='ignore'):
+                return _NUMPY_OPERATORS[operator](column, value) & ~np.isnan(column)
+        else:
+            # Any other field is read out of the stored metadata
+            if membership:
+                condition = f"IN ({','.join('?' * len(values))})"
+            else:
+                condition, values, negate = f"{_SQL_OPERATORS[operator]} ?", [value], False
+            mask = np.zeros(self._rows, dtype=bool)
+            mask[[row for row, in self._conn.execute(
+                f"SELECT row FROM records WHERE row < ? AND json_extract(metadata, ?) {condition}",
+                [self._rows, f'$."{field}"', *values]
+            )]] = True
+        return ~mask if negate else mask
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ('metadatas',)) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._select(ids, where)
+            matrix = self._matrix
+            result = self._records(rows.tolist(), include)
+        if 'embeddings' in include:
+            result['embeddings'] = np.asarray(matrix[rows], dtype=np.float32)
+        return result
+
+    def _records(self, rows: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        """IDs and the included metadatas/documents of rows, in order"""
+        result: Dict[str, Any] = {'ids': [self._keys[row][0] for row in rows]}
+        if 'metadatas' not in include and 'documents' not in include:
+            return result
+        stored = {}
+        for i in range(0, len(rows), 500):
+            batch = rows[i:i + 500]
+            stored.update((row, (document, metadata)) for row, document, metadata in self._conn.execute(
+                f"SELECT row, document, metadata FROM records WHERE row IN ({','.join('?' * len(batch))})", batch
+            ))
+        if 'metadatas' in include:
+            result['metadatas'] = [json.loads(stored[row][1]) for row in rows]
+        if 'documents' in include:
+            result['documents'] = [stored[row][0] for row in rows]
+        return result
+
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ('metadatas', 'distances')) -> Dict[str, List[list]]:
+        queries = _as_matrix(query_embeddings)
+        with self._lock:
+            mask = self._mask(where)
+            # Rows are immutable once written, so these stay valid after the lock is released
+            matrix, sqnorms, centroids = self._matrix, self._sqnorms[:self._rows], self._centroids
+            postings = self._postings() if centroids is not None and self.ivf_lists else None
+
+        candidates = np.flatnonzero(mask)
+        if postings is not None and len(candidates) > n_results:
+            hits = [self._probe(matrix, sqnorms, postings, centroids, query, n_results, mask) for query in queries]
+        else:
+            hits = self._exact_top(matrix, sqnorms, queries, n_results, candidates)
+
+        result: Dict[str, List[list]] = {'ids': [], 'distances': [], 'metadatas': [], 'documents': []}
+        with self._lock:
+            for rows, distances in hits:
+                # Rows deleted since the search started are dropped
+                rows_list = [row for row in rows.tolist() if self._keys[row] is not None]
+                keep = np.isin(rows, rows_list)
+                records = self._records(rows_list, include)
+                result['ids'].append(records['ids'])
+                result['distances'].append(distances[keep].tolist())
+                result['metadatas'].append(records.get('metadatas'))
+                result['documents'].append(records.get('documents'))
+        return {key: value for key, value in result.items() if key == 'ids' or key in include}
+
+    def _postings(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows grouped by IVF list, rebuilt after writes: (rows ordered by list,
+        offset of each list in that order). Rows without a list come first.
+        """
+        if self._posting_cache is None:
+            lists = self._lists[:self._rows]
+            order = np.argsort(lists, kind='stable')
+            offsets = np.searchsorted(lists[order], np.arange(-1, len(self._centroids) + 1))
+            self._posting_cache = (order, offsets)
+        return self._posting_cache
+
+    def _probe(self, matrix: np.ndarray, sqnorms: np.ndarray, postings: Tuple[np.ndarray, np.ndarray],
+               centroids: np.ndarray, query: np.ndarray, n_results: int,
+               mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Search only the rows of the lists nearest to a query, plus rows not yet assigned to a list"""
+        order, offsets = postings
+        centroid_distances = np.einsum('ij,ij->i', centroids, centroids) - 2 * centroids @ query
+        nprobe = min(self.nprobe, len(centroids))
+        probed = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        rows = np.concatenate([order[offsets[0]:offsets[1]]] +
+                              [order[offsets[lst + 1]:offsets[lst + 2]] for lst in probed])
+        rows = np.sort(rows[mask[rows]])
+        if len(rows) < n_results:
+            # The probed lists can't fill the request; fall back to an exhaustive search
+            rows = np.flatnonzero(mask)
+        return self._exact_top(matrix, sqnorms, query[np.newaxis], n_results, rows)[0]
+
+    @staticmethod
+    def _exact_top(matrix: np.ndarray, sqnorms: np.ndarray, queries: np.ndarray, k: int,
+                   candidates: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (rows, squared L2 distances) of the k nearest candidate rows (sorted)
+        to each query, closest first. Dense candidate sets are scanned in
+        contiguous blocks straight off the map; sparse ones gather their rows.
+        """
+        query_sqnorms = np.einsum('ij,ij->i', queries, queries)
+        best = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        if k <= 0 or not len(candidates):
+            return best
+        dense = len(candidates) * 4 > len(matrix)
+        if dense:
+            mask = np.zeros(len(matrix), dtype=bool)
+            mask[candidates] = True
+        blocks = range(0, len(matrix) if dense else len(candidates), SEARCH_BLOCK_ROWS)
+
+        for start in blocks:
+            if dense:
+                rows = np.arange(start, min(start + SEARCH_BLOCK_ROWS, len(mask)))
+                vectors = np.asarray(matrix[start:start + len(rows)], dtype=np.float32)
+                valid = mask[rows]
+            else:
+                rows = candidates[start:start + SEARCH_BLOCK_ROWS]
+                vectors = np.asarray(matrix[rows], dtype=np.float32)
+                valid = None
+            distances = sqnorms[rows][np.newaxis] + query_sqnorms[:, np.newaxis] - 2 * queries @ vectors.T
+            if valid is not None:
+                distances[:, ~valid] = np.inf
+
+            for i, (best_rows, best_distances) in enumerate(best):
+                merged_rows = np.concatenate([best_rows, rows])
+                merged = np.concatenate([best_distances, distances[i]])
+                if len(merged) > k:
+                    keep = np.argpartition(merged, k - 1)[:k]
+                    merged_rows, merged = merged_rows[keep], merged[keep]
+                best[i] = (merged_rows, merged)
+
+        top = []
+        for rows, distances in best:
+            order = np.argsort(distances, kind='stable')
+            order = order[np.isfinite(distances[order])]
+            top.append((rows[order], np.maximum(distances[order], 0)))
+        return top
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = IVF_ITERATIONS):
+        """
+        Train the IVF index: k-means over a sample of the live rows, then
+        every row is assigned to its nearest centroid. Rows written later
+        are assigned as they arrive.
+        """
+        n_lists = n_lists or self.ivf_lists
+        with self._lock:
+            live = np.flatnonzero(self._live[:self._rows])
+            matrix = self._matrix
+        n_lists = min(n_lists, len(live))
+        if n_lists <= 0:
+            return
+
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(len(live), n_lists * IVF_SAMPLE_PER_LIST), replace=False))
+        data = np.asarray(matrix[sample], dtype=np.float32)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = _nearest_centroids(data, centroids)
+            counts = np.bincount(nearest, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, data)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+            # Empty lists restart from random points
+            centroids[~filled] = data[rng.choice(len(data), int((~filled).sum()), replace=False)]
+        lists = _nearest_centroids(matrix, centroids)
+
+        with self._lock, self._conn:
+            np.save(self._centroids_path, centroids)
+            self._centroids = centroids
+            assigned = len(lists)
+            self._lists[:assigned] = np.where(self._live[:assigned], lists, -1)
+            self._posting_cache = None
+            self._conn.executemany('UPDATE records SET list = ? WHERE row = ?',
+                                   ((int(lists[row]), int(row)) for row in np.flatnonzero(self._live[:assigned])))
+        # Rows appended while training have no list yet
+        self._assign_unlisted()
+
+    def _assign_unlisted(self):
+        with self._lock, self._conn:
+            rows = np.flatnonzero(self._live[:self._rows] & (self._lists[:self._rows] < 0))
+            if not len(rows):
+                return
+            lists = _nearest_centroids(self._matrix[rows], self._centroids)
+            self._lists[rows] = lists
+            self._posting_cache = None
+            self._conn.executemany('UPDATE records SET list = ? WHERE row = ?',
+                                   zip(lists.tolist(), rows.tolist()))
+
+    def compact(self):
+        """
+        Rewrite the matrix without dead rows. The new file is switched to in
+        the same transaction that renumbers the rows, so a crash leaves
+        either the old or the new layout.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._live[:self._rows])
+            old_path = self._vectors_path
+            generation = self._settings.get('generation', 0) + 1
+            new_name = f'vectors.{generation}.f16'
+            with open(os.path.join(self.directory, new_name), 'wb') as f:
+                for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(self._matrix[live[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+            with self._conn:
+                # Ascending order: a live row only ever moves down into a slot already vacated
+                self._conn.executemany('UPDATE records SET row = ? WHERE row = ?',
+                                       ((new, int(old)) for new, old in enumerate(live) if new != old))
+                self._conn.execute('DELETE FROM records WHERE row >= ?', (len(live),))
+                self._set('generation', generation)
+                self._set('vectors_file', new_name)
+            self._matrix = None
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            self._load()
+
+    def close(self):
+        with self._lock:
+            self._matrix = None
+            self._conn.close()
+
+
+def open_vector_store(persist_directory: str, engine: Optional[str] = None,
+                      ivf_lists: int = 0, nprobe: int = 8) -> VectorStore:
+    """
+    Open the vector store of an index directory.
+
+    Args:
+        persist_directory (str): Index directory
+        engine (Optional[str]): One of VECTOR_ENGINES; defaults to the engine the index was built with,
+            or Chroma for a new index
+        ivf_lists (int): IVF lists of the mmap engine; 0 searches exhaustively
+        nprobe (int): Lists the mmap engine scores per query
+    Raises:
+        ValueError: Unknown engine, or the index was built with a different one
+    """
+    mmap_directory = os.path.join(persist_directory, 'vectors')
+    existing = None
+    if os.path.exists(os.path.join(mmap_directory, 'records.sqlite3')):
+        existing = 'mmap'
+    elif os.path.exists(os.path.join(persist_directory, 'chroma.sqlite3')):
+        existing = 'chroma'
+    engine = engine or existing or 'chroma'
+    if engine not in VECTOR_ENGINES:
+        raise ValueError(f"Unknown vector engine {engine!r}; expected one of {', '.join(VECTOR_ENGINES)}")
+    if existing is not None and engine != existing:
+        raise ValueError(
+            f"Index at {persist_directory} stores its vectors with {existing}, not {engine}; "
+            f"re-index into a new directory to change engines"
+        )
+    if engine == 'mmap':
+        return MmapVectorStore(mmap_directory, ivf_lists, nprobe)
+    return ChromaStore(persist_directory)
@@ -0,0 +1,329 @@
+from discovery import DEFAULT_IGNORE_PATTERNS, is_ignored
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import json, logging, os, queue, threading, time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+# Actions a path can be coalesced into
+UPSERT = 'upsert'
+DELETE = 'delete'
+SCAN_TREE = 'scan_tree'
+DELETE_TREE = 'delete_tree'
+
+
+class _WatchdogHandler(FileSystemEventHandler):
+    """Translate watchdog (inotify/FSEvents/...) events into watcher queue entries"""
+
+    def __init__(self, watcher: 'FileWatcher'):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        self.watcher.put(SCAN_TREE if event.is_directory else UPSERT, event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.put(UPSERT, event.src_path)
+
+    def on_deleted(self, event):
+        self.watcher.put(DELETE_TREE if event.is_directory else DELETE, event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self.watcher.put(DELETE_TREE, event.src_path)
+            self.watcher.put(SCAN_TREE, event.dest_path)
+        else:
+            self.watcher.put(DELETE, event.src_path)
+            self.watcher.put(UPSERT, event.dest_path)
+
+
+class _PollingSource:
+    """
+    Fallback event source that diffs periodic os.scandir snapshots of the roots.
+    Used when watchdog isn't installed or polling is requested explicitly.
+    """
+
+    def __init__(self, watcher: 'FileWatcher', interval: float):
+        self.watcher = watcher
+        self.interval = interval
+        self._snapshot: Dict[str, Tuple[float, int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _take_snapshot(self) -> Dict[str, Tuple[float, int, int]]:
+        snapshot = {}
+        roots, extensions = self.watcher.roots, self.watcher.extensions
+        for root in roots:
+            for path, stat in self.watcher.indexer.scan_files(root, extensions):
+                snapshot[path] = (stat.st_mtime, stat.st_size, stat.st_ino)
+        return snapshot
+
+    def poll(self):
+        """Compare the current state of the roots with the previous snapshot and emit events"""
+        current = self._take_snapshot()
+        previous = self._snapshot
+
+        for path, signature in current.items():
+            if previous.get(path) != signature:
+                self.watcher.put(UPSERT, path)
+        for path in previous.keys() - current.keys():
+            self.watcher.put(DELETE, path)
+
+        self._snapshot = current
+
+    def start(self):
+        self._snapshot = self._take_snapshot()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='watcher-poll', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Polling watcher error: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class FileWatcher:
+    """
+    Keep the index current by watching the configured roots.
+
+    Filesystem events are pushed onto a queue, coalesced per path and only
+    applied once a path has been quiet for `debounce` seconds, so a burst of
+    writes to one file results in a single re-embed. Ready events are applied
+    to the collection as batched upserts and deletes.
+    """
+
+    def __init__(self, indexer, debounce: float = 1.0, poll_interval: float = 2.0,
+                 use_polling: bool = False, max_batch: int = 256, state_path: Optional[str] = None,
+                 ignore_patterns: Iterable[str] = DEFAULT_IGNORE_PATTERNS):
+        """
+        Args:
+            indexer (FileIndexer): Indexer whose collection is kept in sync
+            debounce (float): Seconds a path must be quiet before it is applied
+            poll_interval (float): Seconds between snapshots in polling mode
+            use_polling (bool): Use the polling fallback even if watchdog is available
+            max_batch (int): Maximum number of paths applied in one batch
+            state_path (Optional[str]): JSON file the watched roots are saved to, so
+                `restore` can watch them again after a restart
+            ignore_patterns (Iterable[str]): fnmatch patterns of names whose events are
+                dropped, the same ones indexing skips
+        """
+        self.indexer = indexer
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling or Observer is None
+        self.max_batch = max_batch
+        self.state_path = state_path
+        self.ignore_patterns = tuple(ignore_patterns)
+
+        self.roots: List[str] = []
+        self.extensions: Set[str] = set()
+
+        self.events: 'queue.Queue[Tuple[str, str, float]]' = queue.Queue()
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._source = None
+        self._stop = threading.Event()
+        self._consumer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._consumer is not None
+
+    @property
+    def backlog(self) -> int:
+        """Events not yet applied: queued plus coalesced and waiting out the debounce"""
+        return self.events.qsize() + len(self._pending)
+
+    def put(self, action: str, path: str):
+        """Queue a filesystem event for the given path"""
+        path = os.fsdecode(path)
+        if action in (UPSERT, DELETE) and os.path.splitext(path)[1].lower() not in self.extensions:
+            return
+        if self.is_ignored(path):
+            return
+        self.events.put((action, path, time.monotonic()))
+
+    def is_ignored(self, path: str) -> bool:
+        """
+        Whether a path is skipped by indexing: some name below its watched root,
+        the path's own included, matches an ignore pattern. Covers files inside
+        .git or node_modules as well as new trees rooted at such a directory.
+        """
+        roots = [root for root in self.roots if path == root or path.startswith(os.path.join(root, ''))]
+        relative = os.path.relpath(path, max(roots, key=len)) if roots else path
+        return any(is_ignored(name, self.ignore_patterns) for name in Path(relative).parts if name not in ('.', os.sep))
+
+    def watch(self, roots: List[str], file_extensions: Optional[List[str]] = None):
+        """
+        Start watching the given roots, replacing any previously watched roots.
+
+        Args:
+            roots (List[str]): Directories to watch
+            file_extensions (Optional[List[str]]): Extensions to keep indexed
+        """
+        if file_extensions is None:
+            file_extensions = self.indexer.image_extensions | self.indexer.text_extensions | self.indexer.pdf_extensions
+
+        with self._lock:
+            self._stop_source()
+            self.roots = [
+                str(Path(os.path.join(root, '')).expanduser().resolve()) for root in roots
+            ]
+            self.roots = [root for root in self.roots if os.path.isdir(root)]
+            self.extensions = {ext.lower() for ext in file_extensions}
+
+            if self.roots:
+                self._start_source()
+            if self._consumer is None:
+                self._stop.clear()
+                self._consumer = threading.Thread(target=self._consume, name='watcher-apply', daemon=True)
+                self._consumer.start()
+
+        self._save_state(roots, file_extensions)
+        logger.info(f"Watching {len(self.roots)} roots ({'polling' if self.use_polling else 'native events'})")
+
+    def _save_state(self, roots: List[str], file_extensions):
+        if self.state_path is None:
+            return
+        # The roots as configured: one missing right now may be mounted by the next start
+        temporary = self.state_path + '.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump({'roots': list(roots), 'extensions': sorted(file_extensions)}, f, indent=2)
+            os.replace(temporary, self.state_path)
+        except OSError as e:
+            logger.error(f"Could not save watched roots to {self.state_path}: {e}")
+
+    def restore(self) -> bool:
+        """
+        Watch the roots saved by the last `watch` call, if any.
+
+        Returns:
+            bool: Whether saved roots were found
+        """
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return False
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read watched roots from {self.state_path}: {e}")
+            return False
+        if not state.get('roots'):
+            return False
+        self.watch(state['roots'], state.get('extensions'))
+        return True
+
+    def _start_source(self):
+        if self.use_polling:
+            self._source = _PollingSource(self, self.poll_interval)
+            self._source.start()
+        else:
+            self._source = Observer()
+            handler = _WatchdogHandler(self)
+            for root in self.roots:
+                self._source.schedule(handler, root, recursive=True)
+            self._source.start()
+
+    def _stop_source(self):
+        if self._source is None:
+            return
+        self._source.stop()
+        if not self.use_polling:
+            self._source.join()
+        self._source = None
+
+    def stop(self):
+        """Stop watching and apply whatever is still pending"""
+        with self._lock:
+            self._stop_source()
+            self._stop.set()
+            if self._consumer is not None:
+                self._consumer.join()
+                self._consumer = None
+
+    def _drain(self):
+        """Move queued events into the pending map, keeping the latest action per path"""
+        while True:
+            try:
+                action, path, timestamp = self.events.get_nowait()
+            except queue.Empty:
+                return
+            self._pending[path] = (action, timestamp)
+
+    def _take_ready(self, force: bool = False) -> List[Tuple[str, str]]:
+        """Pop pending paths that have been quiet for at least the debounce interval"""
+        now = time.monotonic()
+        ready = [
+            (path, action) for path, (action, timestamp) in self._pending.items()
+            if force or now - timestamp >= self.debounce
+        ]
+        if not force:
+            ready = ready[:self.max_batch]
+        for path, _ in ready:
+            del self._pending[path]
+        return ready
+
+    def _consume(self):
+        while not self._stop.is_set():
+            self._drain()
+            ready = self._take_ready()
+            if ready:
+                self.apply(ready)
+            else:
+                self._stop.wait(min(self.debounce, 0.25))
+
+        # Flush anything left on shutdown
+        self._drain()
+        ready = self._take_ready(force=True)
+        if ready:
+            self.apply(ready)
+
+    def apply(self, ready: List[Tuple[str, str]]):
+        """
+        Apply coalesced events to the collection as batched upserts and deletes.
+
+        Args:
+            ready (List[Tuple[str, str]]): (path, action) pairs
+        """
+        # Indexing jobs write under the same lock, so a batch never interleaves with one of theirs
+        with self.indexer.index_lock:
+            self._apply(ready)
+
+    def _apply(self, ready: List[Tuple[str, str]]):
+        upserts, deletes = [], []
+        for path, action in ready:
+            if action == UPSERT:
+                (upserts if os.path.isfile(path) else deletes).append(path)
+            elif action == DELETE:
+                deletes.append(path)
+            elif action == DELETE_TREE:
+                self.indexer.remove_path(os.path.join(path, ''))
+            elif action == SCAN_TREE:
+                upserts.extend(p for p, _ in self.indexer.scan_files(path, self.extensions))
+
+        try:
+            if deletes:
+                self.indexer.remove_files(deletes)
+            if upserts:
+                self.indexer.index_files(upserts)
+            logger.info(f"Watcher applied {len(upserts)} upserts and {len(deletes)} deletes")
+        except Exception as e:
+            logger.error(f"Watcher failed to apply events: {e}")
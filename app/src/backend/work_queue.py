@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, List, Optional, Set
+import os, sqlite3, threading, time
+
+# File states
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """
+    Durable record of which files are pending, indexed or failed, stored in
+    SQLite next to the Chroma data. Indexing enqueues every discovered file
+    before embedding anything, so after a crash the next run picks up exactly
+    the files that never made it into the collection. Failed files are retried
+    with exponential backoff until they run out of attempts.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3, backoff_base: float = 2.0):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+            max_attempts (int): Attempts before a file is left as permanently failed
+            backoff_base (float): Seconds before the first retry, doubled on every attempt
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_status ON files (status, next_attempt)')
+        self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM files LIMIT 1').fetchone() is None
+
+    def enqueue(self, paths: Iterable[str]):
+        """Mark files as pending, resetting their retry state"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                '''INSERT INTO files (path, status, attempts, next_attempt, error, updated_at)
+                   VALUES (?, ?, 0, 0, NULL, ?)
+                   ON CONFLICT(path) DO UPDATE SET
+                       status = excluded.status, attempts = 0, next_attempt = 0,
+                       error = NULL, updated_at = excluded.updated_at''',
+                ((path, PENDING, now) for path in paths)
+            )
+
+    def mark_done(self, paths: Iterable[str]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                '''INSERT INTO files (path, status, attempts, next_attempt, error, updated_at)
+                   VALUES (?, ?, 0, 0, NULL, ?)
+                   ON CONFLICT(path) DO UPDATE SET
+                       status = excluded.status, error = NULL, updated_at = excluded.updated_at''',
+                ((path, DONE, now) for path in paths)
+            )
+
+    def mark_failed(self, errors: Dict[str, str]):
+        """Record failures and schedule the next attempt with exponential backoff"""
+        now = time.time()
+        with self._lock, self._conn:
+            for path, error in errors.items():
+                row = self._conn.execute('SELECT attempts FROM files WHERE path = ?', (path,)).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                next_attempt = now + self.backoff_base * (2 ** (attempts - 1))
+                self._conn.execute(
+                    '''INSERT INTO files (path, status, attempts, next_attempt, error, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(path) DO UPDATE SET
+                           status = excluded.status, attempts = excluded.attempts,
+                           next_attempt = excluded.next_attempt, error = excluded.error,
+                           updated_at = excluded.updated_at''',
+                    (path, FAILED, attempts, next_attempt, error, now)
+                )
+
+    def remove(self, paths: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM files WHERE path = ?', ((path,) for path in paths))
+
+    def due(self, limit: Optional[int] = None) -> List[str]:
+        """Pending files plus failed files whose backoff has expired"""
+        query = '''SELECT path FROM files
+                   WHERE status = ? OR (status = ? AND attempts < ? AND next_attempt <= ?)
+                   ORDER BY rowid'''
+        params = [PENDING, FAILED, self.max_attempts, time.time()]
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def next_retry_in(self) -> Optional[float]:
+        """Seconds until the next failed file becomes due, or None if nothing is retryable"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT MIN(next_attempt) FROM files WHERE status = ? AND attempts < ?',
+                (FAILED, self.max_attempts)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def done_paths(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute('SELECT path FROM files WHERE status = ?', (DONE,))}
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM files GROUP BY status').fetchall()
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def failures(self, limit: int = 100) -> List[Dict[str, object]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, attempts, error FROM files WHERE status = ? ORDER BY updated_at DESC LIMIT ?',
+                (FAILED, limit)
+            ).fetchall()
+        return [{'path': path, 'attempts': attempts, 'error': error} for path, attempts, error in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
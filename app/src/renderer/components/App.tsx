@@ -5,6 +5,10 @@ import Settings from './Settings';  // Make sure the path is correct
 import '../styles/main.css';
 import axios from 'axios';
 
+// Images and PDFs get a thumbnail URL (or inline data); other files get an icon class name
+const isThumbnailUrl = (thumbnail?: string): boolean =>
+    !!thumbnail && (thumbnail.startsWith('data:') || thumbnail.startsWith('http'));
+
 interface SearchResult {
     similarity: number;
     filename: string;
@@ -106,8 +110,8 @@ const App: React.FC = () => {
                                         onClick={() => handleFileClick(result.path)}
                                         style={{ cursor: 'pointer' }}
                                     >
-                                        <div className={`result-thumbnail ${result.thumbnail?.startsWith('data:') ? '' : result.thumbnail || 'generic-file-icon'}`}>
-                                            {result.thumbnail?.startsWith('data:') && (
+                                        <div className={`result-thumbnail ${isThumbnailUrl(result.thumbnail) ? '' : result.thumbnail || 'generic-file-icon'}`}>
+                                            {isThumbnailUrl(result.thumbnail) && (
                                                 <img src={result.thumbnail} alt={result.filename} />
                                             )}
                                         </div>